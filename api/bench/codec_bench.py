@@ -0,0 +1,173 @@
+"""
+标注内容编码（db/AnnotationCodec.py）的存储和读取开销对比。
+
+在 api 目录下运行：
+    python -m bench.codec_bench --rows 20000 --output bench_codec.json
+
+流程：在临时 SQLite 数据库中写入模拟的标注数据（矩形框、多边形和 RLE 掩码），先以迁移前的 JSON 文本保存，
+统计标注内容的总大小、全量读取并解码的耗时和列表查询的耗时；然后执行迁移 6（encode_annotations）
+就地转换为编码格式，再统计一次。
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from bench.common import compare_results, environment, make_config, seed, summarize, write_results
+
+LABELS = ['person', 'car', 'bicycle', 'dog', 'cat', 'traffic light']
+
+
+def sample_annotation(rng, max_points):
+    """
+    生成一条模拟的标注内容。
+    :param rng: random.Random 实例
+    :param max_points: 多边形的最多顶点数
+    :return: 标注内容（列表或字典）
+    """
+    kind = rng.random()
+    if kind < 0.4:
+        return [{'label': rng.choice(LABELS),
+                 'bbox': [rng.randint(0, 1900), rng.randint(0, 1000), rng.randint(10, 400), rng.randint(10, 400)]}
+                for _ in range(rng.randint(1, 8))]
+    if kind < 0.8:
+        return [{'label': rng.choice(LABELS),
+                 'points': [[round(rng.uniform(0, 1920), 1), round(rng.uniform(0, 1080), 1)]
+                            for _ in range(rng.randint(8, max_points))]}
+                for _ in range(rng.randint(1, 4))]
+    counts = []
+    while sum(counts) < 1920 * 1080:
+        counts.append(rng.randint(1, 4000))
+    return {'annotations': [{'label': rng.choice(LABELS), 'mask': {'size': [1080, 1920], 'counts': counts}}]}
+
+
+def measure(db, annotation_manager, user_id, batch_size, prefix):
+    """
+    统计标注内容的总大小和读取耗时。
+    :param prefix: 结果名称的前缀（'text' 或 'encoded'）
+    :return: (标注内容总字节数, {名称: summarize() 的结果})
+    """
+    from db.AnnotationCodec import decode
+    from func.Export import DatasetExporter
+
+    payload_bytes = db.fetch_one("SELECT SUM(LENGTH(CAST(annotation AS BLOB))) AS size FROM annotations")['size']
+    results = {}
+
+    # 全量读取并解码：按 id 分批读取，每批计时一次
+    latencies = []
+    start = time.perf_counter()
+    rows = db.iter_records('annotations', columns=['annotation'], batch_size=batch_size, as_dict=False)
+    batch_start = time.perf_counter()
+    for index, (_, annotation) in enumerate(rows, 1):
+        decode(annotation)
+        if index % batch_size == 0:
+            latencies.append(time.perf_counter() - batch_start)
+            batch_start = time.perf_counter()
+    results[f'{prefix}: read_and_decode_batch'] = summarize(latencies, time.perf_counter() - start)
+
+    # JSONL 导出：已编码的 JSON 内容直接拼接到输出中，不经过解析
+    exporter = DatasetExporter(db, batch_size=batch_size)
+    latencies = []
+    start = time.perf_counter()
+    chunk_start = time.perf_counter()
+    for _ in exporter.export('jsonl', include_unlabeled=True):
+        latencies.append(time.perf_counter() - chunk_start)
+        chunk_start = time.perf_counter()
+    results[f'{prefix}: export_jsonl_chunk'] = summarize(latencies, time.perf_counter() - start)
+
+    # 列表查询：同一页分别不带和带标注内容
+    for include_annotation in (False, True):
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(50):
+            call_start = time.perf_counter()
+            annotation_manager.list_items(user_id, limit=100, include_annotation=include_annotation)
+            latencies.append(time.perf_counter() - call_start)
+        name = 'list_page_with_annotation' if include_annotation else 'list_page_without_annotation'
+        results[f'{prefix}: {name}'] = summarize(latencies, time.perf_counter() - start)
+    return payload_bytes, results
+
+
+def run_codec_benchmark(config_file, args):
+    """
+    写入迁移前格式的数据，分别在迁移前后统计。
+    :return: ({名称: summarize() 的结果}, 存储统计)
+    """
+    from db.AnnotationCodec import dumps
+    from db.DBHelper import DBHelper
+    from db.SQLiteBackend import SQLiteConnection
+    from db.migrate import SQLiteMigrationContext, _encode_annotations
+    from func.Annotation import Annotation
+
+    db = DBHelper(config_file)
+    try:
+        rng = random.Random(args.seed)
+        ids = [row['id'] for row in db.fetch_all("SELECT id FROM annotations ORDER BY id")]
+        print(f"正在写入 {len(ids)} 条迁移前格式（JSON 文本）的标注内容")
+        db.update_many('annotations', ({'id': annotation_id, 'annotation': dumps(sample_annotation(rng, args.points))}
+                                       for annotation_id in ids))
+        annotation_manager = Annotation(db, max_claim=100)
+        user_id = db.fetch_one("SELECT user_id FROM task ORDER BY id LIMIT 1")['user_id']
+
+        text_bytes, benchmarks = measure(db, annotation_manager, user_id, args.batch, 'text')
+
+        print("正在执行迁移 encode_annotations")
+        connection = SQLiteConnection(db.sqlite_path)
+        try:
+            _encode_annotations(SQLiteMigrationContext(connection, None))
+        finally:
+            connection.close()
+        encoded_bytes, encoded = measure(db, annotation_manager, user_id, args.batch, 'encoded')
+        benchmarks.update(encoded)
+    finally:
+        db.disconnect()
+
+    storage = {
+        'text_bytes': text_bytes,
+        'encoded_bytes': encoded_bytes,
+        'ratio': round(encoded_bytes / text_bytes, 3) if text_bytes else None,
+    }
+    print(f"标注内容: {text_bytes} 字节 -> {encoded_bytes} 字节（{storage['ratio']}）")
+    return benchmarks, storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标注内容编码的存储和读取开销对比")
+    parser.add_argument('--rows', type=int, default=20000, help="标注数据条数")
+    parser.add_argument('--points', type=int, default=200, help="多边形的最多顶点数")
+    parser.add_argument('--batch', type=int, default=500, help="全量读取时每批的行数")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子")
+    parser.add_argument('--workdir', default=None, help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument('--output', default='bench_codec.json', help="结果文件，'-' 表示输出到标准输出")
+    parser.add_argument('--baseline', default=None, help="用于比较的基准结果文件")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="允许的相对变化（默认 10%%）")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='annotation-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        config_file = make_config(workdir)
+        per_task = 1000
+        seed(config_file, max(1, args.rows // per_task), min(per_task, args.rows))
+        benchmarks, storage = run_codec_benchmark(config_file, args)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'environment': environment(),
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('workdir', 'output', 'baseline', 'tolerance')},
+        'storage': storage,
+        'benchmarks': benchmarks,
+    }
+    write_results(results, args.output)
+    if args.baseline and compare_results(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from db.DBHelper import DBHelper
+from db.create_database import create_database_and_tables
+from func.PasswordHasher import PasswordHasher
+
+# 压测用户的统一密码
+BENCH_PASSWORD = 'bench-password'
+
+
+def make_config(workdir, bcrypt_rounds=4, base_config='db/DBConfig.json'):
+    """
+    在工作目录中生成压测配置：使用 SQLite 数据库和独立的 JWT 密钥文件，不影响正式环境。
+    :param workdir: 工作目录
+    :param bcrypt_rounds: 压测使用的 bcrypt 成本因子
+    :param base_config: 作为模板的配置文件
+    :return: 生成的配置文件路径
+    """
+    with open(base_config, 'r') as file:
+        config = json.load(file)
+    config['database']['type'] = 'sqlite'
+    config['database'].setdefault('sqlite', {})['path'] = 'bench.sqlite3'
+    config.setdefault('password_hashing', {})['bcrypt_rounds'] = bcrypt_rounds
+    config.setdefault('jwt', {})['key_file'] = os.path.join(workdir, 'jwt_keys.json')
+    config.setdefault('logging', {}).update({'level': 'WARNING', 'file': None})
+
+    config_file = os.path.join(workdir, 'DBConfig.json')
+    with open(config_file, 'w') as file:
+        json.dump(config, file, ensure_ascii=False, indent=4)
+    return config_file
+
+
+def seed(config_file, users, annotations_per_user, bcrypt_rounds=4):
+    """
+    建表并写入压测数据：users 个用户，每个用户一个任务，每个任务 annotations_per_user 条未标注数据。
+    已存在的压测数据会被清空，每次压测从相同的初始状态开始。
+    :param config_file: 配置文件路径
+    :param users: 用户数
+    :param annotations_per_user: 每个任务的标注数据条数
+    :param bcrypt_rounds: 密码哈希的成本因子
+    :return: 用户名列表
+    """
+    create_database_and_tables(config_file)
+    db = DBHelper(config_file)
+    try:
+        with db.transaction():
+            db.execute_query("DELETE FROM annotations")
+            db.execute_query("DELETE FROM task")
+            db.execute_query("DELETE FROM users WHERE username LIKE 'bench_%'")
+
+        # 所有用户共用同一个哈希，避免播种时间被 bcrypt 主导
+        password = PasswordHasher(rounds=bcrypt_rounds).hash(BENCH_PASSWORD).decode('utf-8')
+        usernames = [f"bench_{index}" for index in range(users)]
+        db.insert_many('users', ({'username': username, 'password': password} for username in usernames))
+
+        user_ids = [row['id'] for row in db.fetch_all(
+            "SELECT id FROM users WHERE username LIKE 'bench_%' ORDER BY id")]
+        db.insert_many('task', ({'user_id': user_id, 'target': annotations_per_user, 'completed': 0}
+                                for user_id in user_ids))
+
+        task_ids = [row['id'] for row in db.fetch_all("SELECT id FROM task ORDER BY id")]
+        db.insert_many('annotations', (
+            {'task_id': task_id, 'image_name': f"{task_id}_{index:06d}.jpg", 'annotation': ''}
+            for task_id in task_ids for index in range(annotations_per_user)
+        ))
+    finally:
+        db.disconnect()
+    return usernames
+
+
+def percentile(sorted_values, fraction):
+    """
+    最近秩法计算分位数。
+    :param sorted_values: 升序排列的数值
+    :param fraction: 分位（0-1）
+    :return: 分位数，列表为空时返回 None
+    """
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=None):
+    """
+    汇总一组请求或调用的耗时。
+    :param latencies: 每次成功调用的耗时（秒）
+    :param elapsed: 整组的墙钟时间（秒）
+    :param errors: 失败次数，按状态码或异常类型分类（字典形式）
+    :return: 统计结果（字典形式），耗时单位为毫秒
+    """
+    values = sorted(latencies)
+    errors = errors or {}
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'count': len(values),
+        'errors': sum(errors.values()),
+        'error_kinds': errors,
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        'mean_ms': ms(statistics.fmean(values) if values else None),
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(values[-1] if values else None),
+    }
+
+
+def environment():
+    """
+    记录运行环境，便于比较不同机器或版本的结果。
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_results(results, output):
+    """
+    把结果写入 JSON 文件；output 为 '-' 时输出到标准输出。
+    """
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if output == '-':
+        print(text)
+        return
+    with open(output, 'w', encoding='utf-8') as file:
+        file.write(text + '\n')
+    print(f"结果已写入 {output}")
+
+
+def compare_results(current, baseline_file, tolerance):
+    """
+    与基准结果比较：p95 延迟上升或吞吐量下降超过 tolerance 视为回归。
+    :param current: 本次结果，results['benchmarks'] 为 {名称: summarize() 的结果}
+    :param baseline_file: 基准结果 JSON 文件
+    :param tolerance: 允许的相对变化，例如 0.1 表示 10%
+    :return: 回归项列表（字符串），为空表示没有回归
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    regressions = []
+    for name, result in current['benchmarks'].items():
+        before = baseline.get('benchmarks', {}).get(name)
+        if not before:
+            continue
+        if before.get('p95_ms') and result.get('p95_ms') and \
+                result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {result['p95_ms']} ms")
+        if before.get('throughput') and result['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐量 {before['throughput']}/s -> {result['throughput']}/s")
+    for line in regressions:
+        print(f"性能回归 {line}")
+    return regressions
@@ -0,0 +1,254 @@
+"""
+认证和标注接口的压测。
+
+在 api 目录下运行：
+    python -m bench.load_test --users 50 --concurrency 16 --output bench_load.json
+
+流程：生成使用 SQLite 的临时配置并写入压测数据（见 bench/common.py），以子进程启动 uvicorn，
+然后按指定并发依次压测 /login、/dashboard 和 /annotations/claim + /annotations/submit，
+输出各接口的吞吐量和 p50/p95/p99 延迟。指定 --baseline 时与之前的结果比较，有回归时返回码为 1。
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.common import BENCH_PASSWORD, compare_results, environment, make_config, seed, summarize, write_results
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Client:
+    def __init__(self, host, port, timeout=30):
+        """
+        简单的 HTTP 客户端，每个线程复用一个 keep-alive 连接。
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        """
+        发送请求并计时。
+        :return: (状态码, 响应体, 耗时秒数)
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # 连接出错后下次重新建立
+            connection.close()
+            self._local.connection = None
+            raise
+        return response.status, data, time.perf_counter() - start
+
+
+class Recorder:
+    def __init__(self):
+        """
+        按接口收集一个阶段内的耗时和错误。
+        """
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def ok(self, endpoint, elapsed):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+
+    def error(self, endpoint, kind):
+        with self._lock:
+            errors = self.errors.setdefault(endpoint, {})
+            errors[str(kind)] = errors.get(str(kind), 0) + 1
+
+    def call(self, client, endpoint, method, path, body=None, token=None):
+        """
+        发送请求并记录结果。
+        :return: 成功时返回解析后的 JSON，失败时返回 None
+        """
+        try:
+            status_code, data, elapsed = client.request(method, path, body, token)
+        except (OSError, http.client.HTTPException) as e:
+            self.error(endpoint, type(e).__name__)
+            return None
+        if not 200 <= status_code < 300:
+            self.error(endpoint, status_code)
+            return None
+        self.ok(endpoint, elapsed)
+        return json.loads(data)
+
+
+def run_phase(tasks, concurrency):
+    """
+    以指定并发执行一组任务，每个任务的参数为 Recorder。
+    :return: {接口: summarize() 的结果}
+    """
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(task, recorder) for task in tasks]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    endpoints = set(recorder.latencies) | set(recorder.errors)
+    return {
+        endpoint: summarize(recorder.latencies.get(endpoint, []), elapsed, recorder.errors.get(endpoint))
+        for endpoint in sorted(endpoints)
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(config_file, port, workers):
+    """
+    以子进程启动 uvicorn，等待服务可用。
+    :return: 子进程对象
+    """
+    env = dict(os.environ, ANNOTATION_CONFIG=config_file)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        cwd=API_DIR, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败，返回码 {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/metrics')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待服务启动超时")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_load_test(client, usernames, args):
+    """
+    依次执行登录、仪表盘和标注三个阶段。
+    :return: {接口: 统计结果}
+    """
+    results = {}
+    tokens = {}
+
+    # 1. 登录：每个用户登录一次（同一用户在线时不能重复登录）
+    def login(username):
+        def task(recorder):
+            body = recorder.call(client, 'POST /login', 'POST', '/login',
+                                 {'username': username, 'password': BENCH_PASSWORD})
+            if body:
+                tokens[username] = body['access_token']
+        return task
+
+    print(f"压测 /login: {len(usernames)} 个用户")
+    results.update(run_phase([login(username) for username in usernames], args.concurrency))
+    token_list = list(tokens.values())
+    if not token_list:
+        raise RuntimeError("没有用户登录成功，无法继续压测")
+
+    # 2. 仪表盘：Token 验证 + 任务进度查询
+    def dashboard(token):
+        def task(recorder):
+            recorder.call(client, 'GET /dashboard', 'GET', '/dashboard', token=token)
+        return task
+
+    print(f"压测 /dashboard: {args.requests} 次请求")
+    results.update(run_phase([dashboard(token_list[index % len(token_list)]) for index in range(args.requests)],
+                             args.concurrency))
+
+    # 3. 标注：每个用户循环领取一批数据并提交结果
+    def annotate(token):
+        def task(recorder):
+            for _ in range(args.rounds):
+                claimed = recorder.call(client, 'POST /annotations/claim', 'POST', '/annotations/claim',
+                                        {'count': args.batch}, token)
+                if not claimed or not claimed['items']:
+                    return
+                recorder.call(client, 'POST /annotations/submit', 'POST', '/annotations/submit', {
+                    'task_id': claimed['task_id'],
+                    'results': [{'id': item['id'], 'annotation': {'label': 'bench'}} for item in claimed['items']],
+                }, token)
+        return task
+
+    print(f"压测 /annotations/claim + submit: {len(token_list)} 个用户 x {args.rounds} 轮")
+    results.update(run_phase([annotate(token) for token in token_list], args.concurrency))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="认证和标注接口压测")
+    parser.add_argument('--users', type=int, default=50, help="用户数（每个用户一个任务）")
+    parser.add_argument('--annotations-per-user', type=int, default=200, help="每个任务的标注数据条数")
+    parser.add_argument('--concurrency', type=int, default=16, help="并发请求数")
+    parser.add_argument('--requests', type=int, default=2000, help="/dashboard 请求总数")
+    parser.add_argument('--rounds', type=int, default=5, help="每个用户领取并提交的轮数")
+    parser.add_argument('--batch', type=int, default=10, help="每次领取的条数")
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help="压测使用的 bcrypt 成本因子")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn worker 进程数")
+    parser.add_argument('--workdir', default=None, help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument('--output', default='bench_load.json', help="结果文件，'-' 表示输出到标准输出")
+    parser.add_argument('--baseline', default=None, help="用于比较的基准结果文件")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="允许的相对变化（默认 10%%）")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='annotation-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        config_file = make_config(workdir, args.bcrypt_rounds)
+        print(f"正在写入压测数据: {args.users} 个用户，每个任务 {args.annotations_per_user} 条数据")
+        usernames = seed(config_file, args.users, args.annotations_per_user, args.bcrypt_rounds)
+
+        port = free_port()
+        process = start_server(config_file, port, args.workers)
+        try:
+            benchmarks = run_load_test(Client('127.0.0.1', port), usernames, args)
+        finally:
+            stop_server(process)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'environment': environment(),
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('workdir', 'output', 'baseline', 'tolerance')},
+        'benchmarks': benchmarks,
+    }
+    write_results(results, args.output)
+    if args.baseline and compare_results(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+热点函数的微基准测试：DBHelper.get_records、User._check_password、create_access_token 和 verify_token。
+
+在 api 目录下运行：
+    python -m bench.micro_bench --output bench_micro.json
+
+使用 SQLite 的临时配置和压测数据（见 bench/common.py），在当前进程中导入 main 直接调用函数，
+不经过 HTTP。密码验证默认使用配置文件中的 bcrypt 成本因子，反映生产环境的实际开销。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from bench.common import BENCH_PASSWORD, compare_results, environment, make_config, seed, summarize, write_results
+
+
+def bench(func, iterations, warmup=10):
+    """
+    重复调用 func 并统计每次调用的耗时。
+    :param func: 无参数的函数
+    :param iterations: 计时的调用次数
+    :param warmup: 预热次数（不计时）
+    :return: summarize() 的结果
+    """
+    for _ in range(warmup):
+        func()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_micro_benchmarks(usernames, args):
+    """
+    执行各项微基准测试。main 在 ANNOTATION_CONFIG 设置后才能导入。
+    :return: {名称: 统计结果}
+    """
+    import main
+
+    results = {}
+    db = main.db_helper
+    rng = random.Random(0)
+
+    print("DBHelper.get_records")
+    results['DBHelper.get_records(users by username)'] = bench(
+        lambda: db.get_records('users', {'username': rng.choice(usernames)}), args.iterations)
+    task_ids = [row['id'] for row in db.fetch_all("SELECT id FROM task")]
+    results['DBHelper.get_records(annotations by task_id, status)'] = bench(
+        lambda: db.get_records('annotations', {'task_id': rng.choice(task_ids), 'status': '未标注'},
+                               columns=['id', 'image_name']),
+        max(1, args.iterations // 10))
+
+    print(f"User._check_password (bcrypt 成本因子 {main.password_hasher.rounds})")
+    hashed_password = db.get_records('users', {'username': usernames[0]}, columns=['password'])[0]['password']
+    results['User._check_password'] = bench(
+        lambda: main.user_manager._check_password(BENCH_PASSWORD, hashed_password), args.hash_iterations, warmup=1)
+
+    print("create_access_token / verify_token")
+    session_token = main.user_manager.login(usernames[0], BENCH_PASSWORD)
+    claims = {'sub': usernames[0], 'session_token': session_token}
+    expires = timedelta(minutes=main.ACCESS_TOKEN_EXPIRE_MINUTES)
+    results['create_access_token'] = bench(lambda: main.create_access_token(claims, expires), args.iterations)
+
+    token = main.create_access_token(claims, expires)
+    loop = asyncio.new_event_loop()
+    try:
+        results['verify_token'] = bench(lambda: loop.run_until_complete(main.verify_token(token)), args.iterations)
+    finally:
+        loop.close()
+        main.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点函数微基准测试")
+    parser.add_argument('--users', type=int, default=1000, help="压测用户数")
+    parser.add_argument('--annotations-per-user', type=int, default=100, help="每个任务的标注数据条数")
+    parser.add_argument('--iterations', type=int, default=5000, help="每项测试的调用次数")
+    parser.add_argument('--hash-iterations', type=int, default=20, help="密码验证的调用次数")
+    parser.add_argument('--bcrypt-rounds', type=int, default=None,
+                        help="bcrypt 成本因子，默认使用 db/DBConfig.json 中的配置")
+    parser.add_argument('--workdir', default=None, help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument('--output', default='bench_micro.json', help="结果文件，'-' 表示输出到标准输出")
+    parser.add_argument('--baseline', default=None, help="用于比较的基准结果文件")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="允许的相对变化（默认 10%%）")
+    args = parser.parse_args()
+
+    if args.bcrypt_rounds is None:
+        # 不能在这里导入 func.Settings：它在导入时读取 ANNOTATION_CONFIG，必须等临时配置生成后再导入
+        with open('db/DBConfig.json', 'r') as file:
+            args.bcrypt_rounds = json.load(file).get('password_hashing', {}).get('bcrypt_rounds', 12)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='annotation-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        config_file = make_config(workdir, args.bcrypt_rounds)
+        print(f"正在写入压测数据: {args.users} 个用户，每个任务 {args.annotations_per_user} 条数据")
+        usernames = seed(config_file, args.users, args.annotations_per_user, args.bcrypt_rounds)
+        os.environ['ANNOTATION_CONFIG'] = config_file
+        benchmarks = run_micro_benchmarks(usernames, args)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'environment': environment(),
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('workdir', 'output', 'baseline', 'tolerance')},
+        'benchmarks': benchmarks,
+    }
+    write_results(results, args.output)
+    if args.baseline and compare_results(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+annotations.annotation 的存储编码。
+
+编码格式：1 字节版本号 + 1 字节标志位 + 内容。标志位 FLAG_JSON 表示内容是合法的 JSON 文本，
+FLAG_COMPRESSED 表示内容经过 zlib 压缩（只有压缩后更小时才压缩）。空标注存为空字节串。
+迁移前写入的 TEXT（未编码的 UTF-8 文本）仍可读取：合法的 JSON 文本和普通文本都不会以版本号字节开头。
+"""
+import json
+import zlib
+
+VERSION = 1
+FLAG_COMPRESSED = 0x01
+FLAG_JSON = 0x02
+
+# 小于该长度（字节）的内容不压缩，压缩头的开销比节省的还多
+COMPRESS_THRESHOLD = 64
+COMPRESS_LEVEL = 6
+
+
+def dumps(value):
+    """
+    以紧凑格式序列化标注内容（与 Annotation.submit 之前写入的格式一致）。
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def is_encoded(data):
+    """
+    判断存储的值是否已经是编码后的格式。
+    :param data: 数据库中读出的值
+    :return: 已编码或为空时返回 True
+    """
+    if not data:
+        return True
+    return isinstance(data, (bytes, bytearray)) and data[0] == VERSION
+
+
+def encode(text, is_json=None):
+    """
+    编码标注文本。
+    :param text: 标注文本（通常为 JSON，也可能是客户端提交的普通字符串）
+    :param is_json: text 是否为合法的 JSON，为 None 时解析一次来判断
+    :return: 编码后的字节串
+    """
+    if not text:
+        return b''
+    if is_json is None:
+        try:
+            json.loads(text)
+            is_json = True
+        except ValueError:
+            is_json = False
+    data = text.encode('utf-8')
+    flags = FLAG_JSON if is_json else 0
+    if len(data) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+        if len(compressed) < len(data):
+            data = compressed
+            flags |= FLAG_COMPRESSED
+    return bytes((VERSION, flags)) + data
+
+
+def encode_value(value):
+    """
+    编码标注内容：字符串按原样保存，其他值序列化为 JSON。
+    :param value: 标注内容
+    :return: 编码后的字节串
+    """
+    if isinstance(value, str):
+        return encode(value)
+    return encode(dumps(value), is_json=True)
+
+
+def _unpack(data):
+    """
+    解出标注文本。
+    :return: (文本, 是否确定为 JSON)，未编码的旧数据返回 (文本, None)
+    """
+    if not data:
+        return '', False
+    if isinstance(data, str):
+        return data, None
+    data = bytes(data)
+    if data[0] != VERSION:
+        return data.decode('utf-8'), None
+    flags = data[1]
+    body = data[2:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    return body.decode('utf-8'), bool(flags & FLAG_JSON)
+
+
+def decode_text(data):
+    """
+    解码为标注文本（即提交时的 JSON 或字符串）。
+    :param data: 数据库中读出的值（编码后的字节串，或旧的 TEXT 值）
+    :return: 文本
+    """
+    return _unpack(data)[0]
+
+
+def decode(data):
+    """
+    解码为标注内容：JSON 文本解析为对象，其他文本原样返回。
+    :param data: 数据库中读出的值
+    :return: 标注内容
+    """
+    text, is_json = _unpack(data)
+    if is_json is False:
+        return text
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def json_text(data):
+    """
+    获取可直接嵌入 JSON 输出的标注文本。已编码的 JSON 内容直接返回，不经过解析和重新序列化。
+    :param data: 数据库中读出的值
+    :return: JSON 文本
+    """
+    text, is_json = _unpack(data)
+    if is_json:
+        return text
+    return dumps(decode(data))
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDBHelper:
+    def __init__(self, db_helper, max_workers=None):
+        """
+        DBHelper 的异步桥接：在有界线程池中执行阻塞的数据库调用，避免阻塞事件循环。
+        :param db_helper: DBHelper 实例
+        :param max_workers: 线程数，默认与连接池最大连接数一致；未启用连接池时为 1，
+                            每个线程各自打开一个连接，线程数即为连接数；
+                            SQLite 模式下每个线程有自己的连接，默认为 sqlite.threads；
+                            配置了只读副本时，主库和每个副本各有一个连接池，线程数相应增加
+        """
+        self.db = db_helper
+        if max_workers is None:
+            if db_helper.dialect == 'sqlite':
+                max_workers = db_helper.sqlite_config.get('threads', 4)
+            elif db_helper.pool_config.get('enabled'):
+                replicas = db_helper.replica_router.replicas if db_helper.replica_router else []
+                max_workers = db_helper.pool_config.get('max_size', 10) * (1 + len(replicas))
+            else:
+                max_workers = 1
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    async def run(self, func, *args, **kwargs):
+        """
+        在数据库线程池中执行任意阻塞函数，并把当前上下文变量带到工作线程。
+        :param func: 要执行的函数
+        :return: 函数的返回值
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def run_in_transaction(self, func, *args, **kwargs):
+        """
+        在同一个数据库线程中以事务方式执行 func(db_helper, *args, **kwargs)。
+        事务绑定在线程上，不能跨 await 使用，因此整个事务体需要放在一个同步函数中。
+        :param func: 事务体函数，第一个参数为 DBHelper 实例
+        :return: 函数的返回值
+        """
+        def call():
+            with self.db.transaction():
+                return func(self.db, *args, **kwargs)
+        return await self.run(call)
+
+    async def execute_query(self, query, params=None):
+        """
+        异步执行 SQL 查询（用于插入、更新、删除等操作）。
+        """
+        return await self.run(self.db.execute_query, query, params)
+
+    async def fetch_all(self, query, params=None):
+        """
+        异步执行 SQL 查询并返回所有结果。
+        """
+        return await self.run(self.db.fetch_all, query, params)
+
+    async def fetch_one(self, query, params=None):
+        """
+        异步执行 SQL 查询并返回单条结果。
+        """
+        return await self.run(self.db.fetch_one, query, params)
+
+    async def insert_record(self, table_name, data):
+        """
+        异步插入记录到指定表。
+        """
+        return await self.run(self.db.insert_record, table_name, data)
+
+    async def update_record(self, table_name, data, condition_column, condition_value):
+        """
+        异步更新指定表中的记录。
+        """
+        return await self.run(self.db.update_record, table_name, data, condition_column, condition_value)
+
+    async def delete_record(self, table_name, condition_column, condition_value):
+        """
+        异步删除指定表中的记录。
+        """
+        return await self.run(self.db.delete_record, table_name, condition_column, condition_value)
+
+    async def insert_many(self, table_name, rows, chunk_size=None, ignore=False):
+        """
+        异步批量插入记录。
+        """
+        return await self.run(self.db.insert_many, table_name, rows, chunk_size, ignore)
+
+    async def upsert_many(self, table_name, rows, update_columns=None, chunk_size=None):
+        """
+        异步批量插入或更新记录。
+        """
+        return await self.run(self.db.upsert_many, table_name, rows, update_columns, chunk_size)
+
+    async def update_many(self, table_name, rows, key_column='id', chunk_size=None):
+        """
+        异步批量更新记录。
+        """
+        return await self.run(self.db.update_many, table_name, rows, key_column, chunk_size)
+
+    async def get_records(self, table_name, conditions=None, columns=None, for_update=False):
+        """
+        异步获取指定表中的记录。
+        """
+        return await self.run(self.db.get_records, table_name, conditions, columns, for_update)
+
+    async def get_record_by_id(self, table_name, record_id):
+        """
+        异步根据 ID 获取指定表中的单个记录。
+        """
+        return await self.run(self.db.get_record_by_id, table_name, record_id)
+
+    def close(self):
+        """
+        关闭线程池，等待正在执行的数据库调用结束。
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeoutError(Exception):
+    """
+    在 acquire_timeout 秒内未能从连接池借到连接时抛出。
+    """
+
+
+class ConnectionPool:
+    def __init__(self, connect_func, min_size=1, max_size=10, acquire_timeout=10,
+                 health_check_idle=30, is_alive=None):
+        """
+        初始化线程安全的连接池。
+        :param connect_func: 创建新连接的函数（无参数，返回连接对象）
+        :param min_size: 池中预先创建并保持的最少连接数
+        :param max_size: 池中允许同时存在的最大连接数
+        :param acquire_timeout: 借连接时的最长等待时间（秒）
+        :param health_check_idle: 连接空闲超过该秒数后，借出前先做一次健康检查
+        :param is_alive: 健康检查函数，参数为连接，返回是否可用；默认调用 connection.is_connected()
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("连接池大小配置无效: min_size=%s, max_size=%s" % (min_size, max_size))
+        self._connect = connect_func
+        self._is_alive = is_alive or (lambda connection: connection.is_connected())
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_idle = health_check_idle
+
+        self._cond = threading.Condition()
+        # 空闲连接栈，元素为 (连接, 归还时间)；后进先出，优先复用刚用过的热连接
+        self._idle = deque()
+        # 已创建的连接总数（空闲 + 借出 + 正在创建）
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        # 统计信息
+        self._borrowed = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._health_checks = 0
+
+        # 预先创建最少连接数
+        for _ in range(self.min_size):
+            connection = self._connect()
+            with self._cond:
+                self._size += 1
+                self._created += 1
+                self._idle.append((connection, time.monotonic()))
+
+    def acquire(self):
+        """
+        从池中借出一个连接。池已满时最多等待 acquire_timeout 秒。
+        :return: 可用的连接对象
+        """
+        wait_start = None
+        connection = None
+        last_used = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("连接池已关闭")
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # 预占一个名额，真正的建连放到锁外进行
+                    self._size += 1
+                    break
+                if wait_start is None:
+                    wait_start = time.monotonic()
+                    self._waits += 1
+                remaining = self.acquire_timeout - (time.monotonic() - wait_start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._record_wait(wait_start)
+                    raise PoolTimeoutError("等待数据库连接超时（%s 秒）" % self.acquire_timeout)
+                self._cond.wait(remaining)
+            if wait_start is not None:
+                self._record_wait(wait_start)
+            self._in_use += 1
+            self._borrowed += 1
+
+        try:
+            if connection is None:
+                connection = self._new_connection()
+            elif time.monotonic() - last_used > self.health_check_idle:
+                # 只有空闲较久的连接才做健康检查，避免每次查询都 ping 一次服务器
+                with self._cond:
+                    self._health_checks += 1
+                if not self._is_alive(connection):
+                    self._close_quietly(connection)
+                    with self._cond:
+                        self._discarded += 1
+                    connection = self._new_connection()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return connection
+
+    def release(self, connection, discard=False):
+        """
+        归还连接到池中。
+        :param connection: 之前借出的连接
+        :param discard: 为 True 时直接关闭该连接（例如连接已损坏），不再放回池中
+        """
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                self._discarded += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._cond.notify()
+        if connection is not None:
+            self._close_quietly(connection)
+
+    def close(self):
+        """
+        关闭连接池及其中所有空闲连接。借出中的连接在归还时关闭。
+        """
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._size -= len(idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def stats(self):
+        """
+        获取连接池统计信息，用于调整池大小。
+        :return: 统计信息（字典形式）
+        """
+        with self._cond:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'borrowed': self._borrowed,
+                'waits': self._waits,
+                'wait_time_total': self._wait_time_total,
+                'wait_time_max': self._wait_time_max,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'discarded': self._discarded,
+                'health_checks': self._health_checks,
+            }
+
+    def _new_connection(self):
+        connection = self._connect()
+        with self._cond:
+            self._created += 1
+        return connection
+
+    def _record_wait(self, wait_start):
+        # 调用方需持有 self._cond
+        waited = time.monotonic() - wait_start
+        self._wait_time_total += waited
+        if waited > self._wait_time_max:
+            self._wait_time_max = waited
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
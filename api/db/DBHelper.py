@@ -1,6 +1,31 @@
 import mysql.connector
 from mysql.connector import Error
+import contextvars
 import json
+import sqlite3
+import threading
+import logging
+import time
+import weakref
+from contextlib import contextmanager
+from itertools import islice
+
+from db.ConnectionPool import ConnectionPool, PoolTimeoutError
+from db.migrate import MIGRATIONS, MIGRATIONS_TABLE
+from db.QueryStats import QueryStats, normalize_query
+from db.ReplicaRouter import ReplicaRouter
+from db.ResultCache import ResultCache
+from db.SQLiteBackend import SQLiteConnection, resolve_database_path
+from func.Profiling import record_timing
+
+logger = logging.getLogger(__name__)
+
+# 两种后端的 SQL 错误
+SQL_ERRORS = (Error, sqlite3.Error)
+
+# 当前调用方的会话标识（例如用户名），用于读己之写：该会话写入后的一段时间内读操作只走主库。
+# 通过 DBHelper.set_session() 设置；AsyncDBHelper.run 会把它带到数据库线程
+session_key_var = contextvars.ContextVar('db_session_key', default=None)
 
 class DBHelper:
     def __init__(self, config_file='db/DBConfig.json'):
@@ -10,8 +35,52 @@ class DBHelper:
         """
         # 读取数据库配置文件
         self.config = self.read_db_config(config_file)
-        # 初始化数据库连接对象
-        self.connection = None
+        # 数据库类型：'mysql'（默认）或 'sqlite'（单机部署和测试用，无需单独的数据库服务）
+        self.dialect = self.config.get('type', 'mysql')
+        # SQLite 配置，每个线程使用自己的连接
+        self.sqlite_config = self.config.get('sqlite', {})
+        if self.dialect == 'sqlite':
+            self.sqlite_path = resolve_database_path(self.sqlite_config.get('path', 'annotation_system.sqlite3'),
+                                                     config_file)
+        # 各线程自己的连接（SQLite，以及未启用连接池的 MySQL），disconnect() 时统一关闭
+        self._thread_connections = weakref.WeakSet()
+        # 连接池配置，enabled 为 true 时每次调用从池中借出连接、用完归还
+        self.pool_config = self.config.get('pool', {})
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        # 每个线程当前所在事务使用的连接，见 transaction()
+        self._local = threading.local()
+        # 批量写入时每条多行语句包含的记录数
+        self.bulk_chunk_size = self.config.get('bulk_chunk_size', 1000)
+        # 最近一次批量写入的统计信息（行数、耗时、每秒行数）
+        self.last_bulk_stats = None
+        # 按语句统计查询耗时，超过 slow_query_threshold 秒的查询写入慢查询日志
+        self.query_stats = QueryStats(slow_query_threshold=self.config.get('slow_query_threshold', 0.5))
+        # 只读副本：事务外的 fetch_all/fetch_one/get_records 等读操作分摊到副本，写操作和事务只走主库
+        self.replica_router = None
+        routing = self.config.get('replica_routing', {})
+        self.read_your_writes_seconds = routing.get('read_your_writes_seconds', 5)
+        # 会话标识 -> 该会话只读主库的截止时间（time.monotonic()）
+        self._pinned = {}
+        replicas = self.config.get('replicas') or []
+        if replicas and self.dialect == 'sqlite':
+            logger.warning("SQLite 不支持只读副本，已忽略 replicas 配置")
+        elif replicas:
+            self.replica_router = ReplicaRouter(
+                replicas,
+                eject_seconds=routing.get('eject_seconds', 30),
+                max_failures=routing.get('max_failures', 3),
+            )
+        # 查询结果缓存（可选）：缓存 get_records / get_record_by_id 的结果，写入某张表时自动失效该表
+        cache_config = self.config.get('result_cache', {})
+        self.result_cache = None
+        if cache_config.get('enabled'):
+            self.result_cache = ResultCache(
+                max_entries=cache_config.get('max_entries', 10000),
+                max_bytes=cache_config.get('max_mb', 64) * 1024 * 1024,
+                ttl=cache_config.get('ttl_seconds', 0),
+                table_ttls=cache_config.get('tables'),
+            )
 
     def read_db_config(self, config_file):
         """
@@ -23,119 +92,496 @@ class DBHelper:
             config = json.load(file)
         return config['database']
 
+    def _create_connection(self, server=None, **extra):
+        """
+        按配置创建一个新的数据库连接。
+        :param server: 要连接的服务器配置（可选，仅 MySQL），默认连接主库；未给出的项沿用主库配置
+        :param extra: 额外的连接参数（仅 MySQL）
+        :return: 连接对象
+        """
+        self.query_stats.record_connection()
+        if self.dialect == 'sqlite':
+            return SQLiteConnection(
+                self.sqlite_path,
+                busy_timeout=self.sqlite_config.get('busy_timeout', 5),
+                synchronous=self.sqlite_config.get('synchronous', 'NORMAL'),
+            )
+        server = {**self.config, **(server or {})}
+        return mysql.connector.connect(
+            host=server['host'],  # 数据库主机地址
+            port=server.get('port', 3306),  # 数据库端口
+            user=server['user'],  # 数据库用户名
+            password=server['password'],  # 数据库密码
+            database=server['name'],  # 数据库名称
+            **extra
+        )
+
     def connect(self):
         """
-        连接到 MySQL 数据库。
+        连接到 MySQL 数据库（非连接池模式下当前线程的连接）。
         如果连接成功，打印成功信息；否则捕获并打印错误信息。
         """
         try:
-            print("尝试连接到MySQL服务器...")
-            self.connection = mysql.connector.connect(
-                host=self.config['host'],  # 数据库主机地址
-                user=self.config['user'],  # 数据库用户名
-                password=self.config['password'],  # 数据库密码
-                database=self.config['name']  # 数据库名称
-            )
-            if self.connection.is_connected():
-                print("成功连接到MySQL服务器")
+            logger.info("尝试连接到MySQL服务器...")
+            if self._thread_connection().is_connected():
+                logger.info("成功连接到MySQL服务器")
         except Error as e:
-            print(f"Error: {e}")
+            logger.error("连接MySQL服务器失败: %s", e)
 
     def disconnect(self):
         """
-        断开与 MySQL 数据库的连接。
-        如果连接存在且已连接，则关闭连接并打印信息。
+        断开与数据库的连接。
+        关闭所有线程自己的连接（SQLite 和非连接池模式的 MySQL），各线程下次使用时重新连接；
+        连接池模式下关闭整个连接池。
+        """
+        closed = 0
+        for connection in list(self._thread_connections):
+            if connection.is_connected():
+                connection.close()
+                closed += 1
+        if closed and self.dialect != 'sqlite':
+            logger.info("MySQL 连接已关闭")
+        with self._pool_lock:
+            pool, self.pool = self.pool, None
+        if pool:
+            pool.close()
+            logger.info("MySQL 连接池已关闭")
+        if self.replica_router is not None:
+            with self._pool_lock:
+                pools = [replica.pool for replica in self.replica_router.replicas if replica.pool]
+                for replica in self.replica_router.replicas:
+                    replica.pool = None
+            for pool in pools:
+                pool.close()
+
+    def _get_pool(self):
+        """
+        获取连接池，首次使用时按配置创建。
+        :return: ConnectionPool 实例
+        """
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    logger.info("正在创建MySQL连接池...")
+                    self.pool = ConnectionPool(
+                        # 池中的连接使用 autocommit，避免只读查询长期持有旧快照
+                        lambda: self._create_connection(autocommit=True),
+                        min_size=self.pool_config.get('min_size', 1),
+                        max_size=self.pool_config.get('max_size', 10),
+                        acquire_timeout=self.pool_config.get('acquire_timeout', 10),
+                        health_check_idle=self.pool_config.get('health_check_idle_seconds', 30),
+                    )
+        return self.pool
+
+    def _replica_pool(self, replica):
+        """
+        获取副本的连接池，首次使用时创建（副本不可用时抛出连接错误）。
+        :param replica: Replica 实例
+        :return: ConnectionPool 实例
+        """
+        if replica.pool is None:
+            with self._pool_lock:
+                if replica.pool is None:
+                    logger.info("正在创建只读副本 %s 的连接池...", replica.name)
+                    replica.pool = ConnectionPool(
+                        lambda: self._create_connection(replica.settings, autocommit=True),
+                        min_size=self.pool_config.get('min_size', 1),
+                        max_size=self.pool_config.get('max_size', 10),
+                        acquire_timeout=self.pool_config.get('acquire_timeout', 10),
+                        health_check_idle=self.pool_config.get('health_check_idle_seconds', 30),
+                    )
+        return replica.pool
+
+    def set_session(self, key):
+        """
+        设置当前上下文（请求）的会话标识，开启读己之写：该会话写入后的 read_your_writes_seconds 秒内，
+        它的读操作只走主库，不会读到副本上尚未同步的旧数据。
+        固定记录保存在进程内，多 worker 部署时只对同一 worker 处理的请求有效。
+        :param key: 会话标识（例如用户名），为 None 时关闭
+        :return: contextvars.Token，可用于 session_key_var.reset()
+        """
+        return session_key_var.set(key)
+
+    def _note_write(self):
+        """
+        记录当前会话刚刚写入过主库。
+        """
+        key = session_key_var.get()
+        if self.replica_router is None or key is None:
+            return
+        now = time.monotonic()
+        pinned = self._pinned
+        if len(pinned) > 10000:
+            # 顺带清理已过期的记录，避免无限增长
+            for expired in [k for k, until in list(pinned.items()) if until <= now]:
+                pinned.pop(expired, None)
+        pinned[key] = now + self.read_your_writes_seconds
+
+    def _invalidate_cache(self, table_name):
+        """
+        写入某张表后失效该表的缓存结果。事务中的写入在提交后再失效一次，
+        避免其他线程在提交前把旧数据重新放回缓存。
+        :param table_name: 表名，'-' 表示无法识别（失效全部表）
+        """
+        if self.result_cache is None:
+            return
+        # 配置了副本时，写入后的一段时间内副本可能仍是旧数据，这段时间内不缓存该表
+        hold = self.read_your_writes_seconds if self.replica_router is not None else 0
+        self.result_cache.invalidate(None if table_name == '-' else table_name, hold)
+        written_tables = getattr(self._local, 'written_tables', None)
+        if written_tables is not None:
+            written_tables.add(table_name)
+
+    def result_cache_stats(self):
+        """
+        获取查询结果缓存的统计信息（命中、未命中、淘汰、失效次数等）。
+        :return: 统计信息（字典形式），未启用时返回 None
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.stats()
+
+    def _use_replica(self):
+        """
+        判断当前的读操作能否使用副本：配置了副本、不在事务中，且当前会话没有被固定到主库。
+        """
+        if self.replica_router is None or self.in_transaction():
+            return False
+        key = session_key_var.get()
+        return key is None or self._pinned.get(key, 0) <= time.monotonic()
+
+    @contextmanager
+    def _borrow(self, read=False):
+        """
+        借出一个连接供单次调用使用。
+        当前线程处于事务中时使用事务的连接；读操作可用副本时从副本借出；否则按 _acquire() 借出。
+        :param read: 为 True 表示只读操作，可以路由到副本
         """
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("MySQL 连接已关闭")
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            yield connection
+            return
+        if read and self._use_replica():
+            with self._acquire_replica() as connection:
+                yield connection
+            return
+        with self._acquire() as connection:
+            yield connection
+
+    @contextmanager
+    def _acquire_replica(self):
+        """
+        从副本借出一个连接：依次尝试 ReplicaRouter 选出的副本，连接失败的副本计入失败次数，
+        所有副本都不可用时回退到主库。
+        """
+        tried = []
+        while True:
+            replica = self.replica_router.choose(exclude=tried)
+            if replica is None:
+                break
+            tried.append(replica)
+            try:
+                pool = self._replica_pool(replica)
+                connection = pool.acquire()
+            except PoolTimeoutError as e:
+                # 连接池繁忙不代表副本不健康，换一个副本
+                logger.warning("只读副本 %s 繁忙: %s", replica.name, e)
+                self.replica_router.release(replica)
+                continue
+            except SQL_ERRORS as e:
+                logger.warning("只读副本 %s 不可用: %s", replica.name, e)
+                self.replica_router.release(replica, failed=True)
+                continue
+
+            discard = False
+            try:
+                yield connection
+            except Error:
+                discard = not connection.is_connected()
+                raise
+            finally:
+                pool.release(connection, discard)
+                self.replica_router.release(replica, failed=discard)
+            return
+
+        logger.debug("没有可用的只读副本，读操作回退到主库")
+        with self._acquire() as connection:
+            yield connection
+
+    @contextmanager
+    def _acquire(self):
+        """
+        获取一个独立的连接。
+        连接池模式下从池中借出并在结束后归还；
+        否则（SQLite 或未启用连接池的 MySQL）使用当前线程自己的连接，断开时重新连接。
+        """
+        if self.dialect == 'sqlite' or not self.pool_config.get('enabled'):
+            yield self._thread_connection()
+            return
+
+        pool = self._get_pool()
+        connection = pool.acquire()
+        discard = False
+        try:
+            yield connection
+        except Error:
+            # 出错后仅在连接已断开时丢弃，普通 SQL 错误不影响连接复用
+            discard = not connection.is_connected()
+            raise
+        finally:
+            pool.release(connection, discard)
+
+    def _thread_connection(self):
+        """
+        获取当前线程自己的连接，首次使用或已断开时创建。
+        sqlite3 和 mysql.connector 的连接都不能被多个线程同时使用，未启用连接池时数据库线程池、
+        后台线程（会话清理、last_login 写入、数据导入）各自使用一个连接；WAL 模式下各线程的 SQLite 连接可以并发读。
+        :return: SQLiteConnection 或 MySQL 连接
+        """
+        connection = getattr(self._local, 'thread_connection', None)
+        if connection is None or not connection.is_connected():
+            if self.dialect == 'sqlite':
+                connection = self._create_connection()
+            else:
+                # 使用 autocommit，只读查询不会长期持有快照事务；需要原子性时使用 transaction()
+                connection = self._create_connection(autocommit=True)
+            self._local.thread_connection = connection
+            self._thread_connections.add(connection)
+        return connection
+
+    def in_transaction(self):
+        """
+        判断当前线程是否处于 transaction() 中。
+        :return: 处于事务中返回 True
+        """
+        return getattr(self._local, 'connection', None) is not None
+
+    @contextmanager
+    def transaction(self):
+        """
+        显式事务：with db.transaction(): 中当前线程的所有调用共用同一个连接，
+        正常结束时统一提交一次，出现异常时回滚并把异常抛给调用方。
+        事务中可以使用 get_records(..., for_update=True) 或 SELECT ... FOR UPDATE 加行锁；
+        SQLite 没有行锁，事务开始时即获取整个数据库的写锁，FOR UPDATE 会被忽略。
+        嵌套调用时内层并入外层事务。
+        :return: 上下文管理器，as 子句得到当前 DBHelper
+        """
+        if self.in_transaction():
+            yield self
+            return
+        with self._acquire() as connection:
+            connection.start_transaction()
+            self._local.connection = connection
+            self._local.written_tables = set()
+            try:
+                yield self
+                connection.commit()
+                self._note_write()
+                written_tables, self._local.written_tables = self._local.written_tables, None
+                for table_name in written_tables:
+                    self._invalidate_cache(table_name)
+            except BaseException:
+                try:
+                    connection.rollback()
+                except SQL_ERRORS as e:
+                    # 连接已断开时回滚失败，服务器会自动回滚未提交的事务
+                    logger.warning("事务回滚失败: %s", e)
+                raise
+            finally:
+                self._local.connection = None
+                self._local.written_tables = None
+
+    def _handle_error(self, e):
+        """
+        处理数据库错误：记录错误日志；处于事务中时向调用方抛出，以便整个事务回滚。
+        :param e: 异常对象
+        """
+        logger.error("数据库错误: %s", e)
+        if self.in_transaction():
+            raise e
+
+    def check_schema(self):
+        """
+        检查数据库是否已执行全部结构迁移（db/migrate.py）。代码依赖最新的表结构，
+        例如标注内容以二进制编码写入需要迁移 6 把列改为 MEDIUMBLOB，会话需要迁移 7 的 sessions 表；
+        先部署代码再执行迁移会把数据写入旧结构，因此有未执行的迁移时拒绝启动。
+        :raises RuntimeError: 有未执行的迁移或无法读取迁移记录时抛出
+        """
+        rows = self.fetch_all(f"SELECT version FROM {MIGRATIONS_TABLE}", primary=True)
+        applied = {row['version'] for row in rows}
+        missing = [f"{version} ({name})" for version, name, _ in MIGRATIONS if version not in applied]
+        if missing:
+            raise RuntimeError("数据库结构未迁移到最新版本，缺少迁移: %s。请先在 db 目录下执行 python migrate.py"
+                               % ', '.join(missing))
+
+    def pool_stats(self):
+        """
+        获取连接池统计信息（使用中、等待次数、等待时间等）。
+        :return: 统计信息（字典形式），未启用连接池时返回 None
+        """
+        if self.pool is None:
+            return None
+        return self.pool.stats()
+
+    def replica_stats(self):
+        """
+        获取只读副本的统计信息（是否健康、并发数、读次数、失败和剔除次数）。
+        :return: 统计信息列表（字典形式），未配置副本时返回空列表
+        """
+        if self.replica_router is None:
+            return []
+        return self.replica_router.stats()
 
     def execute_query(self, query, params=None):
         """
         执行 SQL 查询（用于插入、更新、删除等操作）。
+        事务外的语句由 autocommit 立即提交；事务中的语句在事务结束时统一提交。
         :param query: SQL 查询语句
         :param params: 查询参数（可选）
+        :return: 受影响的行数，出错时返回 None（事务中出错则抛出异常）
         """
-        cursor = None
-        try:
-            # 如果未连接或连接已断开，则重新连接
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
+        rowcount, _ = self._execute_write(query, params)
+        return rowcount
 
-            cursor = self.connection.cursor()
-            # 执行 SQL 查询
+    def _run(self, cursor, query, params=None, fetch=None):
+        """
+        执行一条语句并计时，结果计入 query_stats。
+        :param cursor: 游标
+        :param query: SQL 语句
+        :param params: 查询参数（可选）
+        :param fetch: 读取结果的函数（可选），读取耗时一并计入
+        :return: fetch 的返回值
+        """
+        start = time.perf_counter()
+        error = False
+        try:
             cursor.execute(query, params)
-            # 提交事务
-            self.connection.commit()
-            print("查询执行成功")
-        except Error as e:
-            print(f"Error: {e}")
+            return fetch(cursor) if fetch else None
+        except SQL_ERRORS:
+            error = True
+            raise
         finally:
-            # 关闭游标
-            if cursor:
-                cursor.close()
+            elapsed = time.perf_counter() - start
+            self.query_stats.observe(query, params, elapsed, error)
+            # 被分析的请求在 Server-Timing 中输出数据库耗时
+            record_timing('db', elapsed)
+
+    def _execute_write(self, query, params=None):
+        """
+        执行写操作。
+        :return: (受影响的行数, 自增 ID)，出错时为 (None, None)
+        """
+        try:
+            with self._borrow() as connection:
+                cursor = connection.cursor()
+                try:
+                    # 执行 SQL 查询
+                    self._run(cursor, query, params)
+                    logger.debug("查询执行成功")
+                    self._note_write()
+                    self._invalidate_cache(normalize_query(query)[1])
+                    return cursor.rowcount, cursor.lastrowid
+                finally:
+                    # 关闭游标
+                    cursor.close()
+        except (*SQL_ERRORS, PoolTimeoutError) as e:
+            self._handle_error(e)
+        return None, None
 
-    def fetch_all(self, query, params=None):
+    def fetch_all(self, query, params=None, primary=False):
         """
         执行 SQL 查询并返回所有结果。
         :param query: SQL 查询语句
         :param params: 查询参数（可选）
+        :param primary: 为 True 时只读主库（例如其他 worker 刚写入、副本可能尚未同步的数据）
         :return: 查询结果列表（字典形式）
         """
-        cursor = None
-        result = []
         try:
-            # 如果未连接或连接已断开，则重新连接
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
+            result = self._read(query, params, lambda c: c.fetchall(), primary)
+            logger.debug("数据获取成功")
+            return result
+        except (*SQL_ERRORS, PoolTimeoutError) as e:
+            self._handle_error(e)
+        return []
 
-            # 使用字典游标，返回结果为字典形式
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params)
-            # 获取所有结果
-            result = cursor.fetchall()
-            print("数据获取成功")
-        except Error as e:
-            print(f"Error: {e}")
-        finally:
-            # 关闭游标
-            if cursor:
-                cursor.close()
-        return result
-
-    def fetch_one(self, query, params=None):
+    def fetch_one(self, query, params=None, primary=False):
         """
         执行 SQL 查询并返回单条结果。
         :param query: SQL 查询语句
         :param params: 查询参数（可选）
+        :param primary: 为 True 时只读主库
         :return: 单条查询结果（字典形式）
         """
-        cursor = None
-        result = None
         try:
-            # 如果未连接或连接已断开，则重新连接
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
+            result = self._read(query, params, lambda c: c.fetchone(), primary)
+            logger.debug("单条数据获取成功")
+            return result
+        except (*SQL_ERRORS, PoolTimeoutError) as e:
+            self._handle_error(e)
+        return None
 
+    def _read(self, query, params, fetch, primary=False):
+        """
+        执行只读查询（可路由到副本），出错时抛出异常。
+        :param query: SQL 查询语句
+        :param params: 查询参数（可选）
+        :param fetch: 读取结果的函数，参数为游标
+        :param primary: 为 True 时不使用副本
+        :return: fetch 的返回值
+        """
+        with self._borrow(read=not primary) as connection:
             # 使用字典游标，返回结果为字典形式
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params)
-            # 获取单条结果
-            result = cursor.fetchone()
-            print("单条数据获取成功")
-        except Error as e:
-            print(f"Error: {e}")
-        finally:
-            # 关闭游标
-            if cursor:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                return self._run(cursor, query, params, fetch)
+            finally:
+                # 关闭游标
                 cursor.close()
+
+    def _cached_read(self, table_name, key, query, params, fetch, default):
+        """
+        先查结果缓存，未命中时执行查询并写入缓存。事务中、未启用缓存或该表未配置缓存时直接查询。
+        查询出错时不缓存，返回 default（事务中出错则抛出异常）。
+        :param table_name: 表名
+        :param key: 缓存键（第一项为表名），为 None 时不使用缓存
+        :param query: SQL 查询语句
+        :param params: 查询参数
+        :param fetch: 读取结果的函数，参数为游标
+        :param default: 出错时的返回值
+        :return: 查询结果
+        """
+        cache = self.result_cache
+        use_cache = (cache is not None and key is not None and not self.in_transaction()
+                     and cache.ttl_for(table_name) > 0)
+        if use_cache:
+            hit, value = cache.get(key)
+            if hit:
+                return value
+            generation = cache.generation(table_name)
+        try:
+            result = self._read(query, params, fetch)
+        except (*SQL_ERRORS, PoolTimeoutError) as e:
+            self._handle_error(e)
+            return default
+        if use_cache:
+            cache.set(key, result, generation)
         return result
 
+    @staticmethod
+    def _cache_key(*parts):
+        # 条件值不可哈希（例如列表）时不使用缓存
+        try:
+            hash(parts)
+        except TypeError:
+            return None
+        return parts
+
     def insert_record(self, table_name, data):
         """
         插入记录到指定表。
         :param table_name: 表名
         :param data: 要插入的数据（字典形式，键为列名，值为数据）
+        :return: 新记录的自增 ID，出错时返回 None
         """
         # 构造列名和占位符
         columns = ', '.join(data.keys())
@@ -143,7 +589,8 @@ class DBHelper:
         # 构造 SQL 插入语句
         query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
         # 执行插入操作
-        self.execute_query(query, tuple(data.values()))
+        _, lastrowid = self._execute_write(query, tuple(data.values()))
+        return lastrowid
 
     def update_record(self, table_name, data, condition_column, condition_value):
         """
@@ -152,6 +599,7 @@ class DBHelper:
         :param data: 要更新的数据（字典形式，键为列名，值为数据）
         :param condition_column: 条件列名
         :param condition_value: 条件值
+        :return: 受影响的行数，出错时返回 None
         """
         # 构造 SET 子句
         set_clause = ', '.join([f"{key} = %s" for key in data.keys()])
@@ -160,7 +608,7 @@ class DBHelper:
         # 构造参数列表
         params = list(data.values()) + [condition_value]
         # 执行更新操作
-        self.execute_query(query, tuple(params))
+        return self.execute_query(query, tuple(params))
 
     def delete_record(self, table_name, condition_column, condition_value):
         """
@@ -168,39 +616,272 @@ class DBHelper:
         :param table_name: 表名
         :param condition_column: 条件列名
         :param condition_value: 条件值
+        :return: 受影响的行数，出错时返回 None
         """
         # 构造 SQL 删除语句
         query = f"DELETE FROM {table_name} WHERE {condition_column} = %s"
         # 执行删除操作
-        self.execute_query(query, (condition_value,))
+        return self.execute_query(query, (condition_value,))
+
+    def insert_many(self, table_name, rows, chunk_size=None, ignore=False):
+        """
+        批量插入记录。按块构造多行 INSERT 语句，每块提交一次。
+        :param table_name: 表名
+        :param rows: 要插入的数据（可迭代对象，元素为字典，所有字典的键必须相同）
+        :param chunk_size: 每条语句包含的记录数，默认为配置中的 bulk_chunk_size
+        :param ignore: 为 True 时使用 INSERT IGNORE，跳过与主键或唯一索引冲突的记录
+        :return: 受影响的总行数（ignore 为 True 时不含被跳过的记录）
+        """
+        def build(chunk):
+            query, params = self._build_multi_insert(table_name, chunk)
+            if ignore:
+                query = 'INSERT IGNORE' + query[len('INSERT'):]
+            return query, params
+
+        return self._bulk_write(table_name, rows, chunk_size, build)
+
+    def upsert_many(self, table_name, rows, update_columns=None, chunk_size=None):
+        """
+        批量插入或更新记录（INSERT ... ON DUPLICATE KEY UPDATE）。
+        主键或唯一索引冲突的记录会更新 update_columns 指定的列。
+        :param table_name: 表名
+        :param rows: 要写入的数据（可迭代对象，元素为字典，所有字典的键必须相同）
+        :param update_columns: 冲突时要更新的列，默认为除 id 外的全部列
+        :param chunk_size: 每条语句包含的记录数，默认为配置中的 bulk_chunk_size
+        :return: 受影响的总行数（MySQL 中新插入的行计 1，被更新的行计 2；SQLite 中均计 1）
+        """
+        def build(chunk):
+            query, params = self._build_multi_insert(table_name, chunk)
+            columns = update_columns or [column for column in chunk[0].keys() if column != 'id']
+            query += " ON DUPLICATE KEY UPDATE " + \
+                ', '.join([f"{column} = VALUES({column})" for column in columns])
+            return query, params
+
+        return self._bulk_write(table_name, rows, chunk_size, build)
+
+    def update_many(self, table_name, rows, key_column='id', chunk_size=None):
+        """
+        批量更新记录。每块构造一条 UPDATE ... SET col = CASE key WHEN ... END 语句。
+        :param table_name: 表名
+        :param rows: 要更新的数据（可迭代对象，元素为字典，必须包含 key_column，其余键为要更新的列）
+        :param key_column: 用于定位记录的列名，默认为 'id'
+        :param chunk_size: 每条语句包含的记录数，默认为配置中的 bulk_chunk_size
+        :return: 受影响的总行数
+        """
+        def build(chunk):
+            columns = [column for column in chunk[0].keys() if column != key_column]
+            set_clauses = []
+            params = []
+            for column in columns:
+                cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+                set_clauses.append(f"{column} = CASE {key_column} {cases} ELSE {column} END")
+                for row in chunk:
+                    params.extend([row[key_column], row[column]])
+            keys = [row[key_column] for row in chunk]
+            query = f"UPDATE {table_name} SET {', '.join(set_clauses)} " \
+                f"WHERE {key_column} IN ({', '.join(['%s'] * len(keys))})"
+            return query, params + keys
+
+        return self._bulk_write(table_name, rows, chunk_size, build)
+
+    def _build_multi_insert(self, table_name, chunk):
+        """
+        构造多行 INSERT 语句。
+        :param table_name: 表名
+        :param chunk: 一块记录（字典列表）
+        :return: (query, params)
+        """
+        columns = list(chunk[0].keys())
+        row_placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES " + \
+            ', '.join([row_placeholders] * len(chunk))
+        params = [row[column] for row in chunk for column in columns]
+        return query, params
+
+    def _bulk_write(self, table_name, rows, chunk_size, build):
+        """
+        分块执行批量写入：每块一条多行语句、提交一次，并统计吞吐量。
+        :param table_name: 表名
+        :param rows: 记录（可迭代对象）
+        :param chunk_size: 每块记录数
+        :param build: 根据一块记录构造 (query, params) 的函数
+        :return: 受影响的总行数
+        """
+        chunk_size = chunk_size or self.bulk_chunk_size
+        rows = iter(rows)
+        affected = 0
+        written = 0
+        start = time.perf_counter()
+        try:
+            with self._borrow() as connection:
+                cursor = connection.cursor()
+                try:
+                    while True:
+                        chunk = list(islice(rows, chunk_size))
+                        if not chunk:
+                            break
+                        query, params = build(chunk)
+                        # 事务外每条多行语句由 autocommit 提交一次（每块一次，而不是每行一次）；
+                        # 事务中所有块随事务统一提交
+                        self._run(cursor, query, params)
+                        affected += cursor.rowcount
+                        written += len(chunk)
+                finally:
+                    # 关闭游标
+                    cursor.close()
+        except (*SQL_ERRORS, PoolTimeoutError) as e:
+            self._handle_error(e)
+        if written:
+            self._note_write()
+            self._invalidate_cache(table_name)
+        elapsed = time.perf_counter() - start
+        rows_per_second = written / elapsed if elapsed > 0 else 0.0
+        self.last_bulk_stats = {
+            'table': table_name,
+            'rows': written,
+            'affected': affected,
+            'seconds': elapsed,
+            'rows_per_second': rows_per_second,
+        }
+        logger.info("批量写入 '%s' 完成: %d 行，耗时 %.3f 秒，%.0f 行/秒", table_name, written, elapsed, rows_per_second)
+        return affected
 
-    def get_records(self, table_name, conditions=None):
+    def get_records(self, table_name, conditions=None, columns=None, for_update=False):
         """
-        获取指定表中的记录。
+        获取指定表中的记录。结果会全部载入内存，大表请使用 iter_records。
+        启用结果缓存且该表配置了有效期时，事务外的查询先查缓存，写入该表时缓存自动失效。
         :param table_name: 表名
         :param conditions: 查询条件（字典形式，键为列名，值为条件值）
+        :param columns: 要读取的列（可选），默认为全部列
+        :param for_update: 为 True 时追加 FOR UPDATE 锁定读到的行，只在 transaction() 中有意义
         :return: 查询结果列表（字典形式）
         """
+        select_clause = ', '.join(columns) if columns else '*'
+        lock_clause = " FOR UPDATE" if for_update else ""
         if conditions:
             # 构造 WHERE 子句
             where_clause = ' AND '.join([f"{key} = %s" for key in conditions.keys()])
             # 构造 SQL 查询语句
-            query = f"SELECT * FROM {table_name} WHERE {where_clause}"
-            # 执行查询并返回结果
-            return self.fetch_all(query, tuple(conditions.values()))
+            query = f"SELECT {select_clause} FROM {table_name} WHERE {where_clause}{lock_clause}"
+            params = tuple(conditions.values())
         else:
             # 如果没有条件，查询所有记录
-            query = f"SELECT * FROM {table_name}"
-            return self.fetch_all(query)
+            query = f"SELECT {select_clause} FROM {table_name}{lock_clause}"
+            params = None
+        if for_update:
+            return self.fetch_all(query, params)
+        # 执行查询并返回结果（启用结果缓存时先查缓存）
+        key = self._cache_key(table_name, 'records', tuple(columns or ()), tuple((conditions or {}).items()))
+        return self._cached_read(table_name, key, query, params, lambda c: c.fetchall(), [])
+
+    def stream_query(self, query, params=None, batch_size=1000, as_dict=True):
+        """
+        使用非缓冲（服务端）游标流式执行查询，每次 fetchmany 一批，结果不会一次性载入内存。
+        迭代期间独占一个连接；出错时记录日志并向调用方抛出异常，避免结果被静默截断。
+        :param query: SQL 查询语句
+        :param params: 查询参数（可选）
+        :param batch_size: 每次从服务器读取的行数
+        :param as_dict: 为 True 时每行为字典，否则为元组（更省内存）
+        :return: 逐行产出结果的生成器
+        """
+        try:
+            with self._borrow(read=True) as connection:
+                cursor = connection.cursor(buffered=False, dictionary=as_dict)
+                exhausted = False
+                try:
+                    self._run(cursor, query, params)
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield from rows
+                    exhausted = True
+                finally:
+                    if not exhausted:
+                        # 提前结束迭代时需读完剩余结果，连接才能继续使用
+                        connection.consume_results()
+                    # 关闭游标
+                    cursor.close()
+        except (*SQL_ERRORS, PoolTimeoutError) as e:
+            logger.error("数据库错误: %s", e)
+            raise
+
+    def iter_records(self, table_name, conditions=None, columns=None, batch_size=1000,
+                     as_dict=True, start_after=None, key_column='id'):
+        """
+        按键集分页（WHERE id > 上一批最后的 id ORDER BY id LIMIT n）流式读取指定表中的记录。
+        每批单独借出连接并立即归还，调用方处理数据期间不占用连接，内存占用与表大小无关。
+        :param table_name: 表名
+        :param conditions: 查询条件（字典形式，键为列名，值为条件值；值为列表或元组时按 IN 匹配其中任意一个）
+        :param columns: 要读取的列，默认为全部列；key_column 总会被读取
+        :param batch_size: 每批读取的行数
+        :param as_dict: 为 True 时每行为字典，否则为元组（顺序与 columns 一致，key_column 在最前）
+        :param start_after: 只读取 key_column 大于该值的记录，用于断点续读
+        :param key_column: 分页使用的列，必须唯一且有索引，默认为 'id'
+        :return: 逐行产出结果的生成器
+        """
+        if columns:
+            columns = [key_column] + [column for column in columns if column != key_column]
+            select_clause = ', '.join(columns)
+            key_index = 0
+        else:
+            select_clause = '*'
+            key_index = None
+        conditions = conditions or {}
+        if any(isinstance(value, (list, tuple)) and not value for value in conditions.values()):
+            # IN 的候选值为空时没有匹配的记录
+            return
+        last_key = start_after
+        while True:
+            clauses = []
+            params = []
+            for key, value in conditions.items():
+                if isinstance(value, (list, tuple)):
+                    clauses.append(f"{key} IN ({', '.join(['%s'] * len(value))})")
+                    params.extend(value)
+                else:
+                    clauses.append(f"{key} = %s")
+                    params.append(value)
+            if last_key is not None:
+                clauses.append(f"{key_column} > %s")
+                params.append(last_key)
+            query = f"SELECT {select_clause} FROM {table_name}"
+            if clauses:
+                query += " WHERE " + ' AND '.join(clauses)
+            query += f" ORDER BY {key_column} LIMIT %s"
+            params.append(batch_size)
+
+            try:
+                with self._borrow(read=True) as connection:
+                    cursor = connection.cursor(dictionary=as_dict)
+                    try:
+                        batch = self._run(cursor, query, tuple(params), lambda c: c.fetchall())
+                        if not as_dict and key_index is None:
+                            # SELECT * 返回元组时，根据列名确定分页列的位置
+                            key_index = cursor.column_names.index(key_column)
+                    finally:
+                        # 关闭游标
+                        cursor.close()
+            except (*SQL_ERRORS, PoolTimeoutError) as e:
+                logger.error("数据库错误: %s", e)
+                raise
+
+            if not batch:
+                return
+            yield from batch
+            last_key = batch[-1][key_column] if as_dict else batch[-1][key_index]
+            if len(batch) < batch_size:
+                return
 
     def get_record_by_id(self, table_name, record_id):
         """
-        根据 ID 获取指定表中的单个记录。
+        根据 ID 获取指定表中的单个记录，与 get_records 一样可以使用结果缓存。
         :param table_name: 表名
         :param record_id: 记录 ID
         :return: 单条查询结果（字典形式）
         """
         # 构造 SQL 查询语句
         query = f"SELECT * FROM {table_name} WHERE id = %s"
-        # 执行查询并返回结果
-        return self.fetch_one(query, (record_id,))
\ No newline at end of file
+        # 执行查询并返回结果（启用结果缓存时先查缓存）
+        key = self._cache_key(table_name, 'id', record_id)
+        return self._cached_read(table_name, key, query, (record_id,), lambda c: c.fetchone(), None)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import logging
+import re
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# 默认的延迟直方图桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUES_LIST = re.compile(r'VALUES\s*\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+', re.IGNORECASE)
+_CASE_LIST = re.compile(r'(?:\s*WHEN \? THEN \?)+', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN|TABLE)\s+`?(\w+)`?', re.IGNORECASE)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        累积直方图，格式与 Prometheus histogram 一致。非线程安全，调用方负责加锁。
+        :param buckets: 桶的上界（升序）
+        """
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        记录一个观测值。
+        """
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        """
+        获取累积计数。
+        :return: [(上界, 小于等于该上界的观测次数), ...]，最后一项上界为 '+Inf'
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append(('+Inf', self.count))
+        return result
+
+
+@lru_cache(maxsize=2048)
+def normalize_query(query):
+    """
+    归一化 SQL 语句：去掉字面量和参数个数的差异，使同一模板的语句归为一类。
+    :param query: SQL 语句
+    :return: (归一化后的语句, 主表名)
+    """
+    normalized = _WHITESPACE.sub(' ', query).strip()
+    normalized = _STRING_LITERAL.sub('?', normalized)
+    normalized = normalized.replace('%s', '?')
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _CASE_LIST.sub(' WHEN ... THEN ...', normalized)
+    normalized = _PLACEHOLDER_LIST.sub('(...)', normalized)
+    normalized = _VALUES_LIST.sub('VALUES (...), ...', normalized)
+    match = _TABLE.search(normalized)
+    return normalized[:300], (match.group(1) if match else '-')
+
+
+def describe_params(params):
+    """
+    描述查询参数的形状（类型和长度），写入慢查询日志时不暴露参数值。
+    :param params: 查询参数
+    :return: 描述字符串，例如 '(int, str[36], datetime)'
+    """
+    if params is None:
+        return '()'
+    values = list(params.values()) if isinstance(params, dict) else list(params)
+    shapes = []
+    for value in values[:20]:
+        if isinstance(value, (str, bytes)):
+            shapes.append(f"{type(value).__name__}[{len(value)}]")
+        elif isinstance(value, (datetime, date)):
+            shapes.append(type(value).__name__)
+        elif value is None:
+            shapes.append('null')
+        else:
+            shapes.append(type(value).__name__)
+    if len(values) > 20:
+        shapes.append(f"... 共 {len(values)} 个")
+    return '(' + ', '.join(shapes) + ')'
+
+
+class QueryStats:
+    def __init__(self, slow_query_threshold=0.5, max_statements=500):
+        """
+        按归一化语句统计查询耗时，并记录慢查询。
+        :param slow_query_threshold: 慢查询阈值（秒），超过时写 WARNING 日志
+        :param max_statements: 最多单独统计的语句数，超出部分归入 'other'
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        # (归一化语句, 表名) -> {'histogram': Histogram, 'errors': 错误次数}
+        self._statements = {}
+        self._connections = 0
+        self._slow_queries = 0
+
+    def observe(self, query, params, elapsed, error=False):
+        """
+        记录一次查询。
+        :param query: SQL 语句
+        :param params: 查询参数
+        :param elapsed: 耗时（秒）
+        :param error: 是否执行出错
+        """
+        statement, table = normalize_query(query)
+        slow = elapsed >= self.slow_query_threshold
+        with self._lock:
+            key = (statement, table)
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    key = ('other', table)
+                    entry = self._statements.get(key)
+                if entry is None:
+                    entry = {'histogram': Histogram(), 'errors': 0}
+                    self._statements[key] = entry
+            entry['histogram'].observe(elapsed)
+            if error:
+                entry['errors'] += 1
+            if slow:
+                self._slow_queries += 1
+        if slow:
+            logger.warning("慢查询 %.3f 秒 [%s] %s 参数: %s", elapsed, table, statement, describe_params(params))
+
+    def record_connection(self):
+        """
+        记录一次数据库连接（包括重连）的建立。
+        """
+        with self._lock:
+            self._connections += 1
+
+    def snapshot(self):
+        """
+        获取统计快照。
+        :return: 统计信息（字典形式）
+        """
+        with self._lock:
+            statements = []
+            for (statement, table), entry in self._statements.items():
+                histogram = entry['histogram']
+                statements.append({
+                    'statement': statement,
+                    'table': table,
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'errors': entry['errors'],
+                    'buckets': histogram.cumulative(),
+                })
+            return {
+                'connections': self._connections,
+                'slow_queries': self._slow_queries,
+                'statements': statements,
+            }
@@ -0,0 +1,101 @@
+import threading
+import time
+
+
+class Replica:
+    def __init__(self, settings):
+        """
+        一个只读副本及其运行状态。
+        :param settings: 副本的连接配置（host、port，以及可选的 user、password、name），未给出的项沿用主库配置
+        """
+        self.settings = settings
+        self.name = f"{settings.get('host', 'localhost')}:{settings.get('port', 3306)}"
+        # 副本的连接池，首次使用时由 DBHelper 创建
+        self.pool = None
+        # 正在使用该副本的调用数，用于负载均衡
+        self.in_flight = 0
+        # 连续失败次数，达到 max_failures 时剔除
+        self.failures = 0
+        # 剔除到期时间（time.monotonic()），到期后重新尝试
+        self.ejected_until = 0.0
+        self.reads = 0
+        self.errors = 0
+        self.ejections = 0
+
+
+class ReplicaRouter:
+    def __init__(self, replicas, eject_seconds=30, max_failures=3):
+        """
+        只读副本的选择和健康状态管理。
+        选择当前并发调用最少的健康副本，并发数相同时轮流选择；连续失败 max_failures 次的副本被剔除
+        eject_seconds 秒，到期后放回，再失败一次即重新剔除。
+        :param replicas: 副本连接配置列表
+        :param eject_seconds: 剔除时长（秒）
+        :param max_failures: 触发剔除的连续失败次数
+        """
+        self.replicas = [Replica(settings) for settings in replicas]
+        self.eject_seconds = eject_seconds
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def choose(self, exclude=()):
+        """
+        选择一个副本并计入其并发数，使用结束后必须调用 release()。
+        :param exclude: 本次调用中已经尝试失败的副本
+        :return: Replica 实例，没有可用副本时返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            count = len(self.replicas)
+            best = None
+            for offset in range(count):
+                replica = self.replicas[(self._next + offset) % count]
+                if replica in exclude or replica.ejected_until > now:
+                    continue
+                if best is None or replica.in_flight < best.in_flight:
+                    best = replica
+            if best is None:
+                return None
+            self._next = (self.replicas.index(best) + 1) % count
+            best.in_flight += 1
+            best.reads += 1
+            return best
+
+    def release(self, replica, failed=False):
+        """
+        结束一次调用，更新副本的健康状态。
+        :param replica: choose() 返回的副本
+        :param failed: 为 True 表示连接失败或连接已断开
+        """
+        with self._lock:
+            replica.in_flight -= 1
+            if not failed:
+                replica.failures = 0
+                return
+            replica.errors += 1
+            replica.failures += 1
+            if replica.failures >= self.max_failures:
+                replica.ejected_until = time.monotonic() + self.eject_seconds
+                replica.ejections += 1
+                # 到期放回后只给一次机会
+                replica.failures = self.max_failures - 1
+
+    def stats(self):
+        """
+        获取各副本的统计信息。
+        :return: 统计信息列表（字典形式）
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'replica': replica.name,
+                    'healthy': replica.ejected_until <= now,
+                    'in_flight': replica.in_flight,
+                    'reads': replica.reads,
+                    'errors': replica.errors,
+                    'ejections': replica.ejections,
+                }
+                for replica in self.replicas
+            ]
@@ -0,0 +1,167 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def _estimate_size(value):
+    """
+    粗略估算查询结果占用的内存（字节），用于按总大小淘汰。
+    :param value: 行（字典）、行列表或 None
+    :return: 估算的字节数
+    """
+    rows = value if isinstance(value, list) else [value] if value is not None else []
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for column, item in row.items():
+            size += sys.getsizeof(column) + sys.getsizeof(item)
+    return size
+
+
+class ResultCache:
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=0, table_ttls=None):
+        """
+        按表失效的查询结果缓存（进程内），供 DBHelper.get_records / get_record_by_id 使用。
+        按 LRU 淘汰，同时限制条目数和总大小；写入某张表时失效该表的全部条目。
+        多个 worker 各自持有一份缓存，其他进程写入后最多 TTL 秒内仍可能读到旧数据。
+        :param max_entries: 最多缓存的条目数
+        :param max_bytes: 缓存的总大小上限（字节，估算值）
+        :param ttl: 默认有效期（秒），为 0 时不在 table_ttls 中的表不缓存
+        :param table_ttls: 各表的有效期（秒），例如 {'task': 5}
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.table_ttls = dict(table_ttls or {})
+        self._lock = threading.Lock()
+        # (表名, 列, 条件) -> (过期时间, 结果, 大小)，按最近使用顺序排列
+        self._entries = OrderedDict()
+        # 表名 -> 该表已缓存的键集合，用于按表失效
+        self._keys_by_table = {}
+        # 表名 -> 失效次数，_epoch 为全部失效的次数；查询前后不一致说明期间有写入，结果不再写入缓存
+        self._generations = {}
+        self._epoch = 0
+        # 表名 -> 在该时间之前不写入缓存（副本可能尚未同步），None 表示全部表
+        self._hold_until = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def ttl_for(self, table_name):
+        """
+        获取表的缓存有效期。
+        :param table_name: 表名
+        :return: 有效期（秒），为 0 表示该表不缓存
+        """
+        return self.table_ttls.get(table_name, self.ttl)
+
+    def generation(self, table_name):
+        """
+        获取表的当前版本，查询前取得，写入缓存时传给 set()。
+        """
+        with self._lock:
+            return self._epoch, self._generations.get(table_name, 0)
+
+    def get(self, key):
+        """
+        获取缓存的查询结果。
+        :param key: (表名, 列, 条件)
+        :return: (是否命中, 结果)；结果中的行是副本，调用方可以修改
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return False, None
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return True, _copy(value)
+
+    def set(self, key, value, generation):
+        """
+        写入查询结果，超出容量时淘汰最久未使用的条目。
+        :param key: (表名, 列, 条件)
+        :param value: 查询结果
+        :param generation: 查询前 generation() 的返回值，表在查询期间被写入时放弃缓存
+        """
+        table_name = key[0]
+        ttl = self.ttl_for(table_name)
+        size = _estimate_size(value)
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        value = _copy(value)
+        now = time.monotonic()
+        with self._lock:
+            if (self._epoch, self._generations.get(table_name, 0)) != generation:
+                return
+            if max(self._hold_until.get(table_name, 0), self._hold_until.get(None, 0)) > now:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now + ttl, value, size)
+            self._bytes += size
+            self._keys_by_table.setdefault(table_name, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, table_name=None, hold=0):
+        """
+        失效一张表（为 None 时失效全部表）的缓存条目。
+        :param table_name: 表名
+        :param hold: 在接下来的 hold 秒内不缓存该表的查询结果
+        """
+        with self._lock:
+            if hold:
+                self._hold_until[table_name] = time.monotonic() + hold
+            if table_name is None:
+                self._epoch += 1
+                self._entries.clear()
+                self._keys_by_table.clear()
+                self._bytes = 0
+            else:
+                self._generations[table_name] = self._generations.get(table_name, 0) + 1
+                for key in list(self._keys_by_table.get(table_name, ())):
+                    self._remove(key)
+            self._invalidations += 1
+
+    def _remove(self, key):
+        # 调用方需持有 self._lock
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._keys_by_table.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_table[key[0]]
+
+    def stats(self):
+        """
+        获取缓存统计信息。
+        :return: 统计信息（字典形式）
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+            }
+
+
+def _copy(value):
+    if isinstance(value, list):
+        return [dict(row) for row in value]
+    return dict(value) if value is not None else None
@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+# SQLite 没有行锁，事务以 BEGIN IMMEDIATE 开始并独占写锁，FOR UPDATE [SKIP LOCKED] 直接去掉即可
+_LOCK_CLAUSE = re.compile(r'\s+FOR\s+UPDATE(?:\s+(?:SKIP\s+LOCKED|NOWAIT))?', re.IGNORECASE)
+_INSERT_IGNORE = re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b(.*)$', re.IGNORECASE | re.DOTALL)
+_VALUES_FUNC = re.compile(r'\bVALUES\s*\(\s*(\w+)\s*\)', re.IGNORECASE)
+_PLACEHOLDER = re.compile(r'%[s%]')
+
+# DATETIME 列按 'YYYY-MM-DD HH:MM:SS[.ffffff]' 存储，字符串比较与时间先后一致；读取时还原为 datetime
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+
+
+@lru_cache(maxsize=2048)
+def translate_query(query):
+    """
+    把按 MySQL 语法编写的语句转换为 SQLite 语法：
+    %s 占位符改为 ?，去掉 FOR UPDATE [SKIP LOCKED]，INSERT IGNORE 改为 INSERT OR IGNORE，
+    ON DUPLICATE KEY UPDATE col = VALUES(col) 改为 ON CONFLICT DO UPDATE SET col = excluded.col。
+    :param query: MySQL 语句
+    :return: SQLite 语句
+    """
+    query = _PLACEHOLDER.sub(lambda match: '?' if match.group() == '%s' else '%', query)
+    query = _LOCK_CLAUSE.sub('', query)
+    query = _INSERT_IGNORE.sub('INSERT OR IGNORE', query)
+    match = _ON_DUPLICATE.search(query)
+    if match:
+        assignments = _VALUES_FUNC.sub(r'excluded.\1', match.group(1))
+        query = query[:match.start()] + 'ON CONFLICT DO UPDATE SET' + assignments
+    return query
+
+
+def resolve_database_path(path, config_file):
+    """
+    相对路径按配置文件所在目录解析，从不同的工作目录启动时指向同一个数据库文件。
+    :param path: 配置中的数据库文件路径
+    :param config_file: 配置文件路径
+    :return: 数据库文件路径
+    """
+    if path == ':memory:' or path.startswith('file:') or os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(config_file), path)
+
+
+class SQLiteCursor:
+    def __init__(self, cursor, dictionary=False):
+        """
+        sqlite3 游标的包装，提供 DBHelper 使用的 mysql.connector 游标接口。
+        :param cursor: sqlite3 游标
+        :param dictionary: 为 True 时每行返回字典
+        """
+        self._cursor = cursor
+        self.dictionary = dictionary
+
+    def execute(self, query, params=None):
+        self._cursor.execute(translate_query(query), tuple(params) if params else ())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def column_names(self):
+        description = self._cursor.description
+        return tuple(column[0] for column in description) if description else ()
+
+    def _convert(self, rows):
+        if not self.dictionary:
+            return rows
+        names = self.column_names
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is None or not self.dictionary:
+            return row
+        return dict(zip(self.column_names, row))
+
+    def fetchall(self):
+        return self._convert(self._cursor.fetchall())
+
+    def fetchmany(self, size=1):
+        return self._convert(self._cursor.fetchmany(size))
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, path, busy_timeout=5.0, synchronous='NORMAL'):
+        """
+        SQLite 连接（WAL 模式），接口与 DBHelper 使用的 mysql.connector 连接一致。
+        连接默认处于 autocommit 状态，start_transaction() 以 BEGIN IMMEDIATE 开始显式事务。
+        每个连接只应由一个线程使用，见 DBHelper._acquire()。
+        :param path: 数据库文件路径
+        :param busy_timeout: 等待其他连接释放写锁的最长时间（秒）
+        :param synchronous: PRAGMA synchronous 取值，WAL 模式下 NORMAL 即可保证不损坏数据库
+        """
+        self.path = path
+        self._connection = sqlite3.connect(
+            path,
+            timeout=busy_timeout,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # disconnect() 可能在其他线程中关闭连接
+            check_same_thread=False,
+            uri=path.startswith('file:'),
+        )
+        # WAL 模式下读写互不阻塞，多个线程的读连接可以与一个写连接并发
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(f'PRAGMA synchronous={synchronous}')
+        self._connection.execute('PRAGMA foreign_keys=ON')
+        self._closed = False
+
+    def cursor(self, dictionary=False, buffered=None):
+        """
+        创建游标。sqlite3 游标本身按需逐行读取，buffered 参数只为兼容而保留。
+        """
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def start_transaction(self):
+        # 立即获取写锁，事务中的读-改-写不会与其他连接交错
+        self._connection.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def consume_results(self):
+        # 关闭游标即可丢弃未读完的结果
+        pass
+
+    def is_connected(self):
+        return not self._closed
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._connection.close()
@@ -1,23 +1,127 @@
 import mysql.connector
 from mysql.connector import Error
 import json
+import sqlite3
 
-def read_db_config():
+try:
+    from db.migrate import run_migrations
+    from db.SQLiteBackend import SQLiteConnection, resolve_database_path
+except ImportError:
+    # 在 db 目录下直接运行本脚本时
+    from migrate import run_migrations
+    from SQLiteBackend import SQLiteConnection, resolve_database_path
+
+CONFIG_FILE = 'DBConfig.json'
+
+# 表结构定义，与数据库类型无关，由 render_create_table() 转换为 MySQL 或 SQLite 的建表语句。
+# 列定义为 (列名, 类型, 约束[, 注释])，类型为 'pk'、'int'、'text'、'datetime'、'varchar(n)'
+# 或 ('enum', 取值, ...)。结构变更不要改这里，追加到 migrate.py 中。
+TABLES = [
+    {
+        'name': 'users',
+        'columns': [
+            ('id', 'pk', ''),
+            ('username', 'varchar(50)', 'UNIQUE NOT NULL'),
+            ('password', 'varchar(255)', 'NOT NULL'),
+            ('session_token', 'varchar(255)', ''),
+            ('last_login', 'datetime', ''),
+        ],
+    },
+    {
+        'name': 'task',
+        'columns': [
+            ('id', 'pk', ''),
+            ('user_id', 'int', 'NOT NULL'),
+            ('target', 'int', 'NOT NULL', '今日未标注数量'),
+            ('completed', 'int', 'NOT NULL', '已标注数量'),
+            ('status', ('enum', '未完成', '完成'), "NOT NULL DEFAULT '未完成'"),
+        ],
+        'foreign_keys': [('user_id', 'users(id)')],
+    },
+    {
+        'name': 'annotations',
+        'columns': [
+            ('id', 'pk', ''),
+            ('task_id', 'int', 'NOT NULL'),
+            ('image_name', 'varchar(255)', 'NOT NULL', '图片名称'),
+            ('annotation', 'text', 'NOT NULL', '标注数据'),
+            ('status', ('enum', '未标注', '已标注'), "NOT NULL DEFAULT '未标注'"),
+        ],
+        'foreign_keys': [('task_id', 'task(id)')],
+    },
+]
+
+# 通用类型到各数据库类型的映射
+COLUMN_TYPES = {
+    'mysql': {'pk': 'INT AUTO_INCREMENT PRIMARY KEY', 'int': 'INT', 'text': 'TEXT', 'datetime': 'DATETIME'},
+    'sqlite': {'pk': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'int': 'INTEGER', 'text': 'TEXT', 'datetime': 'DATETIME'},
+}
+
+def read_db_config(config_file=CONFIG_FILE):
     """
     读取数据库配置文件 'DBConfig.json' 并返回数据库配置信息。
     """
-    with open('DBConfig.json', 'r') as config_file:
-        config = json.load(config_file)
+    with open(config_file, 'r') as file:
+        config = json.load(file)
     return config['database']
 
-def create_connection():
+def render_column(dialect, column):
+    """
+    生成一列的定义。
+    :param dialect: 数据库类型，'mysql' 或 'sqlite'
+    :param column: 列定义 (列名, 类型, 约束[, 注释])
+    :return: 列定义语句
+    """
+    name, column_type, constraints = column[:3]
+    comment = column[3] if len(column) > 3 else None
+    check = ''
+    if isinstance(column_type, tuple):
+        values = ', '.join(f"'{value}'" for value in column_type[1:])
+        if dialect == 'mysql':
+            sql_type = f"ENUM({values})"
+        else:
+            # SQLite 没有 ENUM，用 CHECK 约束限制取值
+            sql_type = 'TEXT'
+            check = f" CHECK ({name} IN ({values}))"
+    else:
+        sql_type = COLUMN_TYPES[dialect].get(column_type, column_type.upper())
+    definition = f"{name} {sql_type}"
+    if constraints:
+        definition += f" {constraints}"
+    definition += check
+    if comment and dialect == 'mysql':
+        definition += f" COMMENT '{comment}'"
+    return definition
+
+def render_create_table(dialect, table):
+    """
+    生成建表语句。
+    :param dialect: 数据库类型，'mysql' 或 'sqlite'
+    :param table: TABLES 中的表定义
+    :return: CREATE TABLE IF NOT EXISTS 语句
+    """
+    lines = [render_column(dialect, column) for column in table['columns']]
+    for column, reference in table.get('foreign_keys', []):
+        lines.append(f"FOREIGN KEY ({column}) REFERENCES {reference}")
+    return f"CREATE TABLE IF NOT EXISTS {table['name']} (\n    " + ',\n    '.join(lines) + "\n)"
+
+def create_connection(config_file=CONFIG_FILE):
     """
     创建数据库连接。
     """
-    db_config = read_db_config()
+    db_config = read_db_config(config_file)
     try:
+        if db_config.get('type', 'mysql') == 'sqlite':
+            sqlite_config = db_config.get('sqlite', {})
+            connection = SQLiteConnection(
+                resolve_database_path(sqlite_config.get('path', 'annotation_system.sqlite3'), config_file),
+                busy_timeout=sqlite_config.get('busy_timeout', 5),
+            )
+            print(f"成功打开SQLite数据库 '{connection.path}'")
+            return connection
         connection = mysql.connector.connect(
             host=db_config['host'],
+            port=db_config.get('port', 3306),
             user=db_config['user'],
             password=db_config['password'],
             database=db_config['name']
@@ -25,7 +129,7 @@ def create_connection():
         if connection.is_connected():
             print("成功连接到MySQL服务器")
             return connection
-    except Error as e:
+    except (Error, sqlite3.Error) as e:
         print(f"连接数据库时发生错误: {e}")
         return None
 
@@ -35,48 +139,52 @@ def close_connection(connection):
     """
     if connection.is_connected():
         connection.close()
-        print("MySQL 连接已关闭")
+        print("数据库连接已关闭")
 
-def create_database_and_tables():
+def create_database_and_tables(config_file=CONFIG_FILE):
     """
     创建数据库和表。如果数据库或表已存在，则跳过创建步骤。
+    建表完成后执行尚未执行的结构迁移（索引等），见 migrate.py。
+    :param config_file: 配置文件路径，database.type 决定使用 MySQL 还是 SQLite
     """
-    db_config = read_db_config()
+    db_config = read_db_config(config_file)
+    dialect = db_config.get('type', 'mysql')
     connection = None
     cursor = None
     try:
-        # 连接到MySQL服务器
-        connection = mysql.connector.connect(
-            host=db_config['host'],
-            user=db_config['user'],
-            password=db_config['password']
-        )
-        cursor = connection.cursor()
+        if dialect == 'sqlite':
+            # SQLite 数据库文件在首次连接时自动创建
+            connection = create_connection(config_file)
+            if connection is None:
+                return
+            cursor = connection.cursor()
+        else:
+            # 连接到MySQL服务器
+            connection = mysql.connector.connect(
+                host=db_config['host'],
+                port=db_config.get('port', 3306),
+                user=db_config['user'],
+                password=db_config['password']
+            )
+            cursor = connection.cursor()
 
-        # 创建数据库
-        print(f"正在创建数据库 '{db_config['name']}'...")
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_config['name']}")
-        print(f"数据库 '{db_config['name']}' 创建成功或已存在")
+            # 创建数据库
+            print(f"正在创建数据库 '{db_config['name']}'...")
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_config['name']}")
+            print(f"数据库 '{db_config['name']}' 创建成功或已存在")
 
-        # 使用数据库
-        print(f"正在使用数据库 '{db_config['name']}'...")
-        cursor.execute(f"USE {db_config['name']}")
-        print(f"正在使用数据库 '{db_config['name']}' 成功")
+            # 使用数据库
+            print(f"正在使用数据库 '{db_config['name']}'...")
+            cursor.execute(f"USE {db_config['name']}")
+            print(f"正在使用数据库 '{db_config['name']}' 成功")
 
-        # 创建 users 表
-        print("正在创建表 'users'...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password VARCHAR(255) NOT NULL,
-                session_token VARCHAR(255),
-                last_login DATETIME
-            )
-        """)
-        print("表 'users' 创建成功或已存在")
+        # 按依赖顺序创建 users、task、annotations 表
+        for table in TABLES:
+            print(f"正在创建表 '{table['name']}'...")
+            cursor.execute(render_create_table(dialect, table))
+            print(f"表 '{table['name']}' 创建成功或已存在")
 
-        # 插入测试用户
+        # 插入测试用户（SQLite 连接会把 INSERT IGNORE 转换为 INSERT OR IGNORE）
         print("正在插入测试用户...")
         cursor.execute("""
             INSERT IGNORE INTO users (username, password) 
@@ -84,39 +192,14 @@ def create_database_and_tables():
         """, ('root', '$2a$10$Gk8Y15QeXFna11e31qYKteBPHH9ClVIPakq1aYG56Lv3Z78T2AGSe'))  # 密码为 '251605'
         print("测试用户插入成功或已存在")
 
-        # 创建 task 表
-        print("正在创建表 'task'...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS task (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id INT NOT NULL,
-                target INT NOT NULL COMMENT '今日未标注数量',
-                completed INT NOT NULL COMMENT '已标注数量',
-                status ENUM('未完成', '完成') NOT NULL DEFAULT '未完成',
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-        print("表 'task' 创建成功或已存在")
-
-        # 创建 annotations 表
-        print("正在创建表 'annotations'...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS annotations (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                task_id INT NOT NULL,
-                image_name VARCHAR(255) NOT NULL COMMENT '图片名称',
-                annotation TEXT NOT NULL COMMENT '标注数据',
-                status ENUM('未标注', '已标注') NOT NULL DEFAULT '未标注',
-                FOREIGN KEY (task_id) REFERENCES task(id)
-            )
-        """)
-        print("表 'annotations' 创建成功或已存在")
-
         # 提交事务
         connection.commit()
         print("事务已提交")
 
-    except Error as e:
+        # 执行结构迁移（添加热点查询所需的索引等）
+        run_migrations(connection, db_config['name'], dialect=dialect)
+
+    except (Error, sqlite3.Error) as e:
         print(f"Error: {e}")
         if connection:
             connection.rollback()
@@ -0,0 +1,448 @@
+import argparse
+from datetime import datetime, timedelta
+
+try:
+    from db.AnnotationCodec import decode_text, encode, is_encoded
+except ImportError:
+    # 在 db 目录下直接运行本脚本时
+    from AnnotationCodec import decode_text, encode, is_encoded
+
+# 迁移记录表
+MIGRATIONS_TABLE = 'schema_migrations'
+# 防止多个进程同时执行迁移的命名锁
+MIGRATION_LOCK = 'annotation_system_migrate'
+
+
+class MigrationContext:
+    def __init__(self, connection, database):
+        """
+        迁移执行上下文，封装常用的幂等 DDL 操作。
+        :param connection: 数据库连接
+        :param database: 数据库名称
+        """
+        self.connection = connection
+        self.database = database
+
+    def acquire_lock(self):
+        """
+        获取 MySQL 命名锁，多个进程同时启动时只有一个会执行迁移。
+        """
+        if not self.fetch_one("SELECT GET_LOCK(%s, 60)", (MIGRATION_LOCK,))[0]:
+            raise RuntimeError("等待迁移锁超时，可能有其他进程正在执行迁移")
+
+    def release_lock(self):
+        """
+        释放迁移锁。
+        """
+        self.fetch_one("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+
+    def execute(self, query, params=None):
+        """
+        执行一条 SQL 语句。
+        :param query: SQL 语句
+        :param params: 查询参数（可选）
+        :return: 受影响的行数
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def fetch_one(self, query, params=None):
+        """
+        执行查询并返回第一行结果（元组形式）。
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
+    def fetch_all(self, query, params=None):
+        """
+        执行查询并返回所有结果（元组形式）。
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def index_exists(self, table_name, index_name):
+        """
+        检查索引是否已存在。
+        """
+        return self.fetch_one("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = %s AND table_name = %s AND index_name = %s
+            LIMIT 1
+        """, (self.database, table_name, index_name)) is not None
+
+    def table_exists(self, table_name):
+        """
+        检查表是否已存在。
+        """
+        return self.fetch_one("""
+            SELECT 1 FROM information_schema.tables
+            WHERE table_schema = %s AND table_name = %s
+            LIMIT 1
+        """, (self.database, table_name)) is not None
+
+    def create_table(self, table_name, definitions):
+        """
+        建表。表已存在时跳过。
+        :param table_name: 表名
+        :param definitions: 列和约束定义列表，需同时适用于 MySQL 和 SQLite
+        """
+        if self.table_exists(table_name):
+            print(f"表 '{table_name}' 已存在，跳过")
+            return
+        self.execute(f"CREATE TABLE {table_name} (\n    " + ',\n    '.join(definitions) + "\n)")
+        print(f"表 '{table_name}' 创建成功")
+
+    def column_exists(self, table_name, column_name):
+        """
+        检查列是否已存在。
+        """
+        return self.fetch_one("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s AND column_name = %s
+            LIMIT 1
+        """, (self.database, table_name, column_name)) is not None
+
+    def add_index(self, table_name, index_name, columns, unique=False):
+        """
+        在线添加索引（ALGORITHM=INPLACE, LOCK=NONE，建索引期间表仍可读写）。
+        索引已存在时跳过，因此可以安全地重复执行。
+        :param table_name: 表名
+        :param index_name: 索引名
+        :param columns: 列名列表
+        :param unique: 为 True 时创建唯一索引，已有重复数据时失败
+        """
+        if self.index_exists(table_name, index_name):
+            print(f"索引 '{index_name}' 已存在，跳过")
+            return
+        self.execute(
+            f"ALTER TABLE {table_name} ADD {'UNIQUE ' if unique else ''}INDEX {index_name} ({', '.join(columns)}), "
+            "ALGORITHM=INPLACE, LOCK=NONE"
+        )
+        print(f"索引 '{index_name}' 创建成功")
+
+    def drop_index(self, table_name, index_name):
+        """
+        删除索引。索引不存在时跳过。
+        :param table_name: 表名
+        :param index_name: 索引名
+        """
+        if not self.index_exists(table_name, index_name):
+            print(f"索引 '{index_name}' 不存在，跳过")
+            return
+        self.execute(f"ALTER TABLE {table_name} DROP INDEX {index_name}, ALGORITHM=INPLACE, LOCK=NONE")
+        print(f"索引 '{index_name}' 已删除")
+
+    def add_column(self, table_name, column_name, definition):
+        """
+        在线添加列。列已存在时跳过。
+        :param table_name: 表名
+        :param column_name: 列名
+        :param definition: 列定义，例如 'DATETIME NULL'
+        """
+        if self.column_exists(table_name, column_name):
+            print(f"列 '{table_name}.{column_name}' 已存在，跳过")
+            return
+        self.execute(
+            f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}, "
+            "ALGORITHM=INPLACE, LOCK=NONE"
+        )
+        print(f"列 '{table_name}.{column_name}' 添加成功")
+
+    def column_type(self, table_name, column_name):
+        """
+        获取列的数据类型（小写，例如 'text'、'mediumblob'）。
+        """
+        row = self.fetch_one("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s AND column_name = %s
+        """, (self.database, table_name, column_name))
+        return row[0].lower() if row else None
+
+    def modify_column(self, table_name, column_name, definition):
+        """
+        修改列类型。列已经是目标类型时跳过。
+        修改类型需要重建表（ALGORITHM=COPY），期间表只读，大表请在低峰期执行。
+        :param table_name: 表名
+        :param column_name: 列名
+        :param definition: 列定义，例如 'MEDIUMBLOB NOT NULL'
+        """
+        if self.column_type(table_name, column_name) == definition.split()[0].lower():
+            print(f"列 '{table_name}.{column_name}' 已是 {definition}，跳过")
+            return
+        self.execute(f"ALTER TABLE {table_name} MODIFY COLUMN {column_name} {definition}, LOCK=SHARED")
+        print(f"列 '{table_name}.{column_name}' 已修改为 {definition}")
+
+
+class SQLiteMigrationContext(MigrationContext):
+    """
+    SQLite 的迁移上下文：通过 PRAGMA 查询结构，DDL 不需要 ALGORITHM/LOCK 选项。
+    connection 为 SQLiteConnection，%s 占位符由其自动转换。
+    """
+
+    def acquire_lock(self):
+        # SQLite 用于单机部署，迁移由 create_database / migrate 单进程执行
+        pass
+
+    def release_lock(self):
+        pass
+
+    def index_exists(self, table_name, index_name):
+        return self.fetch_one(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+            (table_name, index_name)
+        ) is not None
+
+    def table_exists(self, table_name):
+        return self.fetch_one(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (table_name,)
+        ) is not None
+
+    def column_exists(self, table_name, column_name):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA table_info({table_name})")
+            return any(row[1] == column_name for row in cursor.fetchall())
+        finally:
+            cursor.close()
+
+    def add_index(self, table_name, index_name, columns, unique=False):
+        if self.index_exists(table_name, index_name):
+            print(f"索引 '{index_name}' 已存在，跳过")
+            return
+        self.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {index_name} ON {table_name} ({', '.join(columns)})")
+        print(f"索引 '{index_name}' 创建成功")
+
+    def drop_index(self, table_name, index_name):
+        if not self.index_exists(table_name, index_name):
+            print(f"索引 '{index_name}' 不存在，跳过")
+            return
+        self.execute(f"DROP INDEX {index_name}")
+        print(f"索引 '{index_name}' 已删除")
+
+    def add_column(self, table_name, column_name, definition):
+        if self.column_exists(table_name, column_name):
+            print(f"列 '{table_name}.{column_name}' 已存在，跳过")
+            return
+        self.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}")
+        print(f"列 '{table_name}.{column_name}' 添加成功")
+
+    def modify_column(self, table_name, column_name, definition):
+        # SQLite 按值保存类型，TEXT 列中可以直接存放 BLOB，无需修改列定义
+        print(f"SQLite 无需修改列 '{table_name}.{column_name}' 的类型，跳过")
+
+
+# 各数据库类型对应的迁移上下文
+MIGRATION_CONTEXTS = {
+    'mysql': MigrationContext,
+    'sqlite': SQLiteMigrationContext,
+}
+
+
+def _add_users_session_token_index(ctx):
+    # get_user_by_token / logout 按 session_token 查询
+    ctx.add_index('users', 'idx_users_session_token', ['session_token'])
+
+
+def _add_annotations_task_status_index(ctx):
+    # 标注员领取任务时按 task_id + status 过滤
+    ctx.add_index('annotations', 'idx_annotations_task_status', ['task_id', 'status'])
+
+
+def _add_task_user_status_index(ctx):
+    # 按用户查询未完成的任务
+    ctx.add_index('task', 'idx_task_user_status', ['user_id', 'status'])
+
+
+def _add_annotations_lease_columns(ctx):
+    # 标注员领取任务的租约：领取人和租约到期时间，到期后可被其他人重新领取
+    ctx.add_column('annotations', 'claimed_by', 'INT NULL')
+    ctx.add_column('annotations', 'claimed_until', 'DATETIME NULL')
+
+
+def _add_annotations_content_hash(ctx):
+    # 导入数据时按图片内容的 SHA-256 去重，见 func/Ingest.py
+    ctx.add_column('annotations', 'content_hash', 'CHAR(64) NULL')
+    ctx.add_index('annotations', 'idx_annotations_content_hash', ['content_hash'])
+
+
+def _encode_annotations(ctx, batch_size=1000):
+    # 标注内容改为二进制编码（版本号 + 标志位 + 可选的 zlib 压缩），见 db/AnnotationCodec.py
+    ctx.modify_column('annotations', 'annotation', 'MEDIUMBLOB NOT NULL')
+    # 按 id 分批转换并逐批提交，不长时间锁表；已编码的行会被跳过，中断后重新执行即可继续
+    last_id = 0
+    converted = 0
+    while True:
+        rows = ctx.fetch_all(
+            # FOR UPDATE：转换期间该批数据不会被并发提交覆盖（SQLite 会忽略）
+            "SELECT id, annotation FROM annotations WHERE id > %s ORDER BY id LIMIT %s FOR UPDATE",
+            (last_id, batch_size)
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        pending = [(annotation_id, encode(decode_text(data))) for annotation_id, data in rows if not is_encoded(data)]
+        if pending:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(pending))
+            placeholders = ', '.join(['%s'] * len(pending))
+            ctx.execute(
+                f"UPDATE annotations SET annotation = CASE id {cases} END WHERE id IN ({placeholders})",
+                tuple(value for item in pending for value in item) + tuple(item[0] for item in pending)
+            )
+            converted += len(pending)
+        ctx.connection.commit()
+    print(f"已转换 {converted} 条标注数据")
+
+
+def _add_sessions_table(ctx):
+    # 会话从 users.session_token 移到独立的 sessions 表，每个用户可以有多个会话（设备），见 func/SessionStore.py
+    ctx.create_table('sessions', [
+        'token VARCHAR(64) PRIMARY KEY',
+        'user_id INT NOT NULL',
+        'device VARCHAR(255) NULL',
+        'ip VARCHAR(45) NULL',
+        'created_at DATETIME NOT NULL',
+        'expires_at DATETIME NOT NULL',
+        'FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE',
+    ])
+    ctx.add_index('sessions', 'idx_sessions_user_id', ['user_id'])
+    # 后台按到期时间批量清理
+    ctx.add_index('sessions', 'idx_sessions_expires_at', ['expires_at'])
+    # 保留已登录用户的会话，一天后过期（JWT 本身的有效期更短）
+    now = datetime.now()
+    copied = ctx.execute(
+        "INSERT IGNORE INTO sessions (token, user_id, created_at, expires_at) "
+        "SELECT session_token, id, COALESCE(last_login, %s), %s FROM users WHERE session_token IS NOT NULL",
+        (now, now + timedelta(days=1))
+    )
+    ctx.execute("UPDATE users SET session_token = NULL WHERE session_token IS NOT NULL")
+    print(f"已迁移 {max(copied, 0)} 个会话")
+
+
+def _unique_annotations_content_hash(ctx):
+    # 导入时只在同一任务内按内容哈希去重，唯一索引保证并发导入同一任务时不会写入重复数据，
+    # Ingest 用 INSERT IGNORE 跳过冲突的记录
+    # 先清除同一任务内重复记录的 content_hash（保留最早的一条），否则无法创建唯一索引；
+    # 多个 NULL 不违反唯一约束
+    cleared = ctx.execute(
+        "UPDATE annotations SET content_hash = NULL WHERE id IN ("
+        "SELECT id FROM (SELECT a.id FROM annotations a JOIN annotations b "
+        "ON a.task_id = b.task_id AND a.content_hash = b.content_hash AND a.id > b.id) AS duplicates)"
+    )
+    print(f"已清除 {max(cleared, 0)} 条重复记录的 content_hash")
+    ctx.add_index('annotations', 'uniq_annotations_task_content_hash', ['task_id', 'content_hash'], unique=True)
+    ctx.drop_index('annotations', 'idx_annotations_content_hash')
+
+
+# 按版本号排序的迁移列表：(版本号, 名称, 迁移函数)。
+# 已发布的迁移不要修改，新的变更追加到末尾。
+MIGRATIONS = [
+    (1, 'add_users_session_token_index', _add_users_session_token_index),
+    (2, 'add_annotations_task_status_index', _add_annotations_task_status_index),
+    (3, 'add_task_user_status_index', _add_task_user_status_index),
+    (4, 'add_annotations_lease_columns', _add_annotations_lease_columns),
+    (5, 'add_annotations_content_hash', _add_annotations_content_hash),
+    (6, 'encode_annotations', _encode_annotations),
+    (7, 'add_sessions_table', _add_sessions_table),
+    (8, 'unique_annotations_content_hash', _unique_annotations_content_hash),
+]
+
+
+def _ensure_migrations_table(ctx):
+    ctx.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """)
+
+
+def get_applied_versions(connection):
+    """
+    获取已执行的迁移版本号。
+    :param connection: 数据库连接
+    :return: 版本号集合
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT version FROM {MIGRATIONS_TABLE}")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def run_migrations(connection, database, target=None, dialect='mysql'):
+    """
+    按顺序执行尚未执行的迁移，并在 schema_migrations 表中记录。
+    MySQL 下执行期间持有命名锁，多个进程同时启动时只有一个会执行迁移。
+    :param connection: 数据库连接（需已选中目标数据库）
+    :param database: 数据库名称
+    :param target: 目标版本号，默认执行到最新
+    :param dialect: 数据库类型，'mysql' 或 'sqlite'
+    :return: 本次执行的迁移版本号列表
+    """
+    ctx = MIGRATION_CONTEXTS[dialect](connection, database)
+    ctx.acquire_lock()
+    applied = []
+    try:
+        _ensure_migrations_table(ctx)
+        done = get_applied_versions(connection)
+        for version, name, migration in MIGRATIONS:
+            if version in done:
+                continue
+            if target is not None and version > target:
+                break
+            print(f"正在执行迁移 {version}: {name}...")
+            migration(ctx)
+            ctx.execute(
+                f"INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (%s, %s, %s)",
+                (version, name, datetime.now())
+            )
+            connection.commit()
+            applied.append(version)
+            print(f"迁移 {version} 执行成功")
+    finally:
+        ctx.release_lock()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="执行数据库结构迁移")
+    parser.add_argument('--target', type=int, default=None, help="目标版本号，默认执行到最新")
+    parser.add_argument('--list', action='store_true', help="只列出迁移及其执行状态")
+    args = parser.parse_args()
+
+    from create_database import create_connection, close_connection, read_db_config
+
+    db_config = read_db_config()
+    dialect = db_config.get('type', 'mysql')
+    connection = create_connection()
+    if connection is None:
+        return
+    try:
+        if args.list:
+            _ensure_migrations_table(MIGRATION_CONTEXTS[dialect](connection, db_config['name']))
+            done = get_applied_versions(connection)
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:>4}  {'已执行' if version in done else '未执行'}  {name}")
+        else:
+            applied = run_migrations(connection, db_config['name'], args.target, dialect)
+            print(f"共执行 {len(applied)} 个迁移")
+    finally:
+        close_connection(connection)
+
+
+if __name__ == "__main__":
+    main()
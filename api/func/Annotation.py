@@ -0,0 +1,221 @@
+from datetime import datetime, timedelta
+
+from db.AnnotationCodec import decode, encode_value
+from db.AsyncDBHelper import AsyncDBHelper
+
+class Annotation:
+    def __init__(self, db_helper, async_db=None, lease_seconds=600, max_claim=100, lookahead=0):
+        """
+        初始化 Annotation 类。
+        :param db_helper: DBHelper 实例，用于数据库操作
+        :param async_db: AsyncDBHelper 实例，供异步方法使用；默认基于 db_helper 创建
+        :param lease_seconds: 领取的标注数据的租约时长（秒），到期未提交的数据可被重新领取
+        :param max_claim: 单次最多领取的数据条数
+        :param lookahead: 领取时额外返回的后续图片数（预读窗口），不锁定也不领取这些数据
+        """
+        self.db = db_helper
+        self.async_db = async_db or AsyncDBHelper(db_helper)
+        self.lease_seconds = lease_seconds
+        self.max_claim = max_claim
+        self.lookahead = lookahead
+
+    def get_active_task(self, user_id, task_id=None):
+        """
+        获取用户当前未完成的任务。
+        :param user_id: 用户 ID
+        :param task_id: 指定任务 ID（可选），必须属于该用户
+        :return: 任务信息（字典形式），没有未完成的任务时返回 None
+        """
+        if task_id is not None:
+            return self.db.fetch_one(
+                "SELECT id, target, completed, status FROM task WHERE id = %s AND user_id = %s",
+                (task_id, user_id)
+            )
+        return self.db.fetch_one(
+            "SELECT id, target, completed, status FROM task "
+            "WHERE user_id = %s AND status = '未完成' ORDER BY id LIMIT 1",
+            (user_id,)
+        )
+
+    def claim(self, user_id, count, task_id=None):
+        """
+        为用户领取当前任务中接下来 count 条未标注的数据。
+        在一个事务中用 FOR UPDATE SKIP LOCKED 锁定候选行，并发领取的标注员会跳过彼此锁定的行，
+        不会领到同一条数据。租约已过期的数据会被自动重新领取；用户自己未到期的数据会续租并再次返回。
+        :param user_id: 用户 ID
+        :param count: 要领取的条数（会被限制在 1 到 max_claim 之间）
+        :param task_id: 指定任务 ID（可选），默认为用户第一个未完成的任务
+        :return: 领取结果（字典形式），没有可用任务时返回 None。
+                 prefetch 为领取的数据之后接下来的 lookahead 个图片名称，供客户端和服务端提前加载
+        """
+        count = min(max(count, 1), self.max_claim)
+        now = datetime.now()
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        with self.db.transaction():
+            task = self.get_active_task(user_id, task_id)
+            if not task:
+                return None
+
+            items = self.db.fetch_all(
+                "SELECT id, image_name FROM annotations "
+                "WHERE task_id = %s AND status = '未标注' "
+                "AND (claimed_until IS NULL OR claimed_until < %s OR claimed_by = %s) "
+                "ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED",
+                (task['id'], now, user_id, count)
+            )
+            if items:
+                ids = [item['id'] for item in items]
+                placeholders = ', '.join(['%s'] * len(ids))
+                self.db.execute_query(
+                    f"UPDATE annotations SET claimed_by = %s, claimed_until = %s WHERE id IN ({placeholders})",
+                    (user_id, lease_until, *ids)
+                )
+
+            prefetch = []
+            if items and self.lookahead:
+                # 只读取，不加锁：窗口中的数据可能被其他标注员领走，预取落空只影响命中率
+                rows = self.db.fetch_all(
+                    "SELECT image_name FROM annotations "
+                    "WHERE task_id = %s AND status = '未标注' AND id > %s "
+                    "AND (claimed_until IS NULL OR claimed_until < %s OR claimed_by = %s) "
+                    "ORDER BY id LIMIT %s",
+                    (task['id'], ids[-1], now, user_id, self.lookahead)
+                )
+                prefetch = [row['image_name'] for row in rows]
+        return {
+            'task_id': task['id'],
+            'lease_until': lease_until.isoformat(),
+            'items': items,
+            'prefetch': prefetch,
+        }
+
+    async def claim_async(self, user_id, count, task_id=None):
+        """
+        异步领取标注数据，整个事务在一个数据库线程中完成。
+        """
+        return await self.async_db.run(self.claim, user_id, count, task_id)
+
+    def submit(self, user_id, results, task_id=None):
+        """
+        批量提交标注结果。在一个事务中写入所有结果，并按实际发生变化的行数递增 task.completed，
+        completed 达到 target 时把任务状态改为“完成”。这样任务进度始终是 O(1) 读取，无需 COUNT(*)。
+        只有当前用户领取的、仍为“未标注”的数据会被更新，重复提交不会重复计数。
+        :param user_id: 用户 ID
+        :param results: 标注结果列表，元素为 {'id': 标注数据 ID, 'annotation': 标注内容}
+        :param task_id: 任务 ID（可选），默认为用户第一个未完成的任务
+        :return: 提交结果（字典形式），没有可用任务时返回 None
+        """
+        # 同一条数据提交多次时以最后一次为准；标注内容以紧凑的二进制格式保存，见 db/AnnotationCodec.py
+        annotations = {}
+        for result in results:
+            annotations[result['id']] = encode_value(result['annotation'])
+
+        changed = 0
+        with self.db.transaction():
+            task = self.get_active_task(user_id, task_id)
+            if not task:
+                return None
+
+            items = list(annotations.items())
+            chunk_size = self.db.bulk_chunk_size
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+                placeholders = ', '.join(['%s'] * len(chunk))
+                params = [value for item in chunk for value in item]
+                params += [task['id'], user_id] + [annotation_id for annotation_id, _ in chunk]
+                changed += self.db.execute_query(
+                    f"UPDATE annotations SET annotation = CASE id {cases} END, "
+                    "status = '已标注', claimed_by = NULL, claimed_until = NULL "
+                    "WHERE task_id = %s AND status = '未标注' AND claimed_by = %s "
+                    f"AND id IN ({placeholders})",
+                    tuple(params)
+                )
+
+            if changed:
+                # status 写在 completed 之前，两种数据库下判断使用的都是递增前的 completed
+                self.db.execute_query(
+                    "UPDATE task SET status = CASE WHEN completed + %s >= target THEN '完成' ELSE status END, "
+                    "completed = completed + %s WHERE id = %s",
+                    (changed, changed, task['id'])
+                )
+                task = self.db.fetch_one(
+                    "SELECT id, target, completed, status FROM task WHERE id = %s", (task['id'],)
+                )
+        return {
+            'task_id': task['id'],
+            'submitted': changed,
+            'target': task['target'],
+            'completed': task['completed'],
+            'status': task['status'],
+        }
+
+    async def submit_async(self, user_id, results, task_id=None):
+        """
+        异步批量提交标注结果，整个事务在一个数据库线程中完成。
+        """
+        return await self.async_db.run(self.submit, user_id, results, task_id)
+
+    def list_items(self, user_id, task_id=None, status=None, start_after=None, limit=100,
+                   include_annotation=False):
+        """
+        按 id 分页列出任务中的标注数据。默认不读取标注内容列，列表页不需要传输和解码标注内容；
+        include_annotation 为 True 时才读取并解码。
+        :param user_id: 用户 ID
+        :param task_id: 任务 ID（可选），必须属于该用户，默认为用户第一个未完成的任务
+        :param status: 只列出该状态（'未标注' 或 '已标注'）的数据（可选）
+        :param start_after: 只列出 id 大于该值的数据，用于翻页
+        :param limit: 每页条数（会被限制在 1 到 max_claim 之间）
+        :param include_annotation: 为 True 时同时返回标注内容
+        :return: 列表结果（字典形式），没有可用任务时返回 None
+        """
+        task = self.get_active_task(user_id, task_id)
+        if not task:
+            return None
+        limit = min(max(limit, 1), self.max_claim)
+        columns = 'id, image_name, status' + (', annotation' if include_annotation else '')
+        clauses = ['task_id = %s']
+        params = [task['id']]
+        if status is not None:
+            clauses.append('status = %s')
+            params.append(status)
+        if start_after is not None:
+            clauses.append('id > %s')
+            params.append(start_after)
+        items = self.db.fetch_all(
+            f"SELECT {columns} FROM annotations WHERE {' AND '.join(clauses)} ORDER BY id LIMIT %s",
+            (*params, limit)
+        )
+        if include_annotation:
+            for item in items:
+                item['annotation'] = decode(item['annotation'])
+        return {
+            'task_id': task['id'],
+            'items': items,
+            'next_start_after': items[-1]['id'] if len(items) == limit else None,
+        }
+
+    async def list_items_async(self, user_id, task_id=None, status=None, start_after=None, limit=100,
+                               include_annotation=False):
+        """
+        异步列出任务中的标注数据。
+        """
+        return await self.async_db.run(self.list_items, user_id, task_id, status, start_after, limit,
+                                       include_annotation)
+
+    def get_progress(self, user_id):
+        """
+        获取用户所有任务的进度，直接读取 task 表中递增维护的计数。
+        :param user_id: 用户 ID
+        :return: 任务进度列表（字典形式）
+        """
+        return self.db.fetch_all(
+            "SELECT id, target, completed, status FROM task WHERE user_id = %s ORDER BY id",
+            (user_id,)
+        )
+
+    async def get_progress_async(self, user_id):
+        """
+        异步获取用户所有任务的进度。
+        """
+        return await self.async_db.run(self.get_progress, user_id)
@@ -0,0 +1,207 @@
+import argparse
+import json
+import sys
+import zlib
+
+from db.AnnotationCodec import decode, json_text
+
+# 每次产出的数据块大小（未压缩），避免逐行产出时的调用开销
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = ('jsonl', 'coco')
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class DatasetExporter:
+    def __init__(self, db_helper, batch_size=1000, compress_level=6):
+        """
+        流式导出标注数据集。数据按 id 键集分页读取（DBHelper.iter_records），
+        边读边编码、边压缩，内存占用与数据集大小无关。
+        :param db_helper: DBHelper 实例
+        :param batch_size: 每批从数据库读取的行数
+        :param compress_level: gzip 压缩级别（1-9）
+        """
+        self.db = db_helper
+        self.batch_size = batch_size
+        self.compress_level = compress_level
+
+    @classmethod
+    def from_settings(cls, db_helper, settings):
+        """
+        根据配置节 'export' 创建实例。
+        :param db_helper: DBHelper 实例
+        :param settings: 配置信息（字典形式）
+        :return: DatasetExporter 实例
+        """
+        return cls(
+            db_helper,
+            batch_size=settings.get('batch_size', 1000),
+            compress_level=settings.get('compress_level', 6),
+        )
+
+    def iter_rows(self, task_id=None, start_after=None, include_unlabeled=False,
+                  columns=('task_id', 'image_name', 'annotation')):
+        """
+        逐行读取要导出的标注数据。
+        :param task_id: 只导出该任务（或任务 ID 列表中各任务）的数据（可选），默认导出整个数据集
+        :param start_after: 只导出 id 大于该值的数据，用于断点续传
+        :param include_unlabeled: 为 True 时同时导出未标注的数据
+        :param columns: 要读取的列，不需要标注内容时不要读取 annotation
+        :return: 逐行产出 (id, *columns) 的生成器，默认为 (id, task_id, image_name, annotation)
+        """
+        conditions = {}
+        if task_id is not None:
+            conditions['task_id'] = task_id
+        if not include_unlabeled:
+            conditions['status'] = '已标注'
+        return self.db.iter_records(
+            'annotations', conditions, columns=list(columns),
+            batch_size=self.batch_size, as_dict=False, start_after=start_after,
+        )
+
+    def _jsonl(self, rows):
+        # 每行一个 JSON 对象，id 可作为下次续传的 start_after；
+        # 标注内容已是 JSON 文本时直接拼接，不解析也不重新序列化
+        for annotation_id, task_id, image_name, annotation in rows:
+            yield '{"id":%s,"task_id":%s,"image_name":%s,"annotation":%s}\n' % (
+                _dumps(annotation_id), _dumps(task_id), _dumps(image_name), json_text(annotation))
+
+    def _coco(self, task_id, start_after, include_unlabeled):
+        """
+        COCO 格式需要先输出 images 再输出 annotations，因此读取两遍数据；类别在第二遍中收集，最后输出。
+        标注内容为对象列表（或带 annotations 列表的对象）时，每个对象作为一条 COCO 标注，
+        以 category_id 或 category/label 名称确定类别；其他形式的标注内容原样放在 attributes 中。
+        """
+        yield '{"info":' + _dumps({'description': 'annotation_system export', 'task_id': task_id,
+                                   'start_after': start_after}) + ',"images":['
+        separator = ''
+        # 第一遍只读取图片名称，不读取标注内容
+        for annotation_id, image_name in self.iter_rows(task_id, start_after, include_unlabeled, ['image_name']):
+            yield separator + _dumps({'id': annotation_id, 'file_name': image_name})
+            separator = ','
+
+        yield '],"annotations":['
+        categories = {}  # 类别 ID -> 类别
+        category_ids = {}  # 类别名称 -> 类别 ID
+        separator = ''
+        next_id = 1
+        for annotation_id, annotation in self.iter_rows(task_id, start_after, include_unlabeled, ['annotation']):
+            content = decode(annotation)
+            if isinstance(content, dict) and isinstance(content.get('annotations'), list):
+                content = content['annotations']
+            objects = content if isinstance(content, list) else [{'attributes': content}]
+            for item in objects:
+                if not isinstance(item, dict):
+                    item = {'attributes': item}
+                # 生成的 id 和 image_id 覆盖标注内容中的同名键，保证标注 ID 唯一且指向 images 中的图片
+                entry = dict(item, id=next_id, image_id=annotation_id)
+                next_id += 1
+                name = entry.pop('category', None)
+                if name is None:
+                    name = entry.pop('label', None)
+                category_id = entry.get('category_id')
+                if category_id is None and name is not None:
+                    # 只有类别名称时按出现顺序分配类别 ID
+                    category_id = category_ids.setdefault(str(name), len(category_ids) + 1)
+                    entry['category_id'] = category_id
+                if category_id is not None and category_id not in categories:
+                    categories[category_id] = {'id': category_id, 'name': str(category_id if name is None else name)}
+                yield separator + _dumps(entry)
+                separator = ','
+
+        yield '],"categories":' + _dumps(list(categories.values())) + '}\n'
+
+    def export(self, export_format='jsonl', task_id=None, start_after=None, compress=False, include_unlabeled=False,
+               user_id=None):
+        """
+        流式导出数据集。
+        :param export_format: 'jsonl' 或 'coco'
+        :param task_id: 只导出该任务的数据（可选）
+        :param start_after: 只导出 id 大于该值的数据，用于断点续传
+        :param compress: 为 True 时输出 gzip 压缩的数据
+        :param include_unlabeled: 为 True 时同时导出未标注的数据
+        :param user_id: 未指定 task_id 时只导出该用户的任务（可选），默认导出所有用户的数据
+        :return: 逐块产出字节串的生成器
+        """
+        if export_format not in FORMATS:
+            raise ValueError(f"不支持的导出格式: {export_format}")
+        if task_id is None and user_id is not None:
+            # 导出开始后新建的任务不包含在内
+            task_id = [row['id'] for row in self.db.fetch_all("SELECT id FROM task WHERE user_id = %s", (user_id,))]
+        if export_format == 'jsonl':
+            pieces = self._jsonl(self.iter_rows(task_id, start_after, include_unlabeled))
+        else:
+            pieces = self._coco(task_id, start_after, include_unlabeled)
+
+        # wbits=31 输出带 gzip 头的流，可直接保存为 .gz 文件
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, 31) if compress else None
+        buffer = []
+        size = 0
+        for piece in pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= CHUNK_SIZE:
+                data = ''.join(buffer).encode('utf-8')
+                buffer, size = [], 0
+                data = compressor.compress(data) if compressor else data
+                if data:
+                    yield data
+        data = ''.join(buffer).encode('utf-8')
+        if compressor:
+            data = compressor.compress(data) + compressor.flush()
+        if data:
+            yield data
+
+    def export_to_file(self, output, **options):
+        """
+        导出到文件，参数同 export()。
+        :param output: 文件路径，'-' 表示标准输出
+        :return: 写入的字节数
+        """
+        written = 0
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for data in self.export(**options):
+                stream.write(data)
+                written += len(data)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+        return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出标注数据集")
+    parser.add_argument('--format', choices=FORMATS, default='jsonl', help="导出格式")
+    parser.add_argument('--task-id', type=int, default=None, help="只导出该任务的数据，默认导出整个数据集")
+    parser.add_argument('--start-after', type=int, default=None, help="只导出 id 大于该值的数据，用于断点续传")
+    parser.add_argument('--include-unlabeled', action='store_true', help="同时导出未标注的数据")
+    parser.add_argument('--gzip', action='store_true', help="gzip 压缩（输出文件名以 .gz 结尾时自动启用）")
+    parser.add_argument('--output', default='-', help="输出文件，默认为标准输出")
+    args = parser.parse_args()
+
+    from db.DBHelper import DBHelper
+    from func.Settings import CONFIG_FILE, load_settings
+
+    db_helper = DBHelper(CONFIG_FILE)
+    exporter = DatasetExporter.from_settings(db_helper, load_settings('export'))
+    try:
+        written = exporter.export_to_file(
+            args.output,
+            export_format=args.format,
+            task_id=args.task_id,
+            start_after=args.start_after,
+            compress=args.gzip or args.output.endswith('.gz'),
+            include_unlabeled=args.include_unlabeled,
+        )
+    finally:
+        db_helper.disconnect()
+    if args.output != '-':
+        print(f"导出完成: {args.output}，共 {written} 字节")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+
+try:
+    from PIL import Image
+except ImportError:
+    # 未安装 Pillow 时不生成缩略图，列表页直接使用原图
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+def _make_thumbnail(source, target, size, quality):
+    """
+    在工作进程中执行：生成 JPEG 缩略图，先写临时文件再原子替换。
+    :param source: 原图路径
+    :param target: 缩略图路径
+    :param size: 最长边（像素）
+    :param quality: JPEG 质量
+    :return: 缩略图文件大小（字节）
+    """
+    with Image.open(source) as image:
+        # JPEG 解码时直接按比例缩小，避免解码完整分辨率
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        temp_file = f"{target}.{os.getpid()}.tmp"
+        image.save(temp_file, 'JPEG', quality=quality, optimize=True)
+    os.replace(temp_file, target)
+    return os.path.getsize(target)
+
+
+def cache_headers(stat, max_age):
+    """
+    根据文件状态生成缓存相关的响应头。
+    :param stat: os.stat 的结果
+    :param max_age: 浏览器缓存时间（秒），为 0 时每次使用前都需要验证
+    :return: 响应头（字典形式）
+    """
+    return {
+        'ETag': f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        # 图片需要登录才能访问，只允许浏览器缓存，不允许共享缓存
+        'Cache-Control': f"private, max-age={max_age}" if max_age else "private, no-cache",
+    }
+
+
+def is_not_modified(request_headers, etag, mtime):
+    """
+    判断条件请求是否可以返回 304：优先比较 If-None-Match，没有时比较 If-Modified-Since。
+    :param request_headers: 请求头
+    :param etag: 当前的 ETag
+    :param mtime: 文件修改时间（时间戳）
+    :return: 客户端缓存仍然有效时返回 True
+    """
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class ImageStore:
+    def __init__(self, root='data', cache_dir='db/thumbnails', max_cache_bytes=1024 * 1024 * 1024,
+                 thumbnail_sizes=(256, 1024), workers=None, quality=85):
+        """
+        图片文件和缩略图缓存。
+        缩略图保存在磁盘上，总大小超过上限时按最近使用时间淘汰；缩略图由后台进程池生成，
+        请求路径上只读取现成的文件，从不解码原图。
+        :param root: 图片根目录，annotations.image_name 为相对该目录的路径
+        :param cache_dir: 缩略图缓存目录
+        :param max_cache_bytes: 缩略图缓存的总大小上限（字节）
+        :param thumbnail_sizes: 允许的缩略图尺寸（最长边像素）
+        :param workers: 生成缩略图的进程数，默认为 CPU 核数的一半
+        :param quality: 缩略图 JPEG 质量
+        """
+        self.root = os.path.realpath(root)
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.thumbnail_sizes = tuple(thumbnail_sizes)
+        self.workers = workers or max(1, (os.cpu_count() or 1) // 2)
+        self.quality = quality
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()
+        # 缓存文件路径 -> 大小，按最近使用时间排序（最旧的在前）
+        self._entries = OrderedDict()
+        self._cache_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._failures = 0
+        if self.enabled:
+            self._load_cache()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        根据配置节 'images' 创建实例。
+        :param settings: 配置信息（字典形式）
+        :return: ImageStore 实例
+        """
+        return cls(
+            root=settings.get('root', 'data'),
+            cache_dir=settings.get('cache_dir', 'db/thumbnails'),
+            max_cache_bytes=settings.get('cache_max_mb', 1024) * 1024 * 1024,
+            thumbnail_sizes=settings.get('thumbnail_sizes', (256, 1024)),
+            workers=settings.get('workers') or None,
+            quality=settings.get('quality', 85),
+        )
+
+    @property
+    def enabled(self):
+        """
+        是否可以生成缩略图（需要安装 Pillow）。
+        """
+        return Image is not None
+
+    def _load_cache(self):
+        """
+        启动时扫描缓存目录，按文件修改时间（命中时会更新）恢复 LRU 顺序。
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for directory, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(directory, name)
+                if name.endswith('.tmp'):
+                    # 上次退出时未写完的临时文件
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._entries[path] = size
+            self._cache_bytes += size
+        self._evict()
+
+    def resolve(self, image_name):
+        """
+        把 image_name 解析为根目录下的文件路径，拒绝根目录之外的路径。
+        :param image_name: 图片名称（相对路径）
+        :return: 文件路径，不存在或越界时返回 None
+        """
+        path = os.path.realpath(os.path.join(self.root, image_name))
+        if os.path.commonpath([self.root, path]) != self.root or not os.path.isfile(path):
+            return None
+        return path
+
+    def _cache_path(self, image_name, stat, size):
+        # 键中包含原图的修改时间和大小，原图被替换后自动生成新的缩略图
+        key = hashlib.sha1(f"{image_name}\0{stat.st_mtime_ns}\0{stat.st_size}\0{size}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.jpg')
+
+    def get_thumbnail(self, image_name, size):
+        """
+        获取缩略图。缓存中没有时安排后台生成并立即返回 None，调用方可先使用原图。
+        :param image_name: 图片名称
+        :param size: 缩略图尺寸，必须在 thumbnail_sizes 中
+        :return: 缩略图文件路径，尚未生成时返回 None
+        """
+        source = self.resolve(image_name)
+        if source is None or not self.enabled:
+            return None
+        target = self._cache_path(image_name, os.stat(source), size)
+        with self._lock:
+            if target in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(target)
+                hit = True
+            else:
+                self._misses += 1
+                hit = False
+        if hit:
+            try:
+                # 更新修改时间，重启后仍能恢复 LRU 顺序
+                os.utime(target)
+                return target
+            except FileNotFoundError:
+                with self._lock:
+                    self._forget(target)
+        self._schedule(source, target, size)
+        return None
+
+    def prefetch(self, image_names, size):
+        """
+        预先生成一批图片的缩略图（例如标注员刚领取的数据）。
+        :param image_names: 图片名称列表
+        :param size: 缩略图尺寸
+        """
+        if not self.enabled:
+            return
+        for image_name in image_names:
+            source = self.resolve(image_name)
+            if source is None:
+                continue
+            target = self._cache_path(image_name, os.stat(source), size)
+            with self._lock:
+                cached = target in self._entries
+            if not cached:
+                self._schedule(source, target, size)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 与密码哈希相同，使用 spawn 启动工作进程
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+        return self._executor
+
+    def _schedule(self, source, target, size):
+        """
+        提交缩略图生成任务，同一缩略图同时只生成一次。
+        """
+        with self._lock:
+            if target in self._pending:
+                return
+            self._pending.add(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        future = self._get_executor().submit(_make_thumbnail, source, target, size, self.quality)
+        future.add_done_callback(lambda done: self._on_done(target, done))
+
+    def _on_done(self, target, future):
+        with self._lock:
+            self._pending.discard(target)
+            try:
+                size = future.result()
+            except Exception as e:
+                self._failures += 1
+                logger.warning("生成缩略图失败 %s: %s", target, e)
+                return
+            self._entries[target] = size
+            self._cache_bytes += size
+            self._evict()
+
+    def _forget(self, path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._cache_bytes -= size
+
+    def _evict(self):
+        """
+        缓存超过上限时删除最久未使用的缩略图。调用方需持有锁（初始化时除外）。
+        """
+        while self._cache_bytes > self.max_cache_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._cache_bytes -= size
+            self._evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """
+        获取缩略图缓存统计信息。
+        :return: 统计信息（字典形式）
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._cache_bytes,
+                'max_bytes': self.max_cache_bytes,
+                'pending': len(self._pending),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'failures': self._failures,
+            }
+
+    def close(self):
+        """
+        关闭缩略图进程池。
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,407 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import dropwhile, islice
+
+logger = logging.getLogger(__name__)
+
+# 默认导入的图片扩展名
+DEFAULT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff')
+
+# 文件头魔数 -> 图片格式
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+)
+
+
+def _image_format(header):
+    """
+    根据文件头判断图片格式。
+    :param header: 文件开头的若干字节
+    :return: 格式名称，不是图片时返回 None
+    """
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_format in _SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+def _probe(path):
+    """
+    在工作进程中执行：读取文件大小、计算 SHA-256 并检查文件头。
+    :param path: 文件路径
+    :return: (大小, 内容哈希, 格式)，无法读取或不是图片时返回 (None, None, 错误信息)
+    """
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as file:
+            header = file.read(16)
+            digest.update(header)
+            size += len(header)
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+                size += len(block)
+    except OSError as e:
+        return None, None, str(e)
+    image_format = _image_format(header)
+    if image_format is None:
+        return None, None, "不是可识别的图片格式"
+    return size, digest.hexdigest(), image_format
+
+
+def _sorted_entries(directory):
+    with os.scandir(directory) as entries:
+        return iter(sorted(entries, key=lambda entry: entry.name))
+
+
+def name_key(image_name):
+    """
+    iter_directory 的产出顺序：按路径的各级名称依次比较。
+    :param image_name: 相对路径，以 / 分隔
+    :return: 排序键
+    """
+    return tuple(image_name.split('/'))
+
+
+def iter_directory(root, extensions=DEFAULT_EXTENSIONS):
+    """
+    递归遍历目录，按 name_key(image_name) 的顺序逐个产出图片文件（子目录在其名称所在的位置展开）。
+    顺序固定，断点续传时据此跳过最后一个已处理条目之前的所有条目。
+    :param root: 图片目录
+    :param extensions: 要导入的扩展名
+    :return: 产出 (文件路径, image_name) 的生成器，image_name 为相对 root 的路径
+    """
+    stack = [_sorted_entries(root)]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+        elif entry.is_dir(follow_symlinks=False):
+            stack.append(_sorted_entries(entry.path))
+        elif entry.is_file() and entry.name.lower().endswith(tuple(extensions)):
+            yield entry.path, os.path.relpath(entry.path, root).replace(os.sep, '/')
+
+
+def iter_manifest(manifest):
+    """
+    逐行读取清单文件。每行为一个图片路径，或 JSON 对象 {"path": ..., "image_name": ...}；
+    相对路径按清单文件所在目录解析。
+    :param manifest: 清单文件路径
+    :return: 产出 (文件路径, image_name) 的生成器
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                path = item['path']
+                image_name = item.get('image_name') or path
+            else:
+                path = image_name = line
+            yield os.path.join(base, path), image_name
+
+
+class IngestCheckpoint:
+    def __init__(self, path):
+        """
+        导入进度检查点。每批数据提交后原子地写入，记录数据源、任务、所属用户和最后处理的 image_name，
+        导入中断后从该条目之后继续。
+        :param path: 检查点文件路径，为 None 时不保存
+        """
+        self.path = path
+
+    def load(self):
+        if not self.path:
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        if not self.path:
+            return
+        temp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(state, file, ensure_ascii=False)
+        os.replace(temp_file, self.path)
+
+
+class DatasetIngest:
+    def __init__(self, db_helper, batch_size=1000, workers=None, extensions=DEFAULT_EXTENSIONS):
+        """
+        把图片目录或清单导入 annotations 表。
+        文件在进程池中并行计算哈希并检查文件头，按内容哈希去重后分批写入，
+        每批在一个事务中插入数据并增加任务的 target，提交后更新检查点。
+        :param db_helper: DBHelper 实例
+        :param batch_size: 每批处理的文件数
+        :param workers: 进程池大小，默认等于 CPU 核数
+        :param extensions: 遍历目录时导入的扩展名
+        """
+        self.db = db_helper
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.extensions = tuple(extension.lower() for extension in extensions)
+
+    @classmethod
+    def from_settings(cls, db_helper, settings):
+        """
+        根据配置节 'ingest' 创建实例。
+        :param db_helper: DBHelper 实例
+        :param settings: 配置信息（字典形式）
+        :return: DatasetIngest 实例
+        """
+        return cls(
+            db_helper,
+            batch_size=settings.get('batch_size', 1000),
+            workers=settings.get('workers') or None,
+            extensions=settings.get('extensions', DEFAULT_EXTENSIONS),
+        )
+
+    def _source(self, directory, manifest):
+        if (directory is None) == (manifest is None):
+            raise ValueError("必须且只能指定图片目录或清单文件之一")
+        if directory is not None:
+            return iter_directory(directory, self.extensions)
+        return iter_manifest(manifest)
+
+    def _prepare_task(self, task_id, user_id):
+        """
+        获取要扩展的任务，未指定任务时为 user_id 新建一个 target 为 0 的任务。
+        同时指定 task_id 和 user_id 时，任务必须属于该用户。
+        :return: 任务 ID
+        """
+        if task_id is not None:
+            task = self.db.fetch_one("SELECT id, user_id FROM task WHERE id = %s", (task_id,), primary=True)
+            if not task:
+                raise ValueError(f"任务不存在: {task_id}")
+            if user_id is not None and task['user_id'] != user_id:
+                raise ValueError(f"任务 {task_id} 不属于用户 {user_id}")
+            return task_id
+        if user_id is None:
+            raise ValueError("新建任务时必须指定 user_id")
+        task_id = self.db.insert_record('task', {'user_id': user_id, 'target': 0, 'completed': 0})
+        if task_id is None:
+            raise RuntimeError("创建任务失败")
+        logger.info("为用户 %s 创建任务 %s", user_id, task_id)
+        return task_id
+
+    def _resume(self, source, last_name, ordered):
+        """
+        跳过数据源中最后一个已处理条目及其之前的条目。
+        :param source: 产出 (文件路径, image_name) 的迭代器
+        :param last_name: 最后处理的 image_name
+        :param ordered: 数据源是否按 name_key 排序（目录）；清单按行序，跳到 last_name 所在的行之后
+        :return: 剩余条目的迭代器
+        """
+        if ordered:
+            # 按名称而不是条目数跳过：中断期间增删文件不会错位。排在 last_name 之前的新文件
+            # 在本次不会导入，导入完成后再次运行（从头扫描）时补充
+            last_key = name_key(last_name)
+            return dropwhile(lambda item: name_key(item[1]) <= last_key, source)
+        return self._skip_through(source, last_name)
+
+    @staticmethod
+    def _skip_through(source, last_name):
+        for _, image_name in source:
+            if image_name == last_name:
+                break
+        else:
+            raise ValueError(f"清单中找不到检查点记录的位置: {last_name}")
+        yield from source
+
+    def _write_batch(self, task_id, probed):
+        """
+        按内容哈希在任务内去重并写入一批数据，同时增加任务的 target。整批在一个事务中完成。
+        :param task_id: 任务 ID
+        :param probed: [(image_name, 内容哈希), ...]
+        :return: (写入条数, 重复条数)
+        """
+        # 批内去重
+        unique = {}
+        for image_name, content_hash in probed:
+            unique.setdefault(content_hash, image_name)
+        inserted = 0
+        with self.db.transaction():
+            # 与该任务中已导入的数据去重（包括之前的批次）；其他任务（包括其他用户的任务）中的相同图片不影响本任务
+            hashes = list(unique)
+            existing = set()
+            for start in range(0, len(hashes), 1000):
+                chunk = hashes[start:start + 1000]
+                rows = self.db.fetch_all(
+                    "SELECT content_hash FROM annotations WHERE task_id = %s AND content_hash IN "
+                    f"({', '.join(['%s'] * len(chunk))})",
+                    (task_id, *chunk)
+                )
+                existing.update(row['content_hash'] for row in rows)
+            rows = [
+                {'task_id': task_id, 'image_name': image_name, 'annotation': '', 'content_hash': content_hash}
+                for content_hash, image_name in unique.items() if content_hash not in existing
+            ]
+            if rows:
+                # 唯一索引 (task_id, content_hash)（迁移 8）：并发导入同一任务时，对方已写入的记录被跳过
+                inserted = self.db.insert_many('annotations', rows, ignore=True)
+            if inserted:
+                # 追加数据后任务重新变为未完成
+                self.db.execute_query(
+                    "UPDATE task SET target = target + %s, status = '未完成' WHERE id = %s",
+                    (inserted, task_id)
+                )
+        return inserted, len(probed) - inserted
+
+    def run(self, directory=None, manifest=None, task_id=None, user_id=None, checkpoint_file=None, progress=None):
+        """
+        执行导入。
+        :param directory: 图片目录（与 manifest 二选一）
+        :param manifest: 清单文件（与 directory 二选一）
+        :param task_id: 要扩展的任务 ID，不指定时新建任务
+        :param user_id: 新建任务的所属用户；同时指定 task_id 时任务必须属于该用户
+        :param checkpoint_file: 检查点文件。存在未完成的检查点时从中记录的位置继续；
+            上次导入已完成时从头重新扫描，未指定 task_id 时仍写入上次的任务，已导入的文件按内容哈希跳过
+        :param progress: 每批完成后以当前状态调用的回调函数（可选）
+        :return: 导入结果（字典形式）
+        """
+        checkpoint = IngestCheckpoint(checkpoint_file)
+        source_key = os.path.abspath(directory if directory is not None else manifest)
+        state = checkpoint.load()
+        if state:
+            if state['source'] != source_key:
+                raise ValueError(f"检查点属于另一个数据源: {state['source']}")
+            if state.get('user_id') != user_id or (task_id is not None and task_id != state['task_id']):
+                raise ValueError(f"检查点属于另一个任务或用户: 任务 {state['task_id']}，用户 {state.get('user_id')}")
+        if state and not state['done']:
+            # 检查点写入后任务可能已被删除或转给其他用户，继续前重新检查
+            self._prepare_task(state['task_id'], user_id)
+            logger.info("从检查点继续导入: 已处理 %d 个文件，最后一个为 %s", state['processed'], state.get('last_name'))
+        else:
+            if state and task_id is None:
+                task_id = state['task_id']
+            state = {
+                'source': source_key,
+                'task_id': self._prepare_task(task_id, user_id),
+                'user_id': user_id,
+                'last_name': None,
+                'processed': 0,
+                'inserted': 0,
+                'duplicates': 0,
+                'errors': 0,
+                'done': False,
+            }
+            checkpoint.save(state)
+
+        source = self._source(directory, manifest)
+        if state.get('last_name') is not None:
+            source = self._resume(source, state['last_name'], ordered=directory is not None)
+        start = time.perf_counter()
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            while True:
+                batch = list(islice(source, self.batch_size))
+                if not batch:
+                    break
+                chunksize = max(1, len(batch) // (self.workers * 4))
+                results = executor.map(_probe, [path for path, _ in batch], chunksize=chunksize)
+                probed = []
+                for (path, image_name), (size, content_hash, detail) in zip(batch, results):
+                    if content_hash is None:
+                        state['errors'] += 1
+                        logger.warning("跳过文件 %s: %s", path, detail)
+                    else:
+                        probed.append((image_name, content_hash))
+                inserted, duplicates = self._write_batch(state['task_id'], probed) if probed else (0, 0)
+                state['processed'] += len(batch)
+                state['last_name'] = batch[-1][1]
+                state['inserted'] += inserted
+                state['duplicates'] += duplicates
+                checkpoint.save(state)
+                if progress:
+                    progress(dict(state))
+                logger.info("已处理 %d 个文件: 写入 %d，重复 %d，错误 %d",
+                            state['processed'], state['inserted'], state['duplicates'], state['errors'])
+        finally:
+            executor.shutdown()
+        state['done'] = True
+        checkpoint.save(state)
+        elapsed = time.perf_counter() - start
+        logger.info("导入完成: 写入 %d 条，耗时 %.1f 秒", state['inserted'], elapsed)
+        return dict(state, seconds=elapsed)
+
+
+class IngestJob:
+    def __init__(self, ingest, **options):
+        """
+        在后台线程中执行一次导入，供 HTTP 接口查询进度。
+        :param ingest: DatasetIngest 实例
+        :param options: 传给 DatasetIngest.run() 的参数
+        """
+        self.ingest = ingest
+        self.options = options
+        self.state = {'running': True, 'error': None}
+        self._thread = threading.Thread(target=self._run, name='dataset-ingest', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            result = self.ingest.run(progress=self._update, **self.options)
+            self._update(result)
+        except Exception as e:
+            logger.exception("导入失败")
+            self.state = dict(self.state, error=str(e))
+        finally:
+            self.state = dict(self.state, running=False)
+
+    def _update(self, state):
+        self.state = dict(state, running=True, error=None)
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从图片目录或清单导入标注数据")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="图片目录")
+    source.add_argument('--manifest', help="清单文件：每行一个图片路径，或 JSON 对象 {\"path\", \"image_name\"}")
+    parser.add_argument('--task-id', type=int, default=None, help="追加到已有任务")
+    parser.add_argument('--user-id', type=int, default=None, help="新建任务的所属用户")
+    parser.add_argument('--checkpoint', default=None, help="检查点文件，中断后使用同一文件重新运行即可继续")
+    parser.add_argument('--workers', type=int, default=None, help="进程池大小")
+    args = parser.parse_args()
+
+    from db.DBHelper import DBHelper
+    from func.Settings import CONFIG_FILE, load_settings
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    db_helper = DBHelper(CONFIG_FILE)
+    ingest = DatasetIngest.from_settings(db_helper, load_settings('ingest'))
+    if args.workers:
+        ingest.workers = args.workers
+    try:
+        result = ingest.run(directory=args.dir, manifest=args.manifest, task_id=args.task_id,
+                            user_id=args.user_id, checkpoint_file=args.checkpoint)
+    finally:
+        db_helper.disconnect()
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import contextvars
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+
+# 当前请求的关联 ID，由 main.py 中的中间件设置；数据库线程通过 AsyncDBHelper.run 继承该值
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    把当前请求的关联 ID 写入日志记录。必须在产生日志的线程中执行，因此挂在 QueueHandler 上。
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RedactingFilter(logging.Filter):
+    """
+    屏蔽日志中的密码、Token、密钥等敏感信息。
+    """
+    # 匹配 password=xxx、"session_token": "xxx"、Authorization: Bearer xxx 等形式
+    PATTERN = re.compile(
+        r'(?i)\b(password|passwd|secret(?:_key)?|session_token|access_token|token|authorization)'
+        r'(["\']?\s*[:=]\s*["\']?(?:bearer\s+)?)([^"\'\s,}]+)'
+    )
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = self.PATTERN.sub(r'\1\2***', message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    队列已满时丢弃日志而不是阻塞请求线程，并记录丢弃条数。
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(settings):
+    """
+    配置日志：请求线程只把日志记录放入内存队列，由后台线程写到标准输出或文件，
+    避免同步写日志拖慢请求。
+    :param settings: 配置节 'logging'（字典形式），支持 level、file、queue_size
+    :return: QueueListener 实例，应用关闭时调用其 stop() 刷新剩余日志
+    """
+    level = getattr(logging, str(settings.get('level', 'INFO')).upper(), logging.INFO)
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings.get('file'):
+        handlers.append(logging.handlers.WatchedFileHandler(settings['file'], encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(settings.get('queue_size', 10000)))
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(RedactingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
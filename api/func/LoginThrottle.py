@@ -0,0 +1,131 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Buckets:
+    def __init__(self, rate, burst, max_keys):
+        """
+        一组按键区分的令牌桶，桶满时等同于不存在，超过 max_keys 时淘汰最久未使用的桶。
+        :param rate: 每秒补充的令牌数
+        :param burst: 桶容量（允许的突发次数）
+        :param max_keys: 最多保存的桶数
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # 键 -> (令牌数, 上次更新时间)，按最近使用顺序排列
+        self._buckets = OrderedDict()
+
+    def peek(self, key, now):
+        """
+        计算键当前的令牌数（不消耗）。调用方需持有锁。
+        """
+        entry = self._buckets.get(key)
+        if entry is None:
+            return self.burst
+        tokens, updated = entry
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def take(self, key, tokens, now):
+        """
+        消耗一个令牌（调用方已确认 tokens >= 1）。调用方需持有锁。
+        """
+        self._buckets[key] = (tokens - 1, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def retry_after(self, tokens):
+        """
+        令牌不足时，距离下一个令牌可用的秒数（不补充令牌时按 60 秒计）。
+        """
+        return (1 - tokens) / self.rate if self.rate > 0 else 60
+
+    def reset(self, key):
+        self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class LoginThrottle:
+    def __init__(self, username_rate=0.2, username_burst=5, ip_rate=1.0, ip_burst=20, max_keys=100000):
+        """
+        登录限流（进程内）：按用户名和客户端 IP 各维护一组令牌桶，每次登录尝试各消耗一个令牌，
+        任一桶不足时拒绝，不再进入密码验证。登录成功后清空该用户名的桶，正常用户不会因之前输错密码被限制。
+        多个 worker 各自限流，实际允许的速率为配置值乘以 worker 数。
+        :param username_rate: 每个用户名每秒补充的尝试次数
+        :param username_burst: 每个用户名允许连续尝试的次数
+        :param ip_rate: 每个 IP 每秒补充的尝试次数
+        :param ip_burst: 每个 IP 允许连续尝试的次数
+        :param max_keys: 每组最多跟踪的用户名或 IP 数
+        """
+        self._lock = threading.Lock()
+        self._usernames = _Buckets(username_rate, username_burst, max_keys)
+        self._ips = _Buckets(ip_rate, ip_burst, max_keys)
+        self._allowed = 0
+        self._rejected = {'username': 0, 'ip': 0}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        根据配置节 'login_throttle' 创建实例。
+        :param settings: 配置信息（字典形式）
+        :return: LoginThrottle 实例
+        """
+        return cls(
+            username_rate=settings.get('username_per_minute', 12) / 60,
+            username_burst=settings.get('username_burst', 5),
+            ip_rate=settings.get('ip_per_minute', 60) / 60,
+            ip_burst=settings.get('ip_burst', 20),
+            max_keys=settings.get('max_keys', 100000),
+        )
+
+    def acquire(self, username, ip):
+        """
+        为一次登录尝试申请令牌。
+        :param username: 用户名
+        :param ip: 客户端 IP
+        :return: 允许时返回 0，被限流时返回建议的重试等待秒数（向上取整）
+        """
+        now = time.monotonic()
+        with self._lock:
+            username_tokens = self._usernames.peek(username, now)
+            ip_tokens = self._ips.peek(ip, now)
+            if username_tokens < 1 or ip_tokens < 1:
+                waits = []
+                if username_tokens < 1:
+                    self._rejected['username'] += 1
+                    waits.append(self._usernames.retry_after(username_tokens))
+                if ip_tokens < 1:
+                    self._rejected['ip'] += 1
+                    waits.append(self._ips.retry_after(ip_tokens))
+                return max(1, math.ceil(max(waits)))
+            self._usernames.take(username, username_tokens, now)
+            self._ips.take(ip, ip_tokens, now)
+            self._allowed += 1
+            return 0
+
+    def succeeded(self, username):
+        """
+        登录成功后清空该用户名的限流状态。
+        :param username: 用户名
+        """
+        with self._lock:
+            self._usernames.reset(username)
+
+    def stats(self):
+        """
+        获取限流统计信息。
+        :return: 统计信息（字典形式）
+        """
+        with self._lock:
+            return {
+                'allowed': self._allowed,
+                'rejected_username': self._rejected['username'],
+                'rejected_ip': self._rejected['ip'],
+                'tracked_usernames': len(self._usernames),
+                'tracked_ips': len(self._ips),
+            }
@@ -0,0 +1,214 @@
+import threading
+
+from db.QueryStats import Histogram
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestMetrics:
+    def __init__(self):
+        """
+        按路由统计 HTTP 请求次数和延迟。
+        """
+        self._lock = threading.Lock()
+        # (method, route) -> Histogram
+        self._latency = {}
+        # (method, route, status) -> 次数
+        self._requests = {}
+
+    def observe(self, method, route, status_code, elapsed):
+        """
+        记录一次请求。
+        :param method: HTTP 方法
+        :param route: 路由模板（例如 '/annotations/claim'），未匹配的请求为 'unmatched'
+        :param status_code: 响应状态码
+        :param elapsed: 耗时（秒）
+        """
+        with self._lock:
+            histogram = self._latency.get((method, route))
+            if histogram is None:
+                histogram = self._latency[(method, route)] = Histogram()
+            histogram.observe(elapsed)
+            key = (method, route, status_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def snapshot(self):
+        """
+        获取统计快照。
+        :return: (延迟直方图列表, 请求计数列表)
+        """
+        with self._lock:
+            latency = [
+                (method, route, histogram.cumulative(), histogram.sum, histogram.count)
+                for (method, route), histogram in self._latency.items()
+            ]
+            requests = list(self._requests.items())
+        return latency, requests
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram_lines(name, labels, buckets, total, count):
+    lines = []
+    for bound, cumulative in buckets:
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {total}")
+    lines.append(f"{name}_count{_labels(**labels)} {count}")
+    return lines
+
+
+def render_metrics(request_metrics, db_helper=None, session_cache=None, password_hasher=None, image_store=None,
+                   prefetcher=None, login_throttle=None, session_store=None, last_login_writer=None):
+    """
+    以 Prometheus 文本格式输出请求、数据库、连接池、会话缓存、会话存储、密码进程池、登录限流、缩略图缓存和图片预取的指标。
+    :param request_metrics: RequestMetrics 实例
+    :param db_helper: DBHelper 实例（可选）
+    :param session_cache: SessionCache 实例（可选）
+    :param password_hasher: PasswordHasher 实例（可选）
+    :param image_store: ImageStore 实例（可选）
+    :param prefetcher: Prefetcher 实例（可选）
+    :param login_throttle: LoginThrottle 实例（可选）
+    :param session_store: SessionStore 实例（可选）
+    :param last_login_writer: LastLoginWriter 实例（可选）
+    :return: 指标文本
+    """
+    lines = []
+
+    latency, requests = request_metrics.snapshot()
+    lines.append("# HELP http_request_duration_seconds HTTP request latency by route.")
+    lines.append("# TYPE http_request_duration_seconds histogram")
+    for method, route, buckets, total, count in latency:
+        lines += _histogram_lines('http_request_duration_seconds', {'method': method, 'route': route},
+                                  buckets, total, count)
+    lines.append("# HELP http_requests_total HTTP requests by route and status code.")
+    lines.append("# TYPE http_requests_total counter")
+    for (method, route, status_code), count in requests:
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status_code)} {count}")
+
+    if db_helper is not None:
+        stats = db_helper.query_stats.snapshot()
+        lines.append("# HELP db_query_duration_seconds Database query latency by normalized statement.")
+        lines.append("# TYPE db_query_duration_seconds histogram")
+        for entry in stats['statements']:
+            lines += _histogram_lines('db_query_duration_seconds',
+                                      {'table': entry['table'], 'statement': entry['statement']},
+                                      entry['buckets'], entry['sum'], entry['count'])
+        lines.append("# HELP db_query_errors_total Failed database queries by normalized statement.")
+        lines.append("# TYPE db_query_errors_total counter")
+        for entry in stats['statements']:
+            lines.append(f"db_query_errors_total{_labels(table=entry['table'], statement=entry['statement'])} "
+                         f"{entry['errors']}")
+        lines.append("# HELP db_slow_queries_total Queries slower than the configured threshold.")
+        lines.append("# TYPE db_slow_queries_total counter")
+        lines.append(f"db_slow_queries_total {stats['slow_queries']}")
+        lines.append("# HELP db_connections_created_total Database connections established, including reconnects.")
+        lines.append("# TYPE db_connections_created_total counter")
+        lines.append(f"db_connections_created_total {stats['connections']}")
+
+        pool_stats = db_helper.pool_stats()
+        if pool_stats:
+            for key in ('size', 'idle', 'in_use', 'max_size'):
+                lines.append(f"# TYPE db_pool_{key} gauge")
+                lines.append(f"db_pool_{key} {pool_stats[key]}")
+            for key in ('borrowed', 'waits', 'timeouts', 'created', 'discarded', 'health_checks'):
+                lines.append(f"# TYPE db_pool_{key}_total counter")
+                lines.append(f"db_pool_{key}_total {pool_stats[key]}")
+            lines.append("# TYPE db_pool_wait_seconds_total counter")
+            lines.append(f"db_pool_wait_seconds_total {pool_stats['wait_time_total']}")
+
+        cache_stats = db_helper.result_cache_stats()
+        if cache_stats:
+            for key in ('entries', 'bytes'):
+                lines.append(f"# TYPE db_result_cache_{key} gauge")
+                lines.append(f"db_result_cache_{key} {cache_stats[key]}")
+            for key in ('hits', 'misses', 'evictions', 'invalidations'):
+                lines.append(f"# TYPE db_result_cache_{key}_total counter")
+                lines.append(f"db_result_cache_{key}_total {cache_stats[key]}")
+
+        replica_stats = db_helper.replica_stats()
+        if replica_stats:
+            for key in ('healthy', 'in_flight'):
+                lines.append(f"# TYPE db_replica_{key} gauge")
+                for entry in replica_stats:
+                    lines.append(f"db_replica_{key}{_labels(replica=entry['replica'])} {int(entry[key])}")
+            for key in ('reads', 'errors', 'ejections'):
+                lines.append(f"# TYPE db_replica_{key}_total counter")
+                for entry in replica_stats:
+                    lines.append(f"db_replica_{key}_total{_labels(replica=entry['replica'])} {entry[key]}")
+
+    if session_cache is not None:
+        cache_stats = session_cache.stats()
+        lines.append("# TYPE session_cache_size gauge")
+        lines.append(f"session_cache_size {cache_stats['size']}")
+        for key in ('hits', 'misses', 'evictions'):
+            lines.append(f"# TYPE session_cache_{key}_total counter")
+            lines.append(f"session_cache_{key}_total {cache_stats[key]}")
+
+    if session_store is not None:
+        for key, value in session_store.stats().items():
+            lines.append(f"# TYPE sessions_{key}_total counter")
+            lines.append(f"sessions_{key}_total {value}")
+
+    if last_login_writer is not None:
+        writer_stats = last_login_writer.stats()
+        lines.append("# TYPE last_login_pending gauge")
+        lines.append(f"last_login_pending {writer_stats['pending']}")
+        lines.append("# TYPE last_login_written_total counter")
+        lines.append(f"last_login_written_total {writer_stats['written']}")
+
+    if password_hasher is not None:
+        hasher_stats = password_hasher.stats()
+        lines.append("# TYPE password_hash_pending gauge")
+        lines.append(f"password_hash_pending {hasher_stats['pending']}")
+        # 超出工作进程数的部分在排队等待
+        lines.append("# TYPE password_hash_queue_depth gauge")
+        lines.append(f"password_hash_queue_depth {max(0, hasher_stats['pending'] - hasher_stats['workers'])}")
+        for key in ('queued', 'completed', 'rejected'):
+            lines.append(f"# TYPE password_hash_{key}_total counter")
+            lines.append(f"password_hash_{key}_total {hasher_stats[key]}")
+
+    if login_throttle is not None:
+        throttle_stats = login_throttle.stats()
+        lines.append("# TYPE login_throttle_allowed_total counter")
+        lines.append(f"login_throttle_allowed_total {throttle_stats['allowed']}")
+        lines.append("# HELP login_throttle_rejected_total Login attempts rejected by the throttle, by limit.")
+        lines.append("# TYPE login_throttle_rejected_total counter")
+        for reason in ('username', 'ip'):
+            lines.append(f"login_throttle_rejected_total{_labels(reason=reason)} "
+                         f"{throttle_stats['rejected_' + reason]}")
+        for key in ('usernames', 'ips'):
+            lines.append(f"# TYPE login_throttle_tracked_{key} gauge")
+            lines.append(f"login_throttle_tracked_{key} {throttle_stats['tracked_' + key]}")
+
+    if image_store is not None:
+        image_stats = image_store.stats()
+        for key in ('entries', 'bytes', 'pending'):
+            lines.append(f"# TYPE thumbnail_cache_{key} gauge")
+            lines.append(f"thumbnail_cache_{key} {image_stats[key]}")
+        for key in ('hits', 'misses', 'evictions', 'failures'):
+            lines.append(f"# TYPE thumbnail_cache_{key}_total counter")
+            lines.append(f"thumbnail_cache_{key}_total {image_stats[key]}")
+
+    if prefetcher is not None:
+        prefetch_stats = prefetcher.stats()
+        for key in ('warmed', 'failures'):
+            lines.append(f"# TYPE image_prefetch_{key}_total counter")
+            lines.append(f"image_prefetch_{key}_total {prefetch_stats[key]}")
+        lines.append("# HELP image_prefetch_requests_total Image requests by annotator and prefetch result.")
+        lines.append("# TYPE image_prefetch_requests_total counter")
+        for user_id, counters in prefetch_stats['users'].items():
+            for result in ('hits', 'late', 'misses'):
+                lines.append(f"image_prefetch_requests_total{_labels(user_id=user_id, result=result)} "
+                             f"{counters[result]}")
+        lines.append("# TYPE image_prefetch_hit_ratio gauge")
+        for user_id, counters in prefetch_stats['users'].items():
+            lines.append(f"image_prefetch_hit_ratio{_labels(user_id=user_id)} {counters['hit_rate']}")
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,188 @@
+import asyncio
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from func.Profiling import timed
+
+
+class PasswordHasherBusy(Exception):
+    """
+    排队中的密码计算任务达到上限时抛出，调用方应快速失败而不是继续排队。
+    """
+
+
+def _hashpw(password, rounds):
+    """
+    在工作进程中执行：使用指定成本因子加密密码。
+    """
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
+
+
+def _checkpw(password, hashed_password):
+    """
+    在工作进程中执行：验证密码与哈希是否匹配。
+    """
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, workers=None, max_pending=64):
+        """
+        初始化密码哈希器。异步接口在独立的进程池中执行 bcrypt，
+        这样登录高峰时的 CPU 计算不会拖慢事件循环和 Token 验证。
+        :param rounds: bcrypt 成本因子（4-31），数值每加 1 计算量翻倍
+        :param workers: 进程池大小，默认等于 CPU 核数
+        :param max_pending: 允许同时排队/执行的密码计算任务数，超过时抛出 PasswordHasherBusy
+        """
+        if not 4 <= rounds <= 31:
+            raise ValueError("bcrypt 成本因子必须在 4 到 31 之间: %s" % rounds)
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+        # 用于未知用户名的哈希，验证它与验证真实用户的密码耗时相同。
+        # 在启动时生成，第一次未知用户名的登录不会因为额外的一次哈希而变慢，也不存在并发生成
+        self._dummy_hash = _hashpw(secrets.token_urlsafe(16), rounds).decode('utf-8')
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        根据配置节 'password_hashing' 创建实例。
+        :param settings: 配置信息（字典形式）
+        :return: PasswordHasher 实例
+        """
+        return cls(
+            rounds=settings.get('bcrypt_rounds', 12),
+            workers=settings.get('workers') or None,
+            max_pending=settings.get('max_pending', 64),
+        )
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 使用 spawn 启动工作进程，避免 fork 继承 Web 进程中的线程和锁
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+        return self._executor
+
+    def hash(self, password):
+        """
+        在当前线程中同步加密密码。
+        :param password: 明文密码
+        :return: 加密后的密码（字节串）
+        """
+        with timed('hash'):
+            return _hashpw(password, self.rounds)
+
+    def check(self, password, hashed_password):
+        """
+        在当前线程中同步验证密码。
+        :param password: 明文密码
+        :param hashed_password: 数据库中存储的加密密码
+        :return: 如果匹配返回 True，否则返回 False
+        """
+        with timed('hash'):
+            return _checkpw(password, hashed_password)
+
+    def dummy_check(self, password):
+        """
+        对不存在的用户名做一次同样成本的密码验证，使响应时间不暴露用户名是否存在。
+        :param password: 明文密码
+        :return: 总是 False
+        """
+        self.check(password, self._dummy_hash)
+        return False
+
+    async def dummy_check_async(self, password):
+        """
+        在进程池中对不存在的用户名做一次同样成本的密码验证，同样受 max_pending 限制。
+        :param password: 明文密码
+        :return: 总是 False
+        """
+        await self.check_async(password, self._dummy_hash)
+        return False
+
+    def needs_rehash(self, hashed_password):
+        """
+        判断已存储的哈希是否使用了与当前配置不同的成本因子。
+        :param hashed_password: 数据库中存储的加密密码，形如 '$2b$12$...'
+        :return: 需要重新加密返回 True
+        """
+        try:
+            return int(hashed_password.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    async def hash_async(self, password):
+        """
+        在进程池中加密密码。
+        :param password: 明文密码
+        :return: 加密后的密码（字节串）
+        """
+        return await self._submit(_hashpw, password, self.rounds)
+
+    async def check_async(self, password, hashed_password):
+        """
+        在进程池中验证密码。
+        :param password: 明文密码
+        :param hashed_password: 数据库中存储的加密密码
+        :return: 如果匹配返回 True，否则返回 False
+        """
+        return await self._submit(_checkpw, password, hashed_password)
+
+    async def _submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise PasswordHasherBusy("密码计算队列已满（%s）" % self.max_pending)
+            if self._pending >= self.workers:
+                # 所有工作进程都在计算，本次需要排队
+                self._queued += 1
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # 计入排队等待工作进程的时间
+            with timed('hash'):
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+    def stats(self):
+        """
+        获取进程池统计信息。
+        :return: 统计信息（字典形式）
+        """
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'queued': self._queued,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+    def close(self):
+        """
+        关闭进程池。
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
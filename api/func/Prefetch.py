@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 没有 posix_fadvise 的平台上，按块读取文件来预热页缓存
+READ_CHUNK_SIZE = 1024 * 1024
+
+# 预取记录的状态
+PENDING, WARMED, REQUESTED = 'pending', 'warmed', 'requested'
+
+
+def _warm_file(path):
+    """
+    把文件读入操作系统的页缓存。Linux 上只提示内核预读，不经过 Python 复制数据。
+    :param path: 文件路径
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while os.read(fd, READ_CHUNK_SIZE):
+                pass
+    finally:
+        os.close(fd)
+
+
+class Prefetcher:
+    def __init__(self, image_store, workers=4, thumbnail_size=None, max_tracked=1000):
+        """
+        标注员下一批图片的预取。领取数据时把已领取的图片和预读窗口中的图片交给后台线程读入页缓存，
+        并可同时生成缩略图；标注员请求图片时统计是否命中预取，按标注员输出命中率，用于调整窗口大小。
+        :param image_store: ImageStore 实例，用于解析图片路径和生成缩略图
+        :param workers: 预热文件的线程数，为 0 时关闭预取
+        :param thumbnail_size: 预先生成的缩略图尺寸（可选），为 None 时只预热原图
+        :param max_tracked: 每个标注员最多记录的预取图片数，超出时丢弃最早的记录
+        """
+        self.image_store = image_store
+        self.workers = workers
+        self.thumbnail_size = thumbnail_size
+        self.max_tracked = max_tracked
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch') if workers else None
+        # 用户 ID -> {图片名称: 状态}，按预取顺序排列
+        self._tracked = {}
+        # 用户 ID -> {'hits': 预热完成后才请求, 'late': 请求时仍在预热, 'misses': 未预取的图片数}
+        self._counters = {}
+        self._warmed = 0
+        self._failures = 0
+
+    @classmethod
+    def from_settings(cls, image_store, settings):
+        """
+        根据配置节 'prefetch' 创建实例。
+        :param image_store: ImageStore 实例
+        :param settings: 配置信息（字典形式）
+        :return: Prefetcher 实例
+        """
+        return cls(
+            image_store,
+            workers=settings.get('workers', 4),
+            thumbnail_size=settings.get('thumbnail_size'),
+            max_tracked=settings.get('max_tracked', 1000),
+        )
+
+    @property
+    def enabled(self):
+        return self._executor is not None
+
+    def warm(self, user_id, image_names):
+        """
+        在后台预热一批图片，立即返回。
+        :param user_id: 标注员的用户 ID
+        :param image_names: 图片名称列表，按标注员会打开的顺序排列
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            tracked = self._tracked.setdefault(user_id, OrderedDict())
+            names = [name for name in image_names if name not in tracked]
+            for name in names:
+                tracked[name] = PENDING
+            while len(tracked) > self.max_tracked:
+                tracked.popitem(last=False)
+        if names:
+            self._executor.submit(self._warm, user_id, names)
+
+    def _warm(self, user_id, image_names):
+        # 在线程池中执行，没有调用方等待结果：每张图片的错误都在这里记录，不影响同批的其他图片
+        for name in image_names:
+            try:
+                path = self.image_store.resolve(name)
+                if path is None:
+                    raise FileNotFoundError(name)
+                if self.thumbnail_size is not None:
+                    # 缩略图在 ImageStore 的进程池中生成，这里只负责提交
+                    self.image_store.prefetch([name], self.thumbnail_size)
+                _warm_file(path)
+            except Exception as e:
+                logger.warning("预取图片失败 %s: %s", name, e)
+                with self._lock:
+                    self._failures += 1
+                continue
+            with self._lock:
+                self._warmed += 1
+                tracked = self._tracked.get(user_id)
+                if tracked is not None and tracked.get(name) == PENDING:
+                    tracked[name] = WARMED
+
+    def record_request(self, user_id, image_name):
+        """
+        记录标注员的一次图片请求，统计预取是否命中。
+        同一张图片（原图、缩略图、重新验证缓存）只统计第一次请求，未预取的图片也只计一次未命中；
+        从未为其预取过图片的用户（没有领取过数据）不统计。
+        :param user_id: 标注员的用户 ID
+        :param image_name: 图片名称
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            tracked = self._tracked.get(user_id)
+            if tracked is None:
+                return
+            state = tracked.get(image_name)
+            if state == REQUESTED:
+                return
+            counters = self._counters.setdefault(user_id, {'hits': 0, 'late': 0, 'misses': 0})
+            if state is None:
+                counters['misses'] += 1
+            else:
+                counters['hits' if state == WARMED else 'late'] += 1
+            tracked[image_name] = REQUESTED
+            while len(tracked) > self.max_tracked:
+                tracked.popitem(last=False)
+
+    def stats(self):
+        """
+        获取预取统计信息。
+        :return: 统计信息（字典形式），users 为 {用户 ID: {'hits', 'late', 'misses', 'hit_rate'}}
+        """
+        with self._lock:
+            users = {}
+            for user_id, counters in self._counters.items():
+                total = counters['hits'] + counters['late'] + counters['misses']
+                users[user_id] = dict(counters, hit_rate=counters['hits'] / total if total else 0.0)
+            return {
+                'enabled': self.enabled,
+                'warmed': self._warmed,
+                'failures': self._failures,
+                'users': users,
+            }
+
+    def close(self):
+        """
+        关闭预取线程池，丢弃尚未开始的任务。
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
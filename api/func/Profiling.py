@@ -0,0 +1,230 @@
+import cProfile
+import contextvars
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的分段耗时，只在被分析的请求中设置，其他请求为 None。
+# 数据库线程通过 AsyncDBHelper.run 复制上下文，与请求共享同一个 RequestTimings 对象
+request_timings_var = contextvars.ContextVar('request_timings', default=None)
+
+# Server-Timing 中固定输出的类别：数据库、密码计算、JWT 签名和验证
+TIMING_CATEGORIES = ('db', 'hash', 'jwt')
+
+
+class RequestTimings:
+    def __init__(self):
+        """
+        一个请求内按类别累计的耗时。
+        """
+        self._lock = threading.Lock()
+        # 类别 -> [次数, 总秒数]
+        self._durations = {}
+
+    def add(self, category, seconds):
+        """
+        累计一段耗时，可在多个线程中调用。
+        :param category: 类别，例如 'db'
+        :param seconds: 耗时（秒）
+        """
+        with self._lock:
+            entry = self._durations.setdefault(category, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def server_timing(self, total):
+        """
+        生成 Server-Timing 响应头。
+        :param total: 请求总耗时（秒）
+        :return: 形如 'db;dur=3.2;desc="4 calls", hash;dur=0.0, jwt;dur=0.1, total;dur=5.0' 的文本
+        """
+        with self._lock:
+            durations = dict(self._durations)
+        parts = []
+        for category in TIMING_CATEGORIES + tuple(sorted(set(durations) - set(TIMING_CATEGORIES))):
+            count, seconds = durations.get(category, (0, 0.0))
+            part = f"{category};dur={seconds * 1000:.1f}"
+            if count:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+
+class _Timer:
+    __slots__ = ('timings', 'category', 'start')
+
+    def __init__(self, timings, category):
+        self.timings = timings
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.category, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(category):
+    """
+    计时一段代码并计入当前请求的分段耗时。请求未被分析时返回空操作的上下文管理器。
+    :param category: 类别，例如 'jwt'
+    :return: 上下文管理器
+    """
+    timings = request_timings_var.get()
+    if timings is None:
+        return _NULL_TIMER
+    return _Timer(timings, category)
+
+
+def record_timing(category, seconds):
+    """
+    把已经测得的耗时计入当前请求的分段耗时，请求未被分析时什么也不做。
+    :param category: 类别，例如 'db'
+    :param seconds: 耗时（秒）
+    """
+    timings = request_timings_var.get()
+    if timings is not None:
+        timings.add(category, seconds)
+
+
+class RequestProfiler:
+    def __init__(self, token='', header='X-Profile', directory='db/profiles', max_files=50,
+                 max_bytes=100 * 1024 * 1024):
+        """
+        按需分析单个请求：请求头 header 的值与 token 一致时，用 cProfile 记录该请求，结果保存到 directory，
+        供 snakeviz、flameprof 等工具离线生成火焰图。token 为空时不启用。
+        cProfile 只记录事件循环线程，期间同时处理的其他请求也会被记录；数据库线程和密码进程中的耗时
+        见 Server-Timing。同一时间只分析一个请求，其他带令牌的请求只返回 Server-Timing。
+        :param token: 触发分析的令牌
+        :param header: 携带令牌的请求头
+        :param directory: 分析结果目录
+        :param max_files: 最多保留的分析结果文件数，超出时删除最早的文件
+        :param max_bytes: 分析结果的总大小上限（字节），超出时删除最早的文件
+        """
+        self.token = token or ''
+        self.header = header
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.enabled = bool(self.token)
+        self._lock = threading.Lock()
+        self._active = False
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        根据配置节 'profiling' 创建实例，enabled 为 false 时不启用。
+        :param settings: 配置信息（字典形式）
+        :return: RequestProfiler 实例
+        """
+        token = settings.get('token', '') if settings.get('enabled', False) else ''
+        if settings.get('enabled', False) and not token:
+            logger.warning("已启用请求分析但未配置 profiling.token，请求分析不会生效")
+        return cls(
+            token=token,
+            header=settings.get('header', 'X-Profile'),
+            directory=settings.get('directory', 'db/profiles'),
+            max_files=settings.get('max_files', 50),
+            max_bytes=settings.get('max_mb', 100) * 1024 * 1024,
+        )
+
+    def should_profile(self, headers):
+        """
+        判断请求是否带有有效的分析令牌。未启用时只做一次属性判断。
+        :param headers: 请求头
+        :return: 需要分析返回 True
+        """
+        if not self.enabled:
+            return False
+        value = headers.get(self.header)
+        return value is not None and hmac.compare_digest(value.encode('utf-8'), self.token.encode('utf-8'))
+
+    def start(self):
+        """
+        开始分析。已有请求正在分析时返回 None。
+        :return: cProfile.Profile 实例或 None
+        """
+        with self._lock:
+            if self._active:
+                return None
+            self._active = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 其他分析工具（例如调试器）已经在运行
+            with self._lock:
+                self._active = False
+            return None
+        return profile
+
+    def stop(self, profile):
+        """
+        结束分析。
+        :param profile: start() 返回的实例
+        """
+        profile.disable()
+        with self._lock:
+            self._active = False
+
+    def save(self, profile, method, path, request_id):
+        """
+        保存分析结果（pstats 格式），并删除超出数量或大小上限的旧文件。
+        :param profile: 已结束的 cProfile.Profile 实例
+        :param method: 请求方法
+        :param path: 请求路径
+        :param request_id: 请求关联 ID
+        :return: 文件名，保存失败时返回 None
+        """
+        route = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_')[:60] or 'root'
+        request_id = re.sub(r'[^A-Za-z0-9-]+', '', request_id)[:32]
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{route}-{request_id}.prof"
+        path = os.path.join(self.directory, name)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # 先写临时文件再改名，清理时不会读到写了一半的文件
+            profile.dump_stats(path + '.tmp')
+            os.replace(path + '.tmp', path)
+            self._prune()
+        except OSError as e:
+            logger.error("保存请求分析结果失败: %s", e)
+            return None
+        logger.info("已保存请求分析结果: %s", path)
+        return name
+
+    def _prune(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.prof'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort(reverse=True)
+        total = 0
+        for index, (_, name, size) in enumerate(files):
+            total += size
+            if index >= self.max_files or (index > 0 and total > self.max_bytes):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
@@ -1,11 +1,67 @@
+import json
+import logging
+import os
 import secrets
-from datetime import datetime, timedelta
 import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，只能保证单进程内的互斥
+    fcntl = None
+
+from func.Settings import load_settings
+
+logger = logging.getLogger(__name__)
 
 class SecretManager:
-    def __init__(self):
-        self.secret_key = self._generate_secret_key()  # 初始化 SECRET_KEY
-        self._schedule_key_update()  # 启动定时任务，每 24 小时更新一次
+    def __init__(self, key_file='db/jwt_keys.json', rotation_interval=24 * 60 * 60,
+                 token_lifetime=30 * 60, check_interval=60, max_keys=10):
+        """
+        JWT 签名密钥环。密钥保存在本地文件中，同一主机上的所有 worker 共享同一组密钥：
+        新 Token 使用最新的密钥签名并在头部带上 kid，旧密钥在其签发的 Token 全部过期前仍可用于验证。
+        :param key_file: 密钥文件路径
+        :param rotation_interval: 密钥轮换间隔（秒）
+        :param token_lifetime: Token 最长有效期（秒），被替换的密钥至少保留这么久
+        :param check_interval: 后台线程检查文件变化和轮换时间的间隔（秒）
+        :param max_keys: 密钥环中最多保留的密钥数
+        """
+        self.key_file = key_file
+        self.lock_file = key_file + '.lock'
+        self.rotation_interval = rotation_interval
+        self.token_lifetime = token_lifetime
+        self.check_interval = check_interval
+        self.max_keys = max_keys
+
+        self._lock = threading.Lock()
+        self._keys = {}  # kid -> secret
+        self._current = None  # 最新密钥的 (kid, secret, created_at)
+        self._mtime = None
+        self._last_reload = 0.0
+
+        # 启动时加载一次密钥环，文件不存在时创建
+        with self._file_lock():
+            if not self._load():
+                self._rotate_locked()
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name='jwt-key-ring', daemon=True)
+        self._watcher.start()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        根据配置节 'jwt' 创建实例。
+        :param settings: 配置信息（字典形式）
+        :return: SecretManager 实例
+        """
+        return cls(
+            key_file=settings.get('key_file', 'db/jwt_keys.json'),
+            rotation_interval=settings.get('rotation_hours', 24) * 60 * 60,
+            token_lifetime=settings.get('access_token_expire_minutes', 30) * 60,
+            check_interval=settings.get('check_interval_seconds', 60),
+        )
 
     def _generate_secret_key(self):
         """
@@ -14,23 +70,131 @@ class SecretManager:
         """
         return secrets.token_urlsafe(64)  # 生成 64 字节的 URL 安全字符串
 
-    def _schedule_key_update(self):
+    @contextmanager
+    def _file_lock(self):
+        """
+        跨进程互斥锁，保证同一时间只有一个 worker 轮换密钥。
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        """
+        从文件读取密钥环。
+        :return: 读取成功返回 True，文件不存在或为空返回 False
+        """
+        try:
+            mtime = os.stat(self.key_file).st_mtime_ns
+            with open(self.key_file, 'r') as file:
+                keys = json.load(file)['keys']
+        except (FileNotFoundError, ValueError, KeyError):
+            return False
+        if not keys:
+            return False
+        newest = keys[-1]
+        self._keys = {key['kid']: key['secret'] for key in keys}
+        self._current = (newest['kid'], newest['secret'], newest['created_at'])
+        self._mtime = mtime
+        return True
+
+    def _rotate_locked(self):
         """
-        每 24 小时更新一次 SECRET_KEY。
+        生成新密钥并写回文件，同时清理签发的 Token 均已过期的旧密钥。调用方需持有文件锁。
         """
-        # 更新 SECRET_KEY
-        self.secret_key = self._generate_secret_key()
-        print(f"[{datetime.now()}] SECRET_KEY 已更新: {self.secret_key}")
+        now = time.time()
+        try:
+            with open(self.key_file, 'r') as file:
+                keys = json.load(file)['keys']
+        except (FileNotFoundError, ValueError, KeyError):
+            keys = []
+        keys.append({'kid': secrets.token_hex(8), 'secret': self._generate_secret_key(), 'created_at': now})
 
-        # 24 小时后再次调用自身
-        threading.Timer(24 * 60 * 60, self._schedule_key_update).start()
+        # 密钥 i 在密钥 i+1 创建时停止签发，再保留 token_lifetime 秒用于验证
+        retained = [
+            key for key, successor in zip(keys, keys[1:])
+            if now - successor['created_at'] < self.token_lifetime
+        ]
+        keys = (retained + [keys[-1]])[-self.max_keys:]
+
+        # 先写临时文件再原子替换，其他 worker 不会读到写了一半的文件
+        temp_file = f"{self.key_file}.{os.getpid()}.tmp"
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'keys': keys}, file)
+        os.replace(temp_file, self.key_file)
+        self._load()
+        logger.info("JWT 签名密钥已轮换，当前 kid: %s", self._current[0])
+
+    def _watch(self):
+        """
+        后台线程：文件被其他 worker 更新时重新加载；当前密钥到期时轮换。
+        """
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.reload_if_changed()
+                if time.time() - self._current[2] >= self.rotation_interval:
+                    with self._file_lock():
+                        # 加锁后重新读取，其他 worker 可能已经完成了轮换
+                        self._load()
+                        if time.time() - self._current[2] >= self.rotation_interval:
+                            self._rotate_locked()
+            except OSError as e:
+                logger.error("JWT 密钥环更新失败: %s", e)
+
+    def reload_if_changed(self):
+        """
+        密钥文件被修改时重新加载。
+        """
+        self._last_reload = time.monotonic()
+        try:
+            mtime = os.stat(self.key_file).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            with self._lock:
+                self._load()
+
+    def get_signing_key(self):
+        """
+        获取用于签发新 Token 的密钥。
+        :return: (kid, secret)
+        """
+        kid, secret, _ = self._current
+        return kid, secret
+
+    def get_verification_key(self, kid):
+        """
+        根据 Token 头部的 kid 获取验证密钥。
+        遇到未知 kid 时（其他 worker 刚轮换过）重新加载一次文件，每秒最多一次。
+        :param kid: 密钥 ID
+        :return: 对应的密钥，不存在时返回 None
+        """
+        secret = self._keys.get(kid)
+        if secret is None and kid and time.monotonic() - self._last_reload > 1:
+            self.reload_if_changed()
+            secret = self._keys.get(kid)
+        return secret
 
     def get_secret_key(self):
         """
         获取当前的 SECRET_KEY。
         :return: 当前的 SECRET_KEY
         """
-        return self.secret_key
+        return self._current[1]
+
+    def stop(self):
+        """
+        停止后台线程。
+        """
+        self._stop.set()
 
-# 初始化 SecretManager
-secret_manager = SecretManager()
\ No newline at end of file
+# 初始化 SecretManager，配置见配置节 jwt
+secret_manager = SecretManager.from_settings(load_settings('jwt'))
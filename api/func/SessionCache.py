@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionCache:
+    def __init__(self, max_size=10000, ttl=30):
+        """
+        进程内的 session_token -> 用户记录缓存，按 LRU 淘汰并带过期时间。
+        多个 worker 各自持有一份缓存，其他 worker 注销后最多 ttl 秒内仍可能命中旧记录。
+        :param max_size: 最多缓存的会话数
+        :param ttl: 缓存条目的有效期（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # session_token -> (过期时间, 用户记录)，按最近使用顺序排列
+        self._entries = OrderedDict()
+        # 用户 ID -> 该用户已缓存的 session_token 集合，用于按用户失效
+        self._tokens_by_user = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, session_token):
+        """
+        获取缓存的用户记录。
+        :param session_token: 用户的 session_token
+        :return: 用户信息（字典形式），未命中或已过期返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(session_token)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                self._remove(session_token)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(session_token)
+            self._hits += 1
+            return user
+
+    def set(self, session_token, user):
+        """
+        缓存用户记录，超出容量时淘汰最久未使用的条目。
+        :param session_token: 用户的 session_token
+        :param user: 用户信息（字典形式）
+        """
+        with self._lock:
+            if session_token in self._entries:
+                self._remove(session_token)
+            self._entries[session_token] = (time.monotonic() + self.ttl, user)
+            self._tokens_by_user.setdefault(user['id'], set()).add(session_token)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def invalidate(self, session_token):
+        """
+        使某个会话的缓存失效（例如注销时）。
+        :param session_token: 用户的 session_token
+        """
+        with self._lock:
+            if session_token in self._entries:
+                self._remove(session_token)
+
+    def invalidate_user(self, user_id):
+        """
+        使某个用户的全部会话缓存失效（例如重新登录或修改密码时）。
+        :param user_id: 用户 ID
+        """
+        with self._lock:
+            for session_token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(session_token)
+
+    def stats(self):
+        """
+        获取缓存统计信息。
+        :return: 统计信息（字典形式）
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+    def _remove(self, session_token):
+        # 调用方需持有 self._lock
+        _, user = self._entries.pop(session_token)
+        tokens = self._tokens_by_user.get(user['id'])
+        if tokens is not None:
+            tokens.discard(session_token)
+            if not tokens:
+                del self._tokens_by_user[user['id']]
@@ -0,0 +1,382 @@
+import logging
+import secrets
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+from db.ConnectionPool import PoolTimeoutError
+from db.DBHelper import SQL_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    def __init__(self, ttl=1800, max_per_user=0, purge_interval=300):
+        """
+        会话存储的公共部分：生成令牌、限制每个用户的会话数，以及在后台线程中定期批量清理过期会话。
+        子类实现 _insert、_user_sessions、get、delete、delete_user 和 purge_expired，缺少任何一个都无法实例化。
+        :param ttl: 会话有效期（秒）
+        :param max_per_user: 每个用户最多保留的会话数（设备数），超出时注销最早的会话；为 0 时不限制
+        :param purge_interval: 清理过期会话的间隔（秒），为 0 时不启动后台清理
+        """
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.purge_interval = purge_interval
+        self._stats_lock = threading.Lock()
+        self._created = 0
+        self._purged = 0
+        self._stop = threading.Event()
+        self._purger = None
+
+    def create(self, user_id, device=None, ip=None):
+        """
+        为用户创建新会话。同一用户可以同时在多个设备登录。
+        :param user_id: 用户 ID
+        :param device: 设备信息（例如 User-Agent）
+        :param ip: 客户端 IP
+        :return: 新的 session_token
+        """
+        now = datetime.now()
+        session = {
+            'token': secrets.token_urlsafe(32),
+            'user_id': user_id,
+            'device': device[:255] if device else None,
+            'ip': ip,
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl),
+        }
+        self._insert(session)
+        if self.max_per_user:
+            # 按创建时间从新到旧排列，注销超出数量的旧会话
+            for token in self._user_sessions(user_id)[self.max_per_user:]:
+                self.delete(token)
+        with self._stats_lock:
+            self._created += 1
+        return session['token']
+
+    @abstractmethod
+    def _insert(self, session):
+        """
+        保存新会话。保存失败时抛出异常，不能返回未保存的令牌。
+        """
+
+    @abstractmethod
+    def _user_sessions(self, user_id):
+        """
+        获取用户未过期的会话令牌，按创建时间从新到旧排列。
+        """
+
+    @abstractmethod
+    def get(self, token):
+        """
+        获取未过期的会话。
+        :param token: session_token
+        :return: 会话信息（字典形式），不存在或已过期返回 None
+        """
+
+    @abstractmethod
+    def delete(self, token):
+        """
+        注销一个会话。
+        :param token: session_token
+        :return: 会话存在时返回 True；删除失败时抛出异常
+        """
+
+    @abstractmethod
+    def delete_user(self, user_id):
+        """
+        注销用户的全部会话（例如修改密码时）。
+        :param user_id: 用户 ID
+        :return: 注销的会话数
+        """
+
+    @abstractmethod
+    def purge_expired(self):
+        """
+        批量删除过期会话。
+        :return: 删除的会话数
+        """
+
+    def start(self):
+        """
+        启动后台清理线程。
+        """
+        if self.purge_interval <= 0 or self._purger is not None:
+            return
+        self._purger = threading.Thread(target=self._purge_loop, name='session-purge', daemon=True)
+        self._purger.start()
+
+    def _purge_loop(self):
+        while not self._stop.wait(self.purge_interval):
+            try:
+                purged = self.purge_expired()
+            except Exception as e:
+                logger.error("清理过期会话失败: %s", e)
+                continue
+            if purged:
+                with self._stats_lock:
+                    self._purged += purged
+                logger.info("已清理 %d 个过期会话", purged)
+
+    def close(self):
+        """
+        停止后台清理线程。
+        """
+        self._stop.set()
+
+    def stats(self):
+        """
+        获取会话统计信息。
+        :return: 统计信息（字典形式）
+        """
+        with self._stats_lock:
+            return {'created': self._created, 'purged': self._purged}
+
+
+class MemorySessionStore(SessionStore):
+    """
+    进程内的会话存储。会话不跨进程共享，重启后全部失效，只适用于单 worker 部署和测试。
+    """
+
+    def __init__(self, ttl=1800, max_per_user=0, purge_interval=300):
+        super().__init__(ttl, max_per_user, purge_interval)
+        self._lock = threading.Lock()
+        # session_token -> 会话信息
+        self._sessions = {}
+        # 用户 ID -> 该用户的 session_token 集合
+        self._tokens_by_user = {}
+
+    def _insert(self, session):
+        with self._lock:
+            self._sessions[session['token']] = session
+            self._tokens_by_user.setdefault(session['user_id'], set()).add(session['token'])
+
+    def _user_sessions(self, user_id):
+        now = datetime.now()
+        with self._lock:
+            sessions = [self._sessions[token] for token in self._tokens_by_user.get(user_id, ())]
+        sessions = [session for session in sessions if session['expires_at'] > now]
+        sessions.sort(key=lambda session: session['created_at'], reverse=True)
+        return [session['token'] for session in sessions]
+
+    def get(self, token):
+        with self._lock:
+            session = self._sessions.get(token)
+        if session is None or session['expires_at'] <= datetime.now():
+            return None
+        return dict(session)
+
+    def delete(self, token):
+        with self._lock:
+            return self._remove(token)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            tokens = list(self._tokens_by_user.get(user_id, ()))
+            for token in tokens:
+                self._remove(token)
+        return len(tokens)
+
+    def purge_expired(self):
+        now = datetime.now()
+        with self._lock:
+            expired = [token for token, session in self._sessions.items() if session['expires_at'] <= now]
+            for token in expired:
+                self._remove(token)
+        return len(expired)
+
+    def _remove(self, token):
+        # 调用方需持有 self._lock
+        session = self._sessions.pop(token, None)
+        if session is None:
+            return False
+        tokens = self._tokens_by_user.get(session['user_id'])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[session['user_id']]
+        return True
+
+
+class DBSessionStore(SessionStore):
+    def __init__(self, db_helper, ttl=1800, max_per_user=0, purge_interval=300, purge_batch=1000):
+        """
+        基于 sessions 表（迁移 7）的会话存储。验证会话只需按主键 token 查询一次；
+        过期会话按 expires_at 索引分批删除，每批一条 DELETE 语句。
+        :param db_helper: DBHelper 实例
+        :param purge_batch: 每批删除的会话数
+        """
+        super().__init__(ttl, max_per_user, purge_interval)
+        self.db = db_helper
+        self.purge_batch = purge_batch
+
+    def _insert(self, session):
+        # 在事务中写入：事务外 insert_record 只记录错误而不抛出，登录会返回一个没有保存的令牌
+        with self.db.transaction():
+            self.db.insert_record('sessions', session)
+
+    def _user_sessions(self, user_id):
+        # 刚插入的会话需要计入，只读主库
+        rows = self.db.fetch_all(
+            "SELECT token FROM sessions WHERE user_id = %s AND expires_at > %s ORDER BY created_at DESC",
+            (user_id, datetime.now()), primary=True
+        )
+        return [row['token'] for row in rows or []]
+
+    def get(self, token):
+        # 按主键读主库：登录后的下一个请求可能由其他 worker 处理，读己之写的固定只在本进程内有效，
+        # 延迟的副本上可能还没有刚创建的会话
+        session = self.db.fetch_one(
+            "SELECT token, user_id, device, ip, created_at, expires_at FROM sessions WHERE token = %s", (token,),
+            primary=True
+        )
+        # 已过期但尚未清理的会话视为不存在
+        if not session or session['expires_at'] <= datetime.now():
+            return None
+        return session
+
+    def delete(self, token):
+        # 同上，数据库错误时抛出，不与“会话不存在”混淆
+        with self.db.transaction():
+            return bool(self.db.delete_record('sessions', 'token', token))
+
+    def delete_user(self, user_id):
+        with self.db.transaction():
+            return self.db.delete_record('sessions', 'user_id', user_id)
+
+    def purge_expired(self):
+        now = datetime.now()
+        purged = 0
+        while True:
+            # 先按 expires_at 索引取出一批令牌再按主键删除，每批持有的锁有限（MySQL 不支持 IN 子查询中的 LIMIT）
+            rows = self.db.fetch_all(
+                "SELECT token FROM sessions WHERE expires_at <= %s LIMIT %s", (now, self.purge_batch)
+            )
+            if not rows:
+                break
+            tokens = [row['token'] for row in rows]
+            deleted = self.db.execute_query(
+                f"DELETE FROM sessions WHERE token IN ({', '.join(['%s'] * len(tokens))})", tokens
+            )
+            if deleted is None:
+                break
+            purged += deleted
+            if len(rows) < self.purge_batch:
+                break
+        return purged
+
+
+# 配置项 sessions.backend 对应的会话存储
+BACKENDS = {
+    'memory': MemorySessionStore,
+    'db': DBSessionStore,
+}
+
+
+def create_session_store(db_helper, settings):
+    """
+    根据配置节 'sessions' 创建会话存储。
+    :param db_helper: DBHelper 实例（backend 为 'db' 时使用）
+    :param settings: 配置信息（字典形式）
+    :return: SessionStore 实例
+    """
+    backend = settings.get('backend', 'db')
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的会话存储: {backend}")
+    options = {
+        'ttl': settings.get('ttl_seconds', 1800),
+        'max_per_user': settings.get('max_per_user', 0),
+        'purge_interval': settings.get('purge_interval_seconds', 300),
+    }
+    if backend == 'db':
+        return DBSessionStore(db_helper, purge_batch=settings.get('purge_batch', 1000), **options)
+    return MemorySessionStore(**options)
+
+
+class LastLoginWriter:
+    def __init__(self, db_helper, flush_interval=10):
+        """
+        延迟批量写入 users.last_login：登录时只记录在内存中，后台线程每 flush_interval 秒
+        用一条 UPDATE ... CASE 语句写入，登录路径上不再更新 users 行。
+        进程异常退出时最多丢失 flush_interval 秒内的登录时间。
+        :param db_helper: DBHelper 实例
+        :param flush_interval: 写入间隔（秒），为 0 时在登录时立即写入
+        """
+        self.db = db_helper
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # 用户 ID -> 最近一次登录时间
+        self._pending = {}
+        self._written = 0
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def record(self, user_id, when=None):
+        """
+        记录一次登录。
+        :param user_id: 用户 ID
+        :param when: 登录时间，默认为当前时间
+        """
+        with self._lock:
+            self._pending[user_id] = when or datetime.now()
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """
+        写入所有待写入的登录时间。
+        :return: 写入的用户数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            # 在事务中写入：事务外 update_many 只记录错误而不抛出，无法判断是否写入成功
+            with self.db.transaction():
+                self.db.update_many('users', ({'id': user_id, 'last_login': when}
+                                              for user_id, when in pending.items()))
+        except (*SQL_ERRORS, PoolTimeoutError) as e:
+            logger.error("写入 last_login 失败，下次重试: %s", e)
+            with self._lock:
+                # 期间又登录的用户保留较新的时间
+                for user_id, when in pending.items():
+                    if user_id not in self._pending or self._pending[user_id] < when:
+                        self._pending[user_id] = when
+            return 0
+        with self._lock:
+            self._written += len(pending)
+        return len(pending)
+
+    def start(self):
+        """
+        启动后台写入线程。
+        """
+        if self.flush_interval <= 0 or self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name='last-login-writer', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("写入 last_login 失败: %s", e)
+
+    def close(self):
+        """
+        停止后台线程并写入剩余的登录时间。
+        """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def stats(self):
+        """
+        获取写入统计信息。
+        :return: 统计信息（字典形式）
+        """
+        with self._lock:
+            return {'pending': len(self._pending), 'written': self._written}
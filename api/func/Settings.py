@@ -0,0 +1,16 @@
+import json
+import os
+
+# 默认配置文件路径（相对于 api 目录），可通过环境变量 ANNOTATION_CONFIG 指定其他配置（例如压测环境）
+CONFIG_FILE = os.environ.get('ANNOTATION_CONFIG', 'db/DBConfig.json')
+
+def load_settings(section, config_file=CONFIG_FILE):
+    """
+    读取配置文件中的某个顶层配置节。
+    :param section: 配置节名称，例如 'password_hashing'
+    :param config_file: 配置文件的路径
+    :return: 配置信息（字典形式），配置节不存在时返回空字典
+    """
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    return config.get(section) or {}
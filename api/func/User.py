@@ -1,14 +1,30 @@
-import uuid
-from datetime import datetime
-import bcrypt
+import logging
+
+from db.AsyncDBHelper import AsyncDBHelper
+from func.PasswordHasher import PasswordHasher, PasswordHasherBusy
+from func.SessionCache import SessionCache
+from func.SessionStore import DBSessionStore, LastLoginWriter
+
+logger = logging.getLogger(__name__)
 
 class User:
-    def __init__(self, db_helper):
+    def __init__(self, db_helper, async_db=None, hasher=None, session_cache=None, session_store=None,
+                 last_login_writer=None):
         """
         初始化 User 类。
         :param db_helper: DBHelper 实例，用于数据库操作
+        :param async_db: AsyncDBHelper 实例，供异步方法使用；默认基于 db_helper 创建
+        :param hasher: PasswordHasher 实例，负责 bcrypt 计算；默认使用默认成本因子
+        :param session_cache: SessionCache 实例，缓存 session_token 对应的用户记录
+        :param session_store: SessionStore 实例，保存会话；默认使用 sessions 表
+        :param last_login_writer: LastLoginWriter 实例，写入 users.last_login；默认在登录时立即写入
         """
         self.db = db_helper
+        self.async_db = async_db or AsyncDBHelper(db_helper)
+        self.hasher = hasher or PasswordHasher()
+        self.session_cache = session_cache or SessionCache()
+        self.session_store = session_store or DBSessionStore(db_helper)
+        self.last_login_writer = last_login_writer or LastLoginWriter(db_helper, flush_interval=0)
 
     def _hash_password(self, password):
         """
@@ -16,11 +32,8 @@ class User:
         :param password: 明文密码
         :return: 加密后的密码（字节串）
         """
-        # 生成 salt 并哈希密码
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-        print("用户输入的密码：", password)
-        print("加密后的密码：", hashed_password)
+        # 生成 salt 并按配置的成本因子哈希密码
+        hashed_password = self.hasher.hash(password)
         return hashed_password
 
     def _check_password(self, input_password, hashed_password):
@@ -31,10 +44,19 @@ class User:
         :return: 如果匹配返回 True，否则返回 False
         """
         # 检查密码是否匹配
-        print("用户输入的密码：", input_password)
-        print("数据库中存储的加密密码：", hashed_password)
-        print("匹配结果：", bcrypt.checkpw(input_password.encode('utf-8'), hashed_password.encode('utf-8')))
-        return bcrypt.checkpw(input_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        return self.hasher.check(input_password, hashed_password)
+
+    def _rehash_if_needed(self, user, password):
+        """
+        如果存储的哈希成本因子与当前配置不同，则用当前配置重新加密并保存。
+        :param user: 用户记录（字典形式）
+        :param password: 已验证通过的明文密码
+        """
+        if self.hasher.needs_rehash(user['password']):
+            hashed_password = self._hash_password(password)
+            self.db.update_record('users', {'password': hashed_password.decode('utf-8')}, 'id', user['id'])
+            self.session_cache.invalidate_user(user['id'])
+            logger.info("用户 %s 的密码哈希已按新的成本因子更新", user['id'])
 
     def register(self, username, password):
         """
@@ -46,7 +68,7 @@ class User:
         # 检查用户名是否已存在
         existing_user = self.db.get_records('users', {'username': username})
         if existing_user:
-            print("用户名已存在")
+            logger.debug("用户名已存在: %s", username)
             return False
 
         # 加密密码
@@ -56,63 +78,66 @@ class User:
         user_data = {
             'username': username,
             'password': hashed_password.decode('utf-8'),  # 将字节串转换为字符串存储
-            'session_token': None,
             'last_login': None
         }
         self.db.insert_record('users', user_data)
-        print("用户注册成功")
+        logger.info("用户注册成功: %s", username)
         return True
 
-    def login(self, username, password):
+    def login(self, username, password, device=None, ip=None):
         """
-        用户登录。
+        用户登录。同一用户可以同时在多个设备登录，每次登录创建一个新会话。
         :param username: 用户名
         :param password: 明文密码
+        :param device: 设备信息（例如 User-Agent），保存在会话中
+        :param ip: 客户端 IP，保存在会话中
         :return: 登录成功返回 session_token，否则返回 None
         """
         # 查询用户
         user = self.db.get_records('users', {'username': username})
         if not user:
-            print("用户名或密码错误")
+            # 用户名不存在时也做一次同样成本的密码验证，响应时间不暴露用户名是否存在
+            self.hasher.dummy_check(password)
+            logger.debug("用户名或密码错误: %s", username)
             return None
 
         user = user[0]
 
         # 验证密码
         if not self._check_password(password, user['password']):
-            print("用户名或密码错误")
+            logger.debug("用户名或密码错误: %s", username)
             return None
 
-        # 检查用户是否已经在其他设备登录
-        if user['session_token']:
-            print("该用户已在其他设备登录")
-            return None
+        # 成本因子变化时透明地重新加密
+        self._rehash_if_needed(user, password)
+
+        session_token = self._open_session(user['id'], device, ip)
+        logger.debug("用户登录成功: %s", username)
+        return session_token
 
-        # 生成新的 session_token
-        session_token = str(uuid.uuid4())
-        print("生成的 session_token：", session_token)
-        # 更新用户的 session_token 和 last_login
-        self.db.update_record('users', {'session_token': session_token, 'last_login': datetime.now()}, 'id', user['id'])
-        print("用户登录成功")
+    def _open_session(self, user_id, device=None, ip=None):
+        """
+        创建新会话。last_login 由 LastLoginWriter 延迟批量写入，登录时不更新 users 行。
+        :param user_id: 用户 ID
+        :param device: 设备信息
+        :param ip: 客户端 IP
+        :return: 新的 session_token
+        """
+        session_token = self.session_store.create(user_id, device, ip)
+        self.last_login_writer.record(user_id)
         return session_token
 
     def logout(self, session_token):
         """
-        用户注销。
+        用户注销，只注销当前会话，其他设备上的会话不受影响。
         :param session_token: 用户的 session_token
         :return: 注销成功返回 True，否则返回 False
         """
-        # 查询用户
-        user = self.db.get_records('users', {'session_token': session_token})
-        if not user:
-            print("无效的 session_token")
+        if not self.session_store.delete(session_token):
+            logger.debug("无效的 session_token")
             return False
-
-        user = user[0]
-
-        # 清除 session_token
-        self.db.update_record('users', {'session_token': None}, 'id', user['id'])
-        print("用户注销成功")
+        self.session_cache.invalidate(session_token)
+        logger.debug("用户注销成功")
         return True
 
     def is_logged_in(self, session_token):
@@ -121,11 +146,8 @@ class User:
         :param session_token: 用户的 session_token
         :return: 如果用户已登录返回 True，否则返回 False
         """
-        # 查询用户
-        user = self.db.get_records('users', {'session_token': session_token})
-        if user:
-            return True
-        return False
+        # 查询用户（优先命中会话缓存）
+        return self.get_user_by_token(session_token) is not None
 
     def get_user_by_token(self, session_token):
         """
@@ -133,8 +155,116 @@ class User:
         :param session_token: 用户的 session_token
         :return: 用户信息（字典形式），如果未找到返回 None
         """
-        # 查询用户
-        user = self.db.get_records('users', {'session_token': session_token})
+        # 先查会话缓存，未命中再查询数据库
+        user = self.session_cache.get(session_token)
+        if user is not None:
+            return user
+        return self._load_user_by_token(session_token)
+
+    def _load_user_by_token(self, session_token):
+        """
+        从会话存储查询 session_token 对应的会话，再按主键读取用户，并写入会话缓存。
+        :param session_token: 用户的 session_token
+        :return: 用户信息（字典形式），如果未找到返回 None
+        """
+        session = self.session_store.get(session_token)
+        if not session:
+            return None
+        # 按主键读取用户（启用结果缓存时可直接命中）
+        user = self.db.get_record_by_id('users', session['user_id'])
         if user:
-            return user[0]
-        return None
\ No newline at end of file
+            self.session_cache.set(session_token, user)
+        return user
+
+    async def register_async(self, username, password):
+        """
+        异步注册新用户。数据库操作在数据库线程池中执行，密码加密不占用事件循环。
+        :param username: 用户名
+        :param password: 明文密码
+        :return: 注册成功返回 True，否则返回 False
+        """
+        # 检查用户名是否已存在
+        existing_user = await self.async_db.get_records('users', {'username': username})
+        if existing_user:
+            logger.debug("用户名已存在: %s", username)
+            return False
+
+        # 加密密码（在密码进程池中执行）
+        hashed_password = await self.hasher.hash_async(password)
+
+        # 插入新用户
+        user_data = {
+            'username': username,
+            'password': hashed_password.decode('utf-8'),  # 将字节串转换为字符串存储
+            'last_login': None
+        }
+        await self.async_db.insert_record('users', user_data)
+        logger.info("用户注册成功: %s", username)
+        return True
+
+    async def login_async(self, username, password, device=None, ip=None):
+        """
+        异步用户登录。同一用户可以同时在多个设备登录，每次登录创建一个新会话。
+        :param username: 用户名
+        :param password: 明文密码
+        :param device: 设备信息（例如 User-Agent），保存在会话中
+        :param ip: 客户端 IP，保存在会话中
+        :return: 登录成功返回 session_token，否则返回 None
+        """
+        # 查询用户
+        user = await self.async_db.get_records('users', {'username': username})
+        if not user:
+            # 用户名不存在时也做一次同样成本的密码验证（同样受进程池排队上限限制）
+            await self.hasher.dummy_check_async(password)
+            logger.debug("用户名或密码错误: %s", username)
+            return None
+
+        user = user[0]
+
+        # 验证密码（在密码进程池中执行，队列已满时抛出 PasswordHasherBusy）
+        if not await self.hasher.check_async(password, user['password']):
+            logger.debug("用户名或密码错误: %s", username)
+            return None
+
+        # 成本因子变化时透明地重新加密；密码进程池繁忙时跳过，下次登录再处理
+        if self.hasher.needs_rehash(user['password']):
+            try:
+                hashed_password = await self.hasher.hash_async(password)
+                await self.async_db.update_record('users', {'password': hashed_password.decode('utf-8')}, 'id', user['id'])
+                self.session_cache.invalidate_user(user['id'])
+                logger.info("用户 %s 的密码哈希已按新的成本因子更新", user['id'])
+            except PasswordHasherBusy:
+                pass
+
+        # 创建会话（在数据库线程中执行）
+        session_token = await self.async_db.run(self._open_session, user['id'], device, ip)
+        logger.debug("用户登录成功: %s", username)
+        return session_token
+
+    async def logout_async(self, session_token):
+        """
+        异步用户注销。
+        :param session_token: 用户的 session_token
+        :return: 注销成功返回 True，否则返回 False
+        """
+        return await self.async_db.run(self.logout, session_token)
+
+    async def is_logged_in_async(self, session_token):
+        """
+        异步检查用户是否已登录。
+        :param session_token: 用户的 session_token
+        :return: 如果用户已登录返回 True，否则返回 False
+        """
+        return await self.async_db.run(self.is_logged_in, session_token)
+
+    async def get_user_by_token_async(self, session_token):
+        """
+        异步根据 session_token 获取用户信息。
+        :param session_token: 用户的 session_token
+        :return: 用户信息（字典形式），如果未找到返回 None
+        """
+        # 缓存命中时直接返回，不切换到数据库线程
+        user = self.session_cache.get(session_token)
+        if user is not None:
+            return user
+        return await self.async_db.run(self._load_user_by_token, session_token)
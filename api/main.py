@@ -1,13 +1,39 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from datetime import datetime, timedelta, timezone
+import anyio
 import jwt
-from typing import Optional
+from typing import Any, List, Optional
+import hashlib
+import logging
+import os
+import time
+import uuid
 
 from db.DBHelper import DBHelper
+from db.AsyncDBHelper import AsyncDBHelper
 from func.User import User
+from func.Annotation import Annotation
+from func.Export import FORMATS as EXPORT_FORMATS, DatasetExporter
+from func.Ingest import DatasetIngest, IngestJob
+from func.ImageStore import ImageStore, cache_headers, is_not_modified
+from func.LoginThrottle import LoginThrottle
+from func.Prefetch import Prefetcher
+from func.PasswordHasher import PasswordHasher, PasswordHasherBusy
+from func.SessionCache import SessionCache
+from func.SessionStore import LastLoginWriter, create_session_store
+from func.Settings import CONFIG_FILE, load_settings
+from func.Logger import request_id_var, setup_logging
+from func.Metrics import CONTENT_TYPE, RequestMetrics, render_metrics
+from func.Profiling import RequestProfiler, RequestTimings, request_timings_var, timed
+
+# 先配置日志（后台线程异步写出），再初始化其他模块
+log_listener = setup_logging(load_settings('logging'))
+logger = logging.getLogger(__name__)
 
 from func.Secret_manage import secret_manager
 
@@ -22,13 +48,117 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有 HTTP 头
 )
 
+# 按路由统计请求次数和延迟，由 /metrics 输出
+request_metrics = RequestMetrics()
+# 按需分析单个请求，由配置节 profiling 启用，并且请求头需携带配置的令牌
+request_profiler = RequestProfiler.from_settings(load_settings('profiling'))
+
+async def profile_request(request: Request, call_next):
+    """
+    分析单个请求：在响应头 Server-Timing 中返回数据库、密码计算和 JWT 的耗时，
+    并把 cProfile 结果保存到分析目录，文件名通过响应头 X-Profile-Id 返回。
+    :param request: 请求对象
+    :param call_next: 下一个处理函数
+    :return: 响应
+    """
+    timings = RequestTimings()
+    timings_token = request_timings_var.set(timings)
+    profile = request_profiler.start()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if profile is not None:
+            request_profiler.stop(profile)
+        request_timings_var.reset(timings_token)
+    response.headers["Server-Timing"] = timings.server_timing(time.perf_counter() - start)
+    if profile is not None:
+        profile_id = request_profiler.save(profile, request.method, request.url.path, request_id_var.get())
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+    return response
+
+# 为每个请求设置关联 ID，写入该请求产生的所有日志，并通过响应头返回；同时记录请求延迟。
+# 带有效分析令牌的请求交给 profile_request，其他请求只多一次判断，不增加中间件层
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    context_token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        if request_profiler.should_profile(request.headers):
+            response = await profile_request(request, call_next)
+        else:
+            response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        request_id_var.reset(context_token)
+        route = request.scope.get("route")
+        request_metrics.observe(request.method, route.path if route else "unmatched",
+                                status_code, time.perf_counter() - start)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # 初始化数据库和用户管理
-db_helper = DBHelper()
-user_manager = User(db_helper)
+db_helper = DBHelper(CONFIG_FILE)
+# 有未执行的结构迁移时拒绝启动
+db_helper.check_schema()
+# 异步路由通过有界线程池访问数据库，避免阻塞事件循环
+async_db_helper = AsyncDBHelper(db_helper)
+# 密码计算在独立进程池中执行，成本因子和排队上限见配置节 password_hashing
+password_hasher = PasswordHasher.from_settings(load_settings('password_hashing'))
+# 会话缓存：大多数请求的 Token 验证不再访问 MySQL，见配置节 session_cache
+session_cache_settings = load_settings('session_cache')
+session_cache = SessionCache(
+    max_size=session_cache_settings.get('max_size', 10000),
+    ttl=session_cache_settings.get('ttl_seconds', 30),
+)
+# 会话存储（sessions 表或进程内存储）、过期会话的后台清理和 last_login 的延迟写入，见配置节 sessions
+session_settings = load_settings('sessions')
+session_store = create_session_store(db_helper, session_settings)
+session_store.start()
+last_login_writer = LastLoginWriter(db_helper, flush_interval=session_settings.get('last_login_flush_seconds', 10))
+last_login_writer.start()
+user_manager = User(db_helper, async_db_helper, password_hasher, session_cache, session_store, last_login_writer)
+# 登录限流：按用户名和客户端 IP 限制登录尝试次数，被限流的请求不进入密码验证，见配置节 login_throttle
+login_throttle_settings = load_settings('login_throttle')
+login_throttle = LoginThrottle.from_settings(login_throttle_settings)
+# 只有部署在可信的反向代理之后时才使用 X-Forwarded-For 中的客户端地址
+TRUST_FORWARDED_FOR = login_throttle_settings.get('trust_forwarded_for', False)
+# 密码计算队列已满时建议客户端等待的秒数
+LOGIN_RETRY_AFTER = login_throttle_settings.get('retry_after_seconds', 1)
+
+# 标注数据领取，租约时长和单次领取上限见配置节 annotations
+annotation_settings = load_settings('annotations')
+annotation_manager = Annotation(
+    db_helper,
+    async_db_helper,
+    lease_seconds=annotation_settings.get('lease_seconds', 600),
+    max_claim=annotation_settings.get('max_claim', 100),
+    lookahead=annotation_settings.get('lookahead', 5),
+)
+
+# 数据集导出，每批读取行数和压缩级别见配置节 export
+dataset_exporter = DatasetExporter.from_settings(db_helper, load_settings('export'))
+
+# 数据集导入，只允许导入 ingest.root 下的目录或清单，同一时间只运行一个导入任务
+ingest_settings = load_settings('ingest')
+dataset_ingest = DatasetIngest.from_settings(db_helper, ingest_settings)
+ingest_job = None
+
+# 图片和缩略图缓存，图片根目录、缓存上限和缩略图尺寸见配置节 images
+image_settings = load_settings('images')
+image_store = ImageStore.from_settings(image_settings)
+if not image_store.enabled:
+    logger.error("未安装 Pillow，无法生成缩略图，带 size 参数的图片请求将返回 501（pip install -r requirements.txt）")
+IMAGE_CACHE_MAX_AGE = image_settings.get('cache_max_age', 7 * 24 * 60 * 60)
+# 领取数据后在后台预热标注员接下来要打开的图片，线程数和缩略图尺寸见配置节 prefetch
+prefetcher = Prefetcher.from_settings(image_store, load_settings('prefetch'))
 
 # JWT 配置
 ALGORITHM = "HS256"  # JWT 签名算法
-ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Token 过期时间（分钟）
+ACCESS_TOKEN_EXPIRE_MINUTES = load_settings('jwt').get('access_token_expire_minutes', 30)  # Token 过期时间（分钟）
 
 # OAuth2 密码模式，用于验证 Token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -45,22 +175,79 @@ class Token(BaseModel):
     access_token: str  # JWT Token
     token_type: str  # Token 类型（通常是 "bearer"）
 
+# Pydantic 模型：定义领取标注数据的请求结构
+class ClaimRequest(BaseModel):
+    count: int = 10  # 领取条数
+    task_id: Optional[int] = None  # 指定任务 ID，默认为当前用户第一个未完成的任务
+
+# Pydantic 模型：定义数据集导入的请求结构
+class IngestRequest(BaseModel):
+    directory: Optional[str] = None  # 图片目录（相对于 ingest.root）
+    manifest: Optional[str] = None  # 清单文件（相对于 ingest.root），与 directory 二选一
+    task_id: Optional[int] = None  # 追加到已有任务（必须属于所属用户），默认新建任务
+    user_id: Optional[int] = None  # 任务的所属用户，默认为当前用户；其他用户需开启 ingest.allow_other_users
+
+# Pydantic 模型：定义单条标注结果的结构
+class AnnotationResult(BaseModel):
+    id: int  # 标注数据 ID
+    annotation: Any  # 标注内容，非字符串会序列化为 JSON
+
+# Pydantic 模型：定义批量提交标注结果的请求结构
+class SubmitRequest(BaseModel):
+    results: List[AnnotationResult]  # 标注结果列表
+    task_id: Optional[int] = None  # 指定任务 ID，默认为当前用户第一个未完成的任务
+
+def client_address(request: Request):
+    """
+    获取客户端 IP，配置 trust_forwarded_for 时取 X-Forwarded-For 的第一个地址。
+    :param request: 请求对象
+    :return: 客户端 IP
+    """
+    if TRUST_FORWARDED_FOR:
+        forwarded_for = request.headers.get('x-forwarded-for')
+        if forwarded_for:
+            return forwarded_for.split(',')[0].strip()
+    return request.client.host if request.client else ''
+
 # 登录接口
 @app.post("/login", response_model=Token)
-async def login(login_data: LoginRequest):
+async def login(login_data: LoginRequest, request: Request):
     """
     用户登录接口。
     :param login_data: 包含用户名和密码的请求体
+    :param request: 请求对象，用于获取客户端 IP
     :return: 返回 JWT Token
     """
-    # 调用 User 类的登录方法
-    session_token = user_manager.login(login_data.username, login_data.password)
+    # 先按用户名和 IP 限流，被限流的请求不进入密码验证
+    retry_after = login_throttle.acquire(login_data.username, client_address(request))
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="登录尝试过于频繁，请稍后重试",
+            headers={"Retry-After": str(retry_after)},
+        )
+    # 登录会写入 session_token，随后的请求需要从主库读到它（读己之写）
+    db_helper.set_session(login_data.username)
+    # 调用 User 类的异步登录方法
+    try:
+        session_token = await user_manager.login_async(
+            login_data.username, login_data.password,
+            device=request.headers.get("User-Agent"), ip=client_address(request),
+        )
+    except PasswordHasherBusy:
+        # 密码计算队列已满，快速失败，让客户端稍后重试
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="登录请求过多，请稍后重试",
+            headers={"Retry-After": str(LOGIN_RETRY_AFTER)},
+        )
     if not session_token:
         # 如果登录失败，返回 401 错误
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
         )
+    login_throttle.succeeded(login_data.username)
 
     # 生成 JWT Token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -86,11 +273,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)  # 默认 15 分钟过期
     to_encode.update({"exp": expire})  # 添加过期时间到 payload
-    encoded_jwt = jwt.encode(to_encode, secret_manager.get_secret_key(), algorithm=ALGORITHM)  # 使用 SecretManager 的 SECRET_KEY
+    # 使用密钥环中最新的密钥签名，并在头部写入 kid 供验证时查找密钥
+    kid, secret_key = secret_manager.get_signing_key()
+    with timed('jwt'):
+        encoded_jwt = jwt.encode(to_encode, secret_key, algorithm=ALGORITHM, headers={"kid": kid})
     return encoded_jwt
 
 # 验证 JWT Token
-def verify_token(token: str = Depends(oauth2_scheme)):
+async def verify_token(token: str = Depends(oauth2_scheme)):
     """
     验证 JWT Token 是否有效。
     :param token: 从请求头中提取的 Token
@@ -102,8 +292,13 @@ def verify_token(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        # 解码 Token
-        payload = jwt.decode(token, secret_manager.get_secret_key(), algorithms=[ALGORITHM])
+        with timed('jwt'):
+            # 根据头部的 kid 找到签发该 Token 的密钥（轮换前的旧密钥在 Token 过期前仍然有效）
+            secret_key = secret_manager.get_verification_key(jwt.get_unverified_header(token).get("kid"))
+            if secret_key is None:
+                raise credentials_exception
+            # 解码 Token
+            payload = jwt.decode(token, secret_key, algorithms=[ALGORITHM])
         username: str = payload.get("sub")  # 获取用户名
         session_token: str = payload.get("session_token")  # 获取 session_token
         if username is None or session_token is None:
@@ -113,8 +308,10 @@ def verify_token(token: str = Depends(oauth2_scheme)):
         # 如果 Token 解码失败，抛出错误
         raise credentials_exception
 
+    # 同一用户写入后的短时间内只读主库，避免读到副本上的旧数据
+    db_helper.set_session(username)
     # 检查 session_token 是否有效
-    user = user_manager.get_user_by_token(session_token)
+    user = await user_manager.get_user_by_token_async(session_token)
     if not user:
         # 如果 session_token 无效，抛出错误
         raise credentials_exception
@@ -128,9 +325,269 @@ async def dashboard(current_user: dict = Depends(verify_token)):
     """
     受保护的路由，只有登录用户才能访问。
     :param current_user: 通过 verify_token 验证的用户信息
-    :return: 返回欢迎信息
+    :return: 返回欢迎信息和任务进度
+    """
+    # 任务进度直接读取 task 表中递增维护的计数
+    tasks = await annotation_manager.get_progress_async(current_user['id'])
+    return {"message": f"欢迎回来, {current_user['username']}!", "tasks": tasks}
+
+# 领取标注数据接口
+@app.post("/annotations/claim")
+async def claim_annotations(claim_data: ClaimRequest, current_user: dict = Depends(verify_token)):
+    """
+    为当前用户领取接下来的一批未标注数据。多个标注员同时领取时不会拿到同一条数据。
+    :param claim_data: 领取条数和可选的任务 ID
+    :param current_user: 通过 verify_token 验证的用户信息
+    :return: 任务 ID、租约到期时间、领取到的数据列表和预读窗口中的图片名称
+    """
+    result = await annotation_manager.claim_async(current_user['id'], claim_data.count, claim_data.task_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="没有未完成的任务",
+        )
+    # 按标注顺序预热：先是刚领取的数据，然后是预读窗口
+    prefetcher.warm(current_user['id'], [item['image_name'] for item in result['items']] + result['prefetch'])
+    return result
+
+# 列出标注数据接口
+@app.get("/annotations")
+async def list_annotations(
+    task_id: Optional[int] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    start_after: Optional[int] = None,
+    limit: int = 100,
+    include_annotation: bool = False,
+    current_user: dict = Depends(verify_token),
+):
+    """
+    按 id 分页列出当前用户任务中的标注数据，默认不返回标注内容。
+    :param task_id: 任务 ID（可选），默认为当前用户第一个未完成的任务
+    :param status_filter: 只列出该状态的数据（'未标注' 或 '已标注'）
+    :param start_after: 上一页返回的 next_start_after
+    :param limit: 每页条数
+    :param include_annotation: 为 true 时同时返回标注内容
+    :param current_user: 通过 verify_token 验证的用户信息
+    :return: 任务 ID、数据列表和下一页的 start_after
+    """
+    if status_filter not in (None, '未标注', '已标注'):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="status 只能是 '未标注' 或 '已标注'")
+    result = await annotation_manager.list_items_async(
+        current_user['id'], task_id, status_filter, start_after, limit, include_annotation)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="没有未完成的任务",
+        )
+    return result
+
+# 批量提交标注结果接口
+@app.post("/annotations/submit")
+async def submit_annotations(submit_data: SubmitRequest, current_user: dict = Depends(verify_token)):
+    """
+    批量提交当前用户领取的标注数据的结果，并更新任务进度。
+    :param submit_data: 标注结果列表和可选的任务 ID
+    :param current_user: 通过 verify_token 验证的用户信息
+    :return: 本次实际写入的条数和任务最新进度
+    """
+    results = [result.model_dump() for result in submit_data.results]
+    result = await annotation_manager.submit_async(current_user['id'], results, submit_data.task_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="没有未完成的任务",
+        )
+    return result
+
+# 数据集导出接口
+@app.get("/export")
+async def export_dataset(
+    export_format: str = Query("jsonl", alias="format"),
+    task_id: Optional[int] = None,
+    start_after: Optional[int] = None,
+    gzip: bool = False,
+    include_unlabeled: bool = False,
+    current_user: dict = Depends(verify_token),
+):
+    """
+    流式导出标注数据（JSONL 或 COCO JSON），可选 gzip 压缩。数据边读边发送，内存占用与数据集大小无关。
+    导出中断时，以已收到的最后一条数据的 id 作为 start_after 重新请求即可续传。
+    只能导出当前用户自己的任务；导出整个数据集请在 api 目录下执行 python -m func.Export。
+    :param export_format: 导出格式，'jsonl' 或 'coco'
+    :param task_id: 只导出该任务的数据（可选），默认导出当前用户的全部任务
+    :param start_after: 只导出 id 大于该值的数据
+    :param gzip: 是否 gzip 压缩
+    :param include_unlabeled: 是否同时导出未标注的数据
+    :param current_user: 通过 verify_token 验证的用户信息
+    :return: 流式响应
     """
-    return {"message": f"欢迎回来, {current_user['username']}!"}
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的导出格式: {export_format}",
+        )
+    if task_id is not None:
+        task = await async_db_helper.fetch_one("SELECT user_id FROM task WHERE id = %s", (task_id,))
+        if not task:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+        if task['user_id'] != current_user['id']:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="不能导出其他用户的任务")
+    chunks = dataset_exporter.export(export_format, task_id, start_after, gzip, include_unlabeled,
+                                     user_id=current_user['id'])
+
+    async def stream():
+        # 每次在数据库线程池中取下一块，不阻塞事件循环，也遵守数据库线程数的限制
+        try:
+            while True:
+                chunk = await async_db_helper.run(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            # 客户端断开或响应被取消时立即关闭生成器，释放压缩器和数据库游标，不等待垃圾回收；
+            # 屏蔽取消，保证关闭操作执行完
+            with anyio.CancelScope(shield=True):
+                await async_db_helper.run(chunks.close)
+
+    extension = 'jsonl' if export_format == 'jsonl' else 'json'
+    filename = f"dataset{f'-task{task_id}' if task_id is not None else ''}.{extension}{'.gz' if gzip else ''}"
+    media_type = 'application/gzip' if gzip else ('application/x-ndjson' if export_format == 'jsonl' else 'application/json')
+    return StreamingResponse(stream(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# 数据集导入接口
+@app.post("/ingest", status_code=status.HTTP_202_ACCEPTED)
+async def start_ingest(ingest_data: IngestRequest, current_user: dict = Depends(verify_token)):
+    """
+    在后台导入图片目录或清单。数据源、任务和所属用户的每个组合有固定的检查点文件，服务重启后重新提交即可继续。
+    :param ingest_data: 数据源、任务 ID 和所属用户
+    :param current_user: 通过 verify_token 验证的用户信息
+    :return: 导入任务的当前状态
+    """
+    global ingest_job
+    user_id = ingest_data.user_id if ingest_data.user_id is not None else current_user['id']
+    if user_id != current_user['id'] and not ingest_settings.get('allow_other_users', False):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="不能为其他用户导入数据")
+    if ingest_data.task_id is not None:
+        task = await async_db_helper.fetch_one("SELECT user_id FROM task WHERE id = %s", (ingest_data.task_id,))
+        if not task:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+        if task['user_id'] != user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="任务不属于指定的用户")
+    if ingest_job is not None and ingest_job.is_running():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="已有导入任务正在运行")
+    relative = ingest_data.directory if ingest_data.directory is not None else ingest_data.manifest
+    if relative is None or (ingest_data.directory is not None and ingest_data.manifest is not None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="必须且只能指定 directory 或 manifest 之一")
+    root = os.path.realpath(ingest_settings.get('root', 'data'))
+    source = os.path.realpath(os.path.join(root, relative))
+    if os.path.commonpath([root, source]) != root or not os.path.exists(source):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="数据源不存在或不在允许的目录中")
+
+    checkpoint_dir = ingest_settings.get('checkpoint_dir', 'db/ingest_checkpoints')
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    # 检查点按数据源、任务和所属用户区分，不同用户导入同一目录时互不影响
+    checkpoint_key = f"{source}\0{ingest_data.task_id}\0{user_id}"
+    checkpoint_file = os.path.join(checkpoint_dir, hashlib.sha1(checkpoint_key.encode('utf-8')).hexdigest() + '.json')
+    ingest_job = IngestJob(
+        dataset_ingest,
+        directory=source if ingest_data.directory is not None else None,
+        manifest=source if ingest_data.manifest is not None else None,
+        task_id=ingest_data.task_id,
+        user_id=user_id,
+        checkpoint_file=checkpoint_file,
+    )
+    return ingest_job.state
+
+# 查询数据集导入进度接口
+@app.get("/ingest")
+async def ingest_status(current_user: dict = Depends(verify_token)):
+    """
+    查询最近一次导入任务的进度。
+    :param current_user: 通过 verify_token 验证的用户信息
+    :return: 已处理、已写入、重复和出错的文件数等
+    """
+    if ingest_job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="没有导入任务")
+    return ingest_job.state
+
+# 图片接口
+@app.get("/images/{image_name:path}")
+async def get_image(image_name: str, request: Request, size: Optional[int] = None,
+                    current_user: dict = Depends(verify_token)):
+    """
+    返回图片文件或缩略图，支持 ETag/Last-Modified 条件请求（304）和 Range 请求。
+    缩略图由后台进程生成，尚未生成时先返回原图（不缓存），下次请求即可得到缩略图。
+    :param image_name: 图片名称（annotations.image_name）
+    :param size: 缩略图尺寸（可选），必须是配置的 thumbnail_sizes 之一
+    :param current_user: 通过 verify_token 验证的用户信息
+    :return: 文件响应
+    """
+    if size is not None and size not in image_store.thumbnail_sizes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的缩略图尺寸，可选: {list(image_store.thumbnail_sizes)}",
+        )
+    if size is not None and not image_store.enabled:
+        # 不返回原图代替缩略图，避免列表页每次都下载不可缓存的原图
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="服务器未安装 Pillow，不支持缩略图")
+    # 路径解析和 stat 都是阻塞的文件系统调用，放到线程池中执行
+    located = await run_in_threadpool(locate_image, image_name, size)
+    if located is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+    path, stat, max_age = located
+    prefetcher.record_request(current_user['id'], image_name)
+
+    headers = cache_headers(stat, max_age)
+    if is_not_modified(request.headers, headers['ETag'], stat.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # FileResponse 负责 Range/If-Range；服务器支持 pathsend 扩展时由服务器直接发送文件
+    return FileResponse(path, headers=headers, stat_result=stat)
+
+def locate_image(image_name, size):
+    """
+    查找要返回的文件（在线程池中执行）。
+    :param image_name: 图片名称
+    :param size: 缩略图尺寸（可选）
+    :return: (文件路径, stat 结果, 缓存时长)，图片不存在时返回 None
+    """
+    max_age = IMAGE_CACHE_MAX_AGE
+    path = image_store.get_thumbnail(image_name, size) if size is not None else None
+    if path is None:
+        path = image_store.resolve(image_name)
+        if path is None:
+            return None
+        if size is not None:
+            # 缩略图还在生成，原图不能被缓存为缩略图
+            max_age = 0
+    return path, os.stat(path), max_age
+
+# 监控指标接口（Prometheus 文本格式）
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    输出各路由的请求延迟、数据库查询耗时、连接池、会话缓存和密码进程池的统计信息。
+    :return: Prometheus 文本格式的指标
+    """
+    return PlainTextResponse(
+        render_metrics(request_metrics, db_helper, session_cache, password_hasher, image_store, prefetcher,
+                       login_throttle, session_store, last_login_writer),
+        media_type=CONTENT_TYPE,
+    )
+
+# 关闭应用时释放数据库线程池和连接
+@app.on_event("shutdown")
+def shutdown():
+    session_store.close()
+    # 写入尚未写入的 last_login 后再关闭数据库线程池和连接
+    last_login_writer.close()
+    async_db_helper.close()
+    password_hasher.close()
+    prefetcher.close()
+    image_store.close()
+    secret_manager.stop()
+    log_listener.stop()
+    db_helper.disconnect()
 
 # 启动 FastAPI 服务
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与 main.py 一样以 api 目录为根导入 db.X、func.X
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
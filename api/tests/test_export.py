@@ -0,0 +1,35 @@
+import json
+
+from db.AnnotationCodec import encode
+from func.Export import DatasetExporter
+
+
+class FakeDB:
+    def __init__(self, rows):
+        """
+        只实现 iter_records 的数据库替身。
+        :param rows: [(id, image_name, 标注内容), ...]
+        """
+        self.rows = rows
+
+    def iter_records(self, table_name, conditions, columns, **options):
+        for annotation_id, image_name, annotation in self.rows:
+            values = {'image_name': image_name, 'annotation': encode(json.dumps(annotation))}
+            yield (annotation_id, *(values[column] for column in columns))
+
+
+def export_coco(rows):
+    return json.loads(b''.join(DatasetExporter(FakeDB(rows)).export('coco')))
+
+
+def test_coco_ids_are_not_overridden_by_annotation_keys():
+    coco = export_coco([
+        (10, 'a.jpg', [{'id': 7, 'image_id': 99, 'label': 'cat'}, {'id': 7, 'label': 'dog'}]),
+        (11, 'b.jpg', [{'id': 7, 'label': 'cat'}]),
+    ])
+    annotations = coco['annotations']
+    assert [annotation['id'] for annotation in annotations] == [1, 2, 3]
+    assert [annotation['image_id'] for annotation in annotations] == [10, 10, 11]
+    image_ids = {image['id'] for image in coco['images']}
+    assert all(annotation['image_id'] in image_ids for annotation in annotations)
+    assert {category['name'] for category in coco['categories']} == {'cat', 'dog'}